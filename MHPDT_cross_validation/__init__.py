@@ -1,17 +1,149 @@
+import gzip
 import logging
 import azure.functions as func
 import json
 import os
 import sys
+import zlib
 
 dir_path = os.path.dirname(os.path.realpath(__file__))
 sys.path.insert(0, dir_path)
 
-import numpy as np
 import utils
-import micro_filter
-import hmm_tagging
-import mhpdt_cross_validation as mhpdt_cv
+import calibration
+import instrumentation
+import jobs
+import batch
+
+def _request_body(req: func.HttpRequest) -> bytes:
+    """
+    Returns the request body, gzip decompressed when sent with 'Content-Encoding: gzip'.
+    Raises ValueError if the body is not valid gzip data.
+    """
+
+    body = req.get_body()
+    if req.headers.get("Content-Encoding", "").strip().lower() == "gzip":
+        try:
+            body = gzip.decompress(body)
+        except (OSError, EOFError, zlib.error) as e:
+            raise ValueError(f"invalid gzip request body: {e}")
+    return body
+
+def _load_calibration_request(req: func.HttpRequest, timer: instrumentation.StageTimer):
+    """
+    Returns the basic accelerations DataFrame and the calibration options of a calibration request,
+    or the 400 response to send back if the request is invalid. timer records the json_parse and
+    dataframe_build stages.
+    """
+
+    content_type = req.headers.get("Content-Type", "application/json").split(";")[0].strip()
+    if content_type == utils.ARROW_STREAM_CONTENT_TYPE:
+        # calibration data as Arrow IPC stream, options as query parameters:
+        req_body = dict(req.params)
+        try:
+            with timer.stage("dataframe_build"):
+                df = utils.generate_basic_df_from_arrow(_request_body(req))
+        except (OSError, ValueError, KeyError):
+            logging.info("unable to load arrow stream")
+            return None, None, func.HttpResponse("Bad input", status_code=400)
+        if df.empty:
+            return None, None, func.HttpResponse("downTimeCalibrationData missing from Arrow stream.", status_code=400)
+    else:
+        try:
+            with timer.stage("json_parse"):
+                req_body = json.loads(_request_body(req))
+        except (OSError, ValueError):
+            logging.info("unable to load json")
+            return None, None, func.HttpResponse("Bad input", status_code=400)
+
+        calibration_data = req_body.get("downTimeCalibrationData")
+        if not calibration_data:
+            return None, None, func.HttpResponse("downTimeCalibrationData missing from JSON body.", status_code=400)
+
+        logging.info("downTimeCalibrationData successfully loaded, converting json to dataframe.")
+        with timer.stage("dataframe_build"):
+            df = utils.generate_basic_df(calibration_data)
+
+    try:
+        options = calibration.calibration_options(req_body)
+    except calibration.CalibrationError as e:
+        return None, None, func.HttpResponse(str(e), status_code=400)
+
+    return df, options, None
+
+CACHE_HEADER = "X-Calibration-Cache"
+
+def _json_response(body, status_code=200, headers=None) -> func.HttpResponse:
+    return func.HttpResponse(body=json.dumps(body), mimetype="application/json", status_code=status_code, headers=headers)
+
+def _cache_headers(cache_hit: bool):
+    return {CACHE_HEADER: "hit" if cache_hit else "miss"}
+
+def _job_status(job):
+    return {key: job.get(key) for key in ("job_id", "status", "stage", "progress", "error")}
+
+def _job_action(action: str, req: func.HttpRequest) -> func.HttpResponse:
+
+    if action == "submit":
+        timer = instrumentation.StageTimer()
+        df, options, error_response = _load_calibration_request(req, timer)
+        if error_response:
+            return error_response
+        job = jobs.store.submit(df, options, timer=timer)
+        logging.info(f"Calibration job {job['job_id']} submitted.")
+        return _json_response(_job_status(job), status_code=202)
+
+    job_id = req.params.get("job_id")
+    if not job_id:
+        return func.HttpResponse("job_id query parameter missing.", status_code=400)
+
+    if action == "cancel":
+        job = jobs.store.cancel(job_id)
+    else:
+        job = jobs.store.get(job_id)
+    if job is None:
+        return func.HttpResponse(f"Unknown calibration job '{job_id}'.", status_code=404)
+
+    if action == "result":
+        if job["status"] == jobs.SUCCEEDED:
+            # batch jobs report the cache use per calibration
+            headers = _cache_headers(job["cache_hit"]) if job.get("cache_hit") is not None else None
+            return _json_response(job["result"], headers=headers)
+        if job["status"] == jobs.FAILED:
+            return func.HttpResponse(job["error"], status_code=job["status_code"])
+        if job["status"] == jobs.CANCELLED:
+            return func.HttpResponse(f"Calibration job '{job_id}' was cancelled.", status_code=410)
+        return _json_response(_job_status(job), status_code=202)
+
+    return _json_response(_job_status(job))
+
+def _batch_action(req: func.HttpRequest) -> func.HttpResponse:
+
+    try:
+        req_body = json.loads(_request_body(req))
+    except (OSError, ValueError):
+        logging.info("unable to load json")
+        return func.HttpResponse("Bad input", status_code=400)
+
+    items = req_body.get("calibrations") if isinstance(req_body, dict) else None
+    if not items or not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        return func.HttpResponse("calibrations list missing from JSON body.", status_code=400)
+
+    for position, item in enumerate(items):
+        item.setdefault("name", str(position))
+        if not item.get("downTimeCalibrationData"):
+            return func.HttpResponse(f"downTimeCalibrationData missing from calibration '{item['name']}'.", status_code=400)
+    if len(items) > batch.batch_max_items():
+        return func.HttpResponse(f"A batch holds at most {batch.batch_max_items()} calibrations, got {len(items)}.", status_code=413)
+    names = [item["name"] for item in items]
+    if len(set(names)) < len(names):
+        return func.HttpResponse("calibration names must be unique.", status_code=400)
+
+    shared_options = {key: value for key, value in req_body.items() if key != "calibrations"}
+    job = jobs.store.submit_batch(items, shared_options)
+    logging.info(f"Calibration job {job['job_id']} submitted for a batch of {len(items)} sensors.")
+
+    return _json_response(_job_status(job), status_code=202)
 
 def main(req: func.HttpRequest) -> func.HttpResponse:
     
@@ -23,60 +155,84 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
         curl --request POST 'http://localhost:7071/api/MHPDT_cross_validation' --header 'Content-Type: application/json' --data @mhpdt_calibration_data.json
     on windows (powershell): 
         curl.exe --request POST 'http://localhost:7071/api/MHPDT_cross_validation' --header 'Content-Type: application/json' --data '@mhpdt_calibration_data.json'
+
+    Optional JSON body attributes:
+        method                  'bayesian' (default, gp_minimize) or 'grid' (exhaustive grid search)
+        grid_threshold_step     mhp threshold step of the grid search, default 0.05
+        return_score_surface    include the grid search score surface in the response, default false
+        use_cache               serve the result of an identical earlier calibration (same samples, mhp window size and
+                                options) from the result cache, default true. false recomputes and refreshes the entry.
+                                Responses carry an 'X-Calibration-Cache: hit' or 'miss' header
+        hmm_warm_start          fit the tagging HMM on the mhp sequence averaged over hmm_decimation samples first and
+                                start EM on the full sequence from that fit, default false (cold k-means initialisation)
+        hmm_decimation          samples averaged per observation of the warm start pre-fit, default 10
+        hmm_params              hmm_params of an earlier calibration of the same machine to start EM from
+                                (JSON string in query parameters), takes precedence over hmm_warm_start
+        hmm_report_agreement    also fit the HMM cold and report the fraction of equal tags as
+                                hmm_tagging.agreement_with_cold_fit, default false
+        return_timings          include the per stage timings of the request as timings, default false: samples,
+                                stages (json_parse, dataframe_build, cache_lookup, features, hmm_fit, hmm_decode,
+                                optimization, optimizer_call per optimizer step, scoring) with wall_seconds,
+                                cpu_seconds, peak_rss_bytes and rss_growth_bytes, and the request totals
+
+    Bayesian optimization candidates are scored in MHPDT_OPTIMIZER_WORKERS worker processes, an environment
+    variable of the function app (default 1: serial gp_minimize).
+
+    Binary input: with 'Content-Type: application/vnd.apache.arrow.stream' the body is an Arrow IPC stream
+    (zstd/lz4 compressed buffers allowed) with a timestamp column (timestamp type or int64 nanoseconds) and
+    x, y, z columns instead of the downTimeCalibrationData JSON array, see utils.accelerations_to_arrow_stream.
+    The optional attributes above are then passed as query parameters, e.g. ?method=grid&return_score_surface=true
+    Request bodies of either format may be gzip compressed, sent with 'Content-Encoding: gzip'.
+
+    Asynchronous calibration jobs, for calibrations outlasting the HTTP timeouts:
+        POST .../api/MHPDT_cross_validation/submit              same body as above, responds 202 with the job_id
+        GET  .../api/MHPDT_cross_validation/status?job_id=<id>  status (queued, running, succeeded, failed, cancelled),
+                                                                stage and progress (completed / total optimizer steps)
+        GET  .../api/MHPDT_cross_validation/result?job_id=<id>  the calibration result once succeeded, 202 with the status before
+        POST .../api/MHPDT_cross_validation/cancel?job_id=<id>  cancels the job at its next progress step
+
+    Batch calibration of many sensors, as an asynchronous job:
+        POST .../api/MHPDT_cross_validation/batch  with the JSON body
+            {"calibrations": [{"name": "<sensor>", "downTimeCalibrationData": [...], <options>}, ...], <options>}
+        Top level options apply to every calibration, options of a calibration override them. A batch holds at most
+        MHPDT_BATCH_MAX_ITEMS calibrations (default 100). Responds 202 with the job_id, the status, result and cancel
+        requests above then report the calibrated sensors as progress. The sensors are calibrated concurrently in
+        MHPDT_BATCH_WORKERS worker processes (optimizer_workers is 1 per sensor).
+        The job result holds per sensor results in request order, each with name, status (succeeded or failed), result,
+        cache (hit or miss) and timings (parse, calibration and total seconds, samples and, with return_timings,
+        the stage timings as stages), or error and status_code,
+        and the number of succeeded and failed calibrations. Failed calibrations do not fail the batch.
+
+    Stage timings of the calibrations run by a function worker process, by stage and request size (samples,
+    power of ten upper bound), in the Prometheus text format:
+        GET  .../api/MHPDT_cross_validation/metrics
     """
     logging.info("MHPDT cross validation function is processing a request.")
 
-    result = None
+    action = req.route_params.get("action")
+    if action in ("submit", "status", "result", "cancel"):
+        return _job_action(action, req)
+    elif action == "batch":
+        return _batch_action(req)
+    elif action == "metrics":
+        return func.HttpResponse(instrumentation.metrics.exposition(), mimetype="text/plain")
+    elif action:
+        return func.HttpResponse(f"Unknown action '{action}'. action = 'submit', 'status', 'result', 'cancel', 'batch' or 'metrics'.", status_code=404)
 
-    try:
-        req_body = req.get_json()
-    except ValueError:
-        logging.info("unable to load json")
-        return func.HttpResponse("Bad input", status_code=400)
-    else:
-        calibration_data = req_body.get("downTimeCalibrationData")
-        if not calibration_data:
-            return func.HttpResponse("downTimeCalibrationData missing from JSON body.", status_code=400)
-        
-        logging.info("downTimeCalibrationData successfully loaded, converting json to dataframe.")
+    timer = instrumentation.StageTimer()
+    df, options, error_response = _load_calibration_request(req, timer)
+    if error_response:
+        return error_response
 
-        df = utils.generate_basic_df(calibration_data)
-        df = utils.add_features_to_df(df,mhp_window_size='6s')
-        df = utils.drop_transient_mhp_window_sized_data(df,mhp_window_size='6s')
-
-        logging.info("Running HMM based data tagging.")
-        tagged_states = hmm_tagging.generate_tagged_data(df)
-        
-        number_of_states = np.unique(tagged_states,return_counts=True)
-        logging.info(f'number of states: {number_of_states}')
-        if number_of_states[0].size < 2:
-            return func.HttpResponse("ERROR: Single state found. Unable to tag downTimeCalibrationData automatically.", status_code=400)
-
-        logging.info("Running optimization MHPDT cross validation.")
-        cv_result = mhpdt_cv.run_optimization(df, tagged_states)
-        
-        # preparing message: converting numpy data types to python datatypes for json 
-        result = {
-            "model_type": "MHPDT",
-            "model_params": {
-                "mhp_threshold": float(round(cv_result.x[0], 3)),
-                "min_cycle_time": 0,
-                "andon_uptime_threshold": 5,
-                "up_filter_size": int(cv_result.x[1]),
-                "down_filter_size": int(cv_result.x[2])
-            },
-        }
-
-        logging.info("Calculating calibration accuracy.")
-        calibration_score = mhpdt_cv.optimization_score(df, result, tagged_states)
-        logging.info(f"Calibration accuracy:{calibration_score}")
-        result["calibration_score"] = calibration_score
+    try:
+        result, cache_hit = calibration.run_cached_calibration(df, options, timer=timer)
+    except calibration.CalibrationError as e:
+        instrumentation.metrics.observe(timer.records, timer.samples)
+        instrumentation.metrics.observe_error(400, timer.samples)
+        return func.HttpResponse(str(e), status_code=400)
 
     if result:
-        body = json.dumps(result)
-        return func.HttpResponse(
-            body=body,
-            mimetype="application/json",
-        )
+        result = calibration.timed_result(result, options, timer)
+        return _json_response(result, headers=_cache_headers(cache_hit))
     else:
         return func.HttpResponse("No result from function", status_code=500)
@@ -0,0 +1,189 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, List, Optional
+import utils
+import calibration
+import instrumentation
+
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+# request attributes of a batch item that are not calibration options:
+ITEM_ATTRIBUTES = ('name', 'downTimeCalibrationData')
+
+
+def batch_workers() -> int:
+    """
+    Number of worker processes calibrating the sensors of a batch, set with the MHPDT_BATCH_WORKERS
+    environment variable. Defaults to the number of CPUs.
+    """
+    return int(os.environ.get('MHPDT_BATCH_WORKERS', os.cpu_count() or 1))
+
+
+def batch_max_items() -> int:
+    """
+    Maximum number of calibrations of a batch request, set with the MHPDT_BATCH_MAX_ITEMS environment
+    variable. Defaults to 100.
+    """
+    return int(os.environ.get('MHPDT_BATCH_MAX_ITEMS', 100))
+
+
+def _samples(calibration_data) -> int:
+    # request size of an item, also of malformed calibration data
+    return len(calibration_data) if isinstance(calibration_data, list) else 0
+
+
+def _calibrate_item(name: str, calibration_data: List[Dict], options: Dict) -> Dict:
+    # runs in a worker process, failures are reported per item instead of failing the batch. The stage
+    # timings of the worker process, failed items included, are added to the metrics of the function
+    # process by BatchCalibrator.run
+    start = time.perf_counter()
+    timer = instrumentation.StageTimer()
+    timer.samples = _samples(calibration_data)
+
+    def failed(error, status_code):
+        return {'name': name, 'status': FAILED, 'error': error, 'status_code': status_code,
+                'timings': {'samples': timer.samples, 'stages': timer.records}}
+
+    try:
+        with timer.stage('dataframe_build'):
+            df = utils.generate_basic_df(calibration_data)
+    except (AttributeError, KeyError, TypeError, ValueError) as e:
+        return failed(f'Bad input: {e}', 400)
+    parsed = time.perf_counter()
+
+    try:
+        result, cache_hit = calibration.run_cached_calibration(df, options, timer=timer)
+    except calibration.CalibrationError as e:
+        return failed(str(e), 400)
+    except Exception as e:
+        logging.exception(f"Calibration of {name} failed.")
+        return failed(str(e), 500)
+    finished = time.perf_counter()
+
+    return {
+        'name': name,
+        'status': SUCCEEDED,
+        'result': result,
+        'cache': 'hit' if cache_hit else 'miss',
+        'timings': {
+            'parse_seconds': parsed - start,
+            'calibration_seconds': finished - parsed,
+            'total_seconds': finished - start,
+            'samples': timer.samples,
+            'stages': timer.records,
+        },
+    }
+
+
+class BatchCalibrator:
+    """
+    Calibrates many sensors per request.
+
+    The sensors of a batch are calibrated concurrently in a process pool that is created on first use
+    and kept for later batches, so worker processes pay for their imports once. Every sensor is
+    calibrated serially within its worker (optimizer_workers = 1), the parallelism is across sensors.
+    A worker process dying takes the pool down: the affected sensors are reported as failed and the
+    pool is recreated for the next batch.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers or batch_workers())
+            return self._executor
+
+    def _reset_pool(self, executor: ProcessPoolExecutor) -> None:
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False)
+
+    def run(self, items: List[Dict], shared_options: Dict, progress: Optional[Callable[[int, int], None]] = None) -> Dict:
+        """
+
+        Parameters
+        ----------
+        items               batch items: name, downTimeCalibrationData and optional calibration options
+                            overriding shared_options
+        shared_options      calibration options (request attributes) of all items
+        progress            optional progress(completed, total) callback, called after every item. Raising
+                            calibration.CalibrationCancelled from it cancels the items not started yet
+
+        Returns             per item results (name, status, result or error and status_code, cache, timings
+        -------             with samples and, if return_timings is set, the stage timings as stages) in items
+                            order, the number of succeeded and failed items and the batch timings
+
+        """
+
+        start = time.perf_counter()
+        results = [None] * len(items)
+        return_timings = [False] * len(items)
+        futures = {}
+
+        executor = self._pool()
+        for position, item in enumerate(items):
+            name = item['name']
+            try:
+                item_options = {key: value for key, value in item.items() if key not in ITEM_ATTRIBUTES}
+                options = calibration.calibration_options({**shared_options, **item_options})
+            except calibration.CalibrationError as e:
+                results[position] = {'name': name, 'status': FAILED, 'error': str(e), 'status_code': 400}
+                continue
+            options['optimizer_workers'] = 1
+            return_timings[position] = options['return_timings']
+
+            try:
+                futures[position] = executor.submit(_calibrate_item, name, item['downTimeCalibrationData'], options)
+            except BrokenProcessPool:
+                # the pool broke since an earlier batch, once recreated it takes the remaining items
+                self._reset_pool(executor)
+                executor = self._pool()
+                futures[position] = executor.submit(_calibrate_item, name, item['downTimeCalibrationData'], options)
+
+        completed = len(items) - len(futures)
+        for position, future in futures.items():
+            try:
+                results[position] = future.result()
+            except BrokenProcessPool:
+                logging.exception(f"Calibration worker of {items[position]['name']} died.")
+                self._reset_pool(executor)
+                results[position] = {'name': items[position]['name'], 'status': FAILED,
+                                     'error': 'calibration worker process died', 'status_code': 500}
+            completed += 1
+            if progress is not None:
+                try:
+                    progress(completed, len(items))
+                except calibration.CalibrationCancelled:
+                    for pending in futures.values():
+                        pending.cancel()
+                    raise
+
+        for position, result in enumerate(results):
+            # items failing before or without reaching a worker have no timings
+            timings = result.get('timings', {'samples': _samples(items[position]['downTimeCalibrationData']), 'stages': []})
+            instrumentation.metrics.observe(timings['stages'], timings['samples'])
+            if result['status'] == FAILED:
+                instrumentation.metrics.observe_error(result['status_code'], timings['samples'])
+            if 'timings' in result and not return_timings[position]:
+                del result['timings']['stages']
+
+        succeeded = sum(result['status'] == SUCCEEDED for result in results)
+        return {
+            'results': results,
+            'succeeded': succeeded,
+            'failed': len(results) - succeeded,
+            'timings': {'total_seconds': time.perf_counter() - start},
+        }
+
+
+calibrator = BatchCalibrator()
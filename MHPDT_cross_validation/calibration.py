@@ -0,0 +1,268 @@
+import json
+import logging
+import numpy as np
+import pandas as pd
+from typing import Callable, Dict, Optional, Tuple
+import utils
+import instrumentation
+import hmm_tagging
+import mhpdt_cross_validation as mhpdt_cv
+import result_cache
+
+OPTIMIZATION_METHODS = ('bayesian', 'grid')
+# grid_threshold_step bounds: a step of at least 0.001 keeps the grid under 4000 thresholds, at most
+# 3.9 it still spans the [0.1, 4] mhp threshold range of the search space:
+MIN_GRID_THRESHOLD_STEP = 0.001
+MAX_GRID_THRESHOLD_STEP = 3.9
+MHP_WINDOW_SIZE = '6s'
+
+
+class CalibrationError(ValueError):
+    """
+    Calibration data that cannot be calibrated, reported to the caller as a 400 response.
+    """
+
+
+class CalibrationCancelled(Exception):
+    """
+    Raised by a progress callback to abort a running calibration.
+    """
+
+
+def _is_true(value) -> bool:
+    # JSON booleans or query parameter strings such as 'true' / '1'
+    if isinstance(value, str):
+        return value.strip().lower() in ('true', '1', 'yes')
+    return bool(value)
+
+
+# shapes of the hmm_params of the tagging HMM, 2 states and the mhp feature:
+HMM_PARAMS_SHAPES = {'startprob': (2,), 'transmat': (2, 2), 'means': (2, 1), 'covars': (2, 1)}
+
+
+def _hmm_params_option(value) -> Optional[Dict]:
+    # hmm_params of an earlier calibration, as JSON object or, in query parameters, JSON string
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = json.loads(value)
+    if not isinstance(value, dict) or set(value) != set(HMM_PARAMS_SHAPES):
+        raise ValueError('hmm_params must hold startprob, transmat, means and covars')
+
+    for key, shape in HMM_PARAMS_SHAPES.items():
+        array = np.asarray(value[key], dtype=np.float64)
+        if array.shape != shape:
+            raise ValueError(f'hmm_params {key} must have shape {list(shape)}, got {list(array.shape)}')
+        if not np.isfinite(array).all():
+            raise ValueError(f'hmm_params {key} must be finite')
+    # what hmmlearn checks before fitting:
+    if not np.allclose(np.sum(value['startprob']), 1) or not np.allclose(np.sum(value['transmat'], axis=1), 1):
+        raise ValueError('hmm_params startprob and transmat rows must sum to 1')
+    if not (np.asarray(value['covars'], dtype=np.float64) > 0).all():
+        raise ValueError('hmm_params covars must be positive')
+    return value
+
+
+def calibration_options(req_body: Dict) -> Dict:
+    """
+
+    Parameters
+    ----------
+    req_body        JSON body or query parameters of a calibration request
+
+    Returns         validated options of run_calibration: method, grid_threshold_step,
+    -------         return_score_surface, optimizer_workers, use_cache, hmm_warm_start,
+                    hmm_decimation, hmm_params, hmm_report_agreement and return_timings
+
+    """
+
+    method = req_body.get('method', 'bayesian')
+    if method not in OPTIMIZATION_METHODS:
+        raise CalibrationError(f"Unknown optimization method '{method}'. method = 'bayesian' or 'grid'.")
+
+    try:
+        options = {
+            'method': method,
+            'grid_threshold_step': float(req_body.get('grid_threshold_step', 0.05)),
+            'return_score_surface': _is_true(req_body.get('return_score_surface', False)),
+            # a server setting: the parallel optimization is no faster on the measured machines
+            'optimizer_workers': mhpdt_cv.optimizer_workers(),
+            'use_cache': _is_true(req_body.get('use_cache', True)),
+            'hmm_warm_start': _is_true(req_body.get('hmm_warm_start', False)),
+            'hmm_decimation': int(req_body.get('hmm_decimation', hmm_tagging.DEFAULT_DECIMATION)),
+            'hmm_params': _hmm_params_option(req_body.get('hmm_params')),
+            'hmm_report_agreement': _is_true(req_body.get('hmm_report_agreement', False)),
+            'return_timings': _is_true(req_body.get('return_timings', False)),
+        }
+    except (TypeError, ValueError) as e:
+        raise CalibrationError(f'Invalid calibration option: {e}')
+
+    if options['hmm_decimation'] < 1:
+        raise CalibrationError(f"Invalid calibration option: hmm_decimation must be at least 1, got {options['hmm_decimation']}")
+    # also false for nan:
+    if not MIN_GRID_THRESHOLD_STEP <= options['grid_threshold_step'] <= MAX_GRID_THRESHOLD_STEP:
+        raise CalibrationError(f"Invalid calibration option: grid_threshold_step must be between {MIN_GRID_THRESHOLD_STEP} and "
+                               f"{MAX_GRID_THRESHOLD_STEP}, got {options['grid_threshold_step']}")
+
+    return options
+
+
+def run_calibration(df: pd.DataFrame, options: Dict, progress: Optional[Callable[[str, int, int], None]] = None,
+                    timer: Optional[instrumentation.StageTimer] = None) -> Dict:
+    """
+    Tags the calibration data with the HMM and searches the MHPDT parameters reproducing the tags best.
+
+    Parameters
+    ----------
+    df          basic accelerations DataFrame (timestamp index, x, y, z columns)
+    options     calibration_options
+    progress    called as progress(stage, completed, total) when a stage starts and after every
+                optimizer step (objective evaluation, or mhp threshold for the grid search).
+                Raising CalibrationCancelled from it aborts the calibration
+    timer       optional StageTimer recording the features, hmm_fit, hmm_decode, optimization, every
+                optimizer step (optimizer_call) and scoring stages
+
+    Returns     calibration result: model_type, model_params, calibration_score, hmm_params (fitted HMM),
+    -------     hmm_tagging (initialisation, em_iterations and, if requested, agreement_with_cold_fit)
+                and, if requested, score_surface
+
+    """
+
+    def report(stage, completed=0, total=0):
+        if progress is not None:
+            progress(stage, completed, total)
+
+    if timer is None:
+        timer = instrumentation.StageTimer()
+
+    method = options['method']
+
+    report('features')
+    with timer.stage('features'):
+        df = utils.add_features_to_df(df, mhp_window_size=MHP_WINDOW_SIZE, features=['mhp'])
+        df = utils.drop_transient_mhp_window_sized_data(df, mhp_window_size=MHP_WINDOW_SIZE)
+
+    report('tagging')
+    logging.info("Running HMM based data tagging.")
+    with timer.stage('hmm_fit'):
+        ghmm, initialisation = hmm_tagging.fit_andon_hmm(
+            df[['mhp']].to_numpy(),
+            warm_start=options['hmm_warm_start'],
+            decimation=options['hmm_decimation'],
+            init_params=options['hmm_params'],
+        )
+    fitted_hmm_params = hmm_tagging.hmm_params(ghmm)
+    hmm_report = {
+        'initialisation': initialisation,
+        'em_iterations': int(ghmm.monitor_.iter),
+    }
+    with timer.stage('hmm_decode'):
+        tagged_states = hmm_tagging.generate_tagged_data(df, ghmm=ghmm)
+    if options['hmm_report_agreement'] and initialisation != hmm_tagging.COLD:
+        with timer.stage('hmm_agreement'):
+            cold_tagged_states = hmm_tagging.generate_tagged_data(df)
+        hmm_report['agreement_with_cold_fit'] = hmm_tagging.tagging_agreement(tagged_states, cold_tagged_states)
+        logging.info(f"Warm started HMM tags agree with cold fit tags on {hmm_report['agreement_with_cold_fit']:.4%} of samples.")
+
+    number_of_states = np.unique(tagged_states, return_counts=True)
+    logging.info(f'number of states: {number_of_states}')
+    if number_of_states[0].size < 2:
+        raise CalibrationError("ERROR: Single state found. Unable to tag downTimeCalibrationData automatically.")
+
+    # an optimizer step (objective evaluation with the optimizer's own work, grid search threshold or
+    # parallel batch) ends with every progress call:
+    step_start = None
+
+    def optimizer_progress(completed, total):
+        nonlocal step_start
+        step_start = timer.record('optimizer_call', step_start, call=completed)
+        report('optimization', completed, total)
+
+    report('optimization')
+    logging.info(f"Running {method} optimization MHPDT cross validation.")
+    with timer.stage('optimization', method=method):
+        step_start = timer.snapshot()
+        if method == 'grid':
+            cv_result = mhpdt_cv.run_grid_search(df, tagged_states, threshold_step=options['grid_threshold_step'], progress=optimizer_progress)
+        elif options['optimizer_workers'] > 1:
+            cv_result = mhpdt_cv.run_parallel_optimization(df, tagged_states, n_workers=options['optimizer_workers'], progress=optimizer_progress)
+        else:
+            cv_result = mhpdt_cv.run_optimization(df, tagged_states, progress=optimizer_progress)
+
+    # preparing message: converting numpy data types to python datatypes for json
+    result = {
+        "model_type": "MHPDT",
+        "model_params": {
+            "mhp_threshold": float(round(cv_result.x[0], 3)),
+            "min_cycle_time": 0,
+            "andon_uptime_threshold": 5,
+            "up_filter_size": int(cv_result.x[1]),
+            "down_filter_size": int(cv_result.x[2])
+        },
+    }
+
+    report('scoring')
+    logging.info("Calculating calibration accuracy.")
+    with timer.stage('scoring'):
+        calibration_score = mhpdt_cv.optimization_score(df, result, tagged_states)
+    logging.info(f"Calibration accuracy:{calibration_score}")
+    result["calibration_score"] = calibration_score
+    # fitted parameters, pass them as hmm_params to warm start the next calibration of this machine:
+    result["hmm_params"] = fitted_hmm_params
+    result["hmm_tagging"] = hmm_report
+
+    if method == 'grid' and options['return_score_surface']:
+        result["score_surface"] = {
+            "mhp_threshold": cv_result.thresholds.tolist(),
+            "up_filter_size": cv_result.up_filter_sizes.tolist(),
+            "down_filter_size": cv_result.down_filter_sizes.tolist(),
+            "scores": cv_result.score_surface.tolist(),
+        }
+
+    return result
+
+
+def run_cached_calibration(df: pd.DataFrame, options: Dict, progress: Optional[Callable[[str, int, int], None]] = None,
+                           timer: Optional[instrumentation.StageTimer] = None) -> Tuple[Dict, bool]:
+    """
+    run_calibration through the result cache: the result of a calibration window's samples with
+    the same options is computed once and then served from result_cache.cache. With the use_cache
+    option false the calibration is always computed, and its result replaces the cached one.
+    timer records the cache_lookup stage and the stages of run_calibration.
+
+    Returns     the calibration result and whether it was served from the cache
+    -------
+
+    """
+
+    if timer is None:
+        timer = instrumentation.StageTimer()
+    timer.samples = len(df)
+
+    with timer.stage('cache_lookup'):
+        key = result_cache.calibration_key(df, options, mhp_window_size=MHP_WINDOW_SIZE)
+        result = result_cache.cache.get(key) if options['use_cache'] else None
+    if result is not None:
+        logging.info(f"Calibration result cache hit for {key}.")
+        return result, True
+
+    result = run_calibration(df, options, progress=progress, timer=timer)
+    try:
+        result_cache.cache.put(key, result)
+    except OSError:
+        logging.exception("Unable to store calibration result in cache.")
+
+    return result, False
+
+
+def timed_result(result: Dict, options: Dict, timer: instrumentation.StageTimer) -> Dict:
+    """
+    Adds the stages recorded by timer to instrumentation.metrics and returns the calibration result,
+    with the timer report as timings if the return_timings option is set (the cached result is left
+    unchanged).
+    """
+
+    instrumentation.metrics.observe(timer.records, timer.samples)
+    if options['return_timings']:
+        return {**result, 'timings': timer.report()}
+    return result
@@ -0,0 +1,184 @@
+"""
+Feature engineering shared by the dashboard and the MHPDT_cross_validation function.
+
+Features are declared in FEATURES: the columns each feature adds to the accelerations DataFrame
+and the function computing them. compute_features only computes the requested features and
+reuses the columns the input frame already holds when they were computed with the same parameters.
+"""
+import logging
+from typing import Callable, Dict, Iterable, List, NamedTuple
+
+import numpy as np
+import pandas as pd
+from scipy.signal import lfilter
+from sklearn.decomposition import PCA
+
+AXES = ['x', 'y', 'z']
+# DataFrame.attrs entry recording the parameters each feature column was computed with:
+FEATURE_PARAMS_ATTR = 'feature_params'
+
+
+def magnitude_highpass(df: pd.DataFrame, axes: List = ['x', 'y', 'z'], window_size: str = '3s') -> np.array:
+    """
+
+    Parameters
+    ----------
+    df              input pd.Dataframe
+    axes            axes to include in magnitude highpass calculation
+    window_size     size of rolling window, e.g. 3 or '3s'
+
+    Returns         np.array of magnitude highpass values
+    -------
+
+    """
+
+    mhp = df[axes].values - df[axes].rolling(window=window_size).mean().values
+    # magnitude calculation:
+    mhp = np.sqrt(np.sum(np.power(mhp, 2), axis=1))
+
+    return mhp
+
+
+def linear_acceleration(data_array: np.array, alpha: float = 0.8) -> np.array:
+    """
+
+    Parameters
+    ----------
+    data_array      pd.Series, pd.DataFrame or np.array of accelerations, filtered along the first axis
+    alpha           exponential smoothing factor
+
+    Returns         gravity free accelerations, same type as data_array
+    -------
+
+    """
+
+    values = np.asarray(data_array, dtype=np.float64)
+
+    # gravity can be considered as the low passed version of the signal (using exponential smoothing):
+    #   gravity[0] = data_array[0]
+    #   gravity[i] = alpha * gravity[i - 1] + (1 - alpha) * data_array[i]
+    # which is a first order IIR filter, its state initialised with gravity[0]:
+    gravity = np.empty_like(values)
+    if values.shape[0] > 0:
+        gravity[:1] = values[:1]
+        gravity[1:], _ = lfilter([1 - alpha], [1, -alpha], values[1:], axis=0, zi=alpha * values[:1])
+
+    gravity_free_acceleration = data_array - gravity
+
+    return gravity_free_acceleration
+
+
+def gravity_free_magnitude(df: pd.DataFrame, alpha: float = 0.8):
+    """
+
+    Parameters
+    ----------
+    df
+    alpha
+
+    Returns
+    -------
+
+    """
+
+    df_gravity_free = linear_acceleration(df[['x', 'y', 'z']], alpha=alpha)
+    magnitude = np.sqrt(df_gravity_free.pow(2).sum(axis=1))
+
+    return magnitude
+
+
+def _magnitude(df: pd.DataFrame, **params) -> Dict[str, np.array]:
+    return {'magnitude': np.sqrt(df.x ** 2 + df.y ** 2 + df.z ** 2)}
+
+
+def _mhp(df: pd.DataFrame, mhp_window_size: str = '3s', **params) -> Dict[str, np.array]:
+    return {'mhp': magnitude_highpass(df, window_size=mhp_window_size)}
+
+
+def _no_gravity(df: pd.DataFrame, alpha: float = 0.8, **params) -> Dict[str, np.array]:
+    return {'no_gravity': gravity_free_magnitude(df, alpha=alpha)}
+
+
+def _pca(df: pd.DataFrame, **params) -> Dict[str, np.array]:
+    return {'pca': PCA(n_components=1).fit_transform(df[AXES].fillna(0))[:, 0]}
+
+
+def _rolling_avg_columns(mhp_window_size: str = '3s', **params) -> List[str]:
+    return [f'{axis}_{mhp_window_size}_avg' for axis in AXES]
+
+
+def _rolling_avg(df: pd.DataFrame, mhp_window_size: str = '3s', **params) -> Dict[str, np.array]:
+    return {f'{axis}_{mhp_window_size}_avg': df[axis].rolling(mhp_window_size).mean().fillna(0) for axis in AXES}
+
+
+class Feature(NamedTuple):
+    columns: Callable[..., List[str]]
+    compute: Callable[..., Dict[str, np.array]]
+
+
+FEATURES = {
+    'magnitude': Feature(columns=lambda **params: ['magnitude'], compute=_magnitude),
+    'mhp': Feature(columns=lambda **params: ['mhp'], compute=_mhp),
+    'no_gravity': Feature(columns=lambda **params: ['no_gravity'], compute=_no_gravity),
+    'pca': Feature(columns=lambda **params: ['pca'], compute=_pca),
+    'rolling_avg': Feature(columns=_rolling_avg_columns, compute=_rolling_avg),
+}
+
+
+def feature_columns(feature_names: Iterable[str], mhp_window_size: str = '3s', alpha: float = 0.8) -> List[str]:
+    """
+
+    Parameters
+    ----------
+    feature_names       names of FEATURES
+    mhp_window_size     size of the rolling windows, e.g. '3s'
+    alpha               gravity filter exponential smoothing factor
+
+    Returns             DataFrame columns holding the given features
+    -------
+
+    """
+
+    columns = []
+    for name in feature_names:
+        columns += FEATURES[name].columns(mhp_window_size=mhp_window_size, alpha=alpha)
+    return columns
+
+
+def compute_features(df: pd.DataFrame, feature_names: Iterable[str], mhp_window_size: str = '3s', alpha: float = 0.8,
+                     overwrite: bool = False) -> pd.DataFrame:
+    """
+
+    Parameters
+    ----------
+    df                  accelerations DataFrame with x, y, z columns, features are added in place
+    feature_names       names of FEATURES to add
+    mhp_window_size     size of the rolling windows, e.g. '3s'
+    alpha               gravity filter exponential smoothing factor
+    overwrite           recompute features whose columns are already in df. Without it, columns are
+                        reused only if df.attrs records they were computed with the same
+                        mhp_window_size and alpha, columns of unknown origin are recomputed
+
+    Returns             df with the requested feature columns
+    -------
+
+    """
+
+    params = dict(mhp_window_size=mhp_window_size, alpha=alpha)
+    # copied, pandas shares the attrs values between a frame and the frames derived from it:
+    column_params = dict(df.attrs.get(FEATURE_PARAMS_ATTR, {}))
+
+    for name in feature_names:
+        feature = FEATURES[name]
+        columns = feature.columns(**params)
+        if not overwrite and all(column in df.columns and column_params.get(column) == params for column in columns):
+            continue
+
+        logging.info(f'computing {name} feature using parameters mhp_window_size: {mhp_window_size} and alpha: {alpha}')
+        for column, values in feature.compute(df, **params).items():
+            df[column] = values
+            column_params[column] = params
+
+    df.attrs[FEATURE_PARAMS_ATTR] = column_params
+
+    return df
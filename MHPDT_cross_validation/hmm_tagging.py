@@ -1,14 +1,30 @@
 import logging
 import numpy as np
 import pandas as pd
+from typing import Dict, Optional, Tuple
 from hmmlearn.hmm import GaussianHMM
 import utils
 
+# samples averaged into one observation of the warm start pre-fit:
+DEFAULT_DECIMATION = 10
+# below this many decimated observations the pre-fit is skipped and the model is fit cold:
+MIN_PREFIT_OBSERVATIONS = 100
+# initialisations of fit_andon_hmm: k-means, decimated pre-fit, hmm_params of an earlier calibration
+COLD = "cold"
+DECIMATED = "decimated"
+PREVIOUS = "previous"
+
+
+# transition probability between the states when decoding:
+DECODE_TRANSITION = 1e-50  # 1e-300
 
-def hmm_based_andon_tag(df, feature_name):
-    obs_seq = np.array(df[[feature_name]])
 
-    ghmm = GaussianHMM(
+def andon_hmm(**kwargs) -> GaussianHMM:
+    """
+    The 2-state GaussianHMM used for tagging, kwargs override its settings.
+    """
+
+    settings = dict(
         n_components=2,
         covariance_type="diag",
         min_covar=1e-3,
@@ -19,19 +35,144 @@ def hmm_based_andon_tag(df, feature_name):
         params="stmc",
         init_params="stmc",
     )
+    settings.update(kwargs)
+
+    return GaussianHMM(**settings)
+
+
+def hmm_params(ghmm: GaussianHMM) -> Dict:
+    """
+    Returns the fitted parameters of ghmm as JSON serializable lists, see fit_andon_hmm init_params.
+    """
+
+    covars = np.asarray(ghmm.covars_)
+    if covars.ndim == 3:
+        # hmmlearn reports diagonal covariances as full matrices
+        covars = np.diagonal(covars, axis1=1, axis2=2)
+
+    return {
+        "startprob": ghmm.startprob_.tolist(),
+        "transmat": ghmm.transmat_.tolist(),
+        "means": ghmm.means_.tolist(),
+        "covars": covars.tolist(),
+    }
+
+
+def _initialized_hmm(init_params: Dict) -> GaussianHMM:
+    # EM starting from init_params instead of the k-means / uniform initialisation:
+    ghmm = andon_hmm(init_params="")
+    ghmm.startprob_ = np.asarray(init_params["startprob"], dtype=np.float64)
+    ghmm.transmat_ = np.asarray(init_params["transmat"], dtype=np.float64)
+    ghmm.means_ = np.asarray(init_params["means"], dtype=np.float64)
+    ghmm.covars_ = np.asarray(init_params["covars"], dtype=np.float64)
+
+    return ghmm
+
+
+def decimated_prefit(obs_seq: np.ndarray, decimation: int = DEFAULT_DECIMATION) -> Optional[Dict]:
+    """
+
+    Parameters
+    ----------
+    obs_seq         observation sequence, shape (n_samples, 1)
+    decimation      number of consecutive samples averaged into one observation
+
+    Returns         hmm_params of a model fit on the block averaged sequence, with the transition
+    -------         probabilities scaled back to one sample steps. None if the sequence is too
+                    short for a meaningful pre-fit
+
+    """
+
+    if decimation < 2:
+        return None
+    n_blocks = obs_seq.shape[0] // decimation
+    if n_blocks < MIN_PREFIT_OBSERVATIONS:
+        return None
+
+    blocks = obs_seq[: n_blocks * decimation].reshape(n_blocks, decimation, -1).mean(axis=1)
+    coarse = andon_hmm()
+    coarse.fit(blocks)
+    logging.info(f"HMM pre-fit on {n_blocks} decimated observations took {coarse.monitor_.iter} EM iterations.")
 
+    params = hmm_params(coarse)
+
+    # staying in a state for one block is staying in it for decimation samples:
+    stay = np.clip(np.diag(coarse.transmat_), 1e-12, 1.0) ** (1.0 / decimation)
+    transmat = np.diag(stay)
+    transmat[0, 1] = 1 - stay[0]
+    transmat[1, 0] = 1 - stay[1]
+    params["transmat"] = transmat.tolist()
+
+    return params
+
+
+def fit_andon_hmm(obs_seq: np.ndarray, warm_start: bool = False, decimation: int = DEFAULT_DECIMATION,
+                  init_params: Optional[Dict] = None) -> Tuple[GaussianHMM, str]:
+    """
+
+    Parameters
+    ----------
+    obs_seq         observation sequence, shape (n_samples, 1)
+    warm_start      initialise EM on the full sequence with a fit on the decimated sequence
+    decimation      decimation of the warm start pre-fit
+    init_params     hmm_params to initialise EM with, e.g. from an earlier calibration of the same
+                    machine. Takes precedence over the pre-fit
+
+    Returns         fitted GaussianHMM and the initialisation EM started from: PREVIOUS (init_params),
+    -------         DECIMATED (pre-fit) or COLD (k-means), also when the sequence is too short for a pre-fit
+
+    """
+
+    initialisation = COLD if init_params is None else PREVIOUS
+    if init_params is None and warm_start:
+        init_params = decimated_prefit(obs_seq, decimation)
+        if init_params is not None:
+            initialisation = DECIMATED
+
+    ghmm = andon_hmm() if init_params is None else _initialized_hmm(init_params)
     ghmm.fit(obs_seq)
+    logging.info(f"HMM fit ({initialisation}) on {obs_seq.shape[0]} observations took {ghmm.monitor_.iter} EM iterations.")
+
+    return ghmm, initialisation
 
-    # transition reset
-    trans = 1e-50  # 1e-300
+
+def decode_with_fitted_hmm(ghmm: GaussianHMM, obs_seq: np.ndarray, trans: float = DECODE_TRANSITION) -> Tuple[float, np.ndarray]:
+    """
+    GaussianHMM.decode of obs_seq with the transition matrix reset to [[1 - trans, trans], [trans, 1 - trans]].
+    The fitted transition matrix of ghmm is restored afterwards.
+    """
+
+    fitted_transmat = ghmm.transmat_
     ghmm.transmat_ = np.array([[1 - trans, trans], [trans, 1 - trans]])
-    logprob, state_seq = ghmm.decode(obs_seq)
-    return logprob, state_seq
+    try:
+        return ghmm.decode(obs_seq)
+    finally:
+        ghmm.transmat_ = fitted_transmat
+
+
+def hmm_based_andon_tag(df, feature_name, ghmm=None, **fit_kwargs):
+    """
+    Decodes the states of df[feature_name] with a near identity transition matrix, using ghmm or, if
+    not given, a model fit on the data by fit_andon_hmm(**fit_kwargs).
+    """
+    obs_seq = np.array(df[[feature_name]])
 
+    if ghmm is None:
+        ghmm, _ = fit_andon_hmm(obs_seq, **fit_kwargs)
+    return decode_with_fitted_hmm(ghmm, obs_seq)
 
-def generate_tagged_data(df):
-    logprob, state_seq = hmm_based_andon_tag(df, feature_name="mhp")
+
+def generate_tagged_data(df, **kwargs):
+    logprob, state_seq = hmm_based_andon_tag(df, feature_name="mhp", **kwargs)
     tagged_states = pd.Series(state_seq, index=df.index)
     tagged_states = utils.std_based_state_flipping(df.mhp, tagged_states)
 
     return tagged_states
+
+
+def tagging_agreement(tagged_states: pd.Series, reference_states: pd.Series) -> float:
+    """
+    Fraction of samples tagged the same by two generate_tagged_data runs.
+    """
+
+    return float(np.mean(np.asarray(tagged_states) == np.asarray(reference_states)))
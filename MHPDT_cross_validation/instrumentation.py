@@ -0,0 +1,177 @@
+import math
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:
+    # not available on windows, peak RSS is then not reported
+    resource = None
+
+# upper bounds of the wall time histogram buckets, in seconds:
+WALL_SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300)
+METRIC_PREFIX = 'mhpdt_calibration'
+
+
+def peak_rss_bytes() -> Optional[int]:
+    """
+    High-water mark of the resident set size of this process, in bytes.
+    """
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macOS:
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+def samples_bucket(n_samples: int) -> str:
+    """
+    Power of ten upper bound of a request size, the request size label of the metrics.
+    """
+    if n_samples <= 1000:
+        return '1e3'
+    return f'1e{math.ceil(math.log10(n_samples))}'
+
+
+class StageTimer:
+    """
+    Wall time, CPU time and peak RSS of the stages of one calibration request.
+
+    Every stage is recorded as a dict of stage name, wall_seconds, cpu_seconds, peak_rss_bytes (the
+    process high-water mark at the end of the stage) and rss_growth_bytes (how much the stage raised
+    it), plus the labels given, e.g. the call number of optimizer calls. CPU time is that of the
+    whole process: it includes the BLAS threads of a stage but also concurrently running jobs, and
+    not the worker processes of a parallel optimization.
+    """
+
+    def __init__(self):
+        self.records: List[Dict] = []
+        self.samples = 0
+        self._start = self.snapshot()
+
+    @staticmethod
+    def snapshot() -> Tuple[float, float, Optional[int]]:
+        return time.perf_counter(), time.process_time(), peak_rss_bytes()
+
+    def record(self, stage: str, start: Tuple[float, float, Optional[int]], **labels) -> Tuple[float, float, Optional[int]]:
+        """
+        Records stage as lasting from the start snapshot until now, returns the snapshot of now so
+        consecutive steps can be recorded one after the other.
+        """
+
+        end = self.snapshot()
+        self.records.append({
+            'stage': stage,
+            **labels,
+            'wall_seconds': end[0] - start[0],
+            'cpu_seconds': end[1] - start[1],
+            'peak_rss_bytes': end[2],
+            'rss_growth_bytes': end[2] - start[2] if end[2] is not None else None,
+        })
+        return end
+
+    @contextmanager
+    def stage(self, stage: str, **labels):
+        start = self.snapshot()
+        try:
+            yield
+        finally:
+            self.record(stage, start, **labels)
+
+    def report(self) -> Dict:
+        """
+        timings of the calibration response: request size, stage records in execution order and
+        totals since the timer was created.
+        """
+
+        end = self.snapshot()
+        return {
+            'samples': self.samples,
+            'stages': self.records,
+            'total': {
+                'wall_seconds': end[0] - self._start[0],
+                'cpu_seconds': end[1] - self._start[1],
+                'peak_rss_bytes': end[2],
+            },
+        }
+
+
+class StageMetrics:
+    """
+    Stage timings of the calibrations run by this process, aggregated by stage and request size
+    (samples_bucket) and exported in the Prometheus text format: a histogram of the wall time, the
+    cumulated CPU time, the failed calibrations by status code and the peak RSS of the process.
+    """
+
+    def __init__(self, buckets=WALL_SECONDS_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._bucket_counts = defaultdict(lambda: [0] * len(self.buckets))
+        self._count = defaultdict(int)
+        self._wall_seconds = defaultdict(float)
+        self._cpu_seconds = defaultdict(float)
+        self._errors = defaultdict(int)
+
+    def observe(self, records: List[Dict], samples: int) -> None:
+        size = samples_bucket(samples)
+        with self._lock:
+            for record in records:
+                key = (record['stage'], size)
+                self._count[key] += 1
+                self._wall_seconds[key] += record['wall_seconds']
+                self._cpu_seconds[key] += record['cpu_seconds']
+                bucket_counts = self._bucket_counts[key]
+                for i, upper_bound in enumerate(self.buckets):
+                    if record['wall_seconds'] <= upper_bound:
+                        bucket_counts[i] += 1
+
+    def observe_error(self, status_code: int, samples: int) -> None:
+        with self._lock:
+            self._errors[(str(status_code), samples_bucket(samples))] += 1
+
+    def exposition(self) -> str:
+        with self._lock:
+            keys = sorted(self._count)
+            lines = [
+                f'# HELP {METRIC_PREFIX}_stage_wall_seconds Wall time of the calibration stages.',
+                f'# TYPE {METRIC_PREFIX}_stage_wall_seconds histogram',
+            ]
+            for stage, size in keys:
+                labels = f'stage="{stage}",samples="{size}"'
+                for upper_bound, count in zip(self.buckets, self._bucket_counts[(stage, size)]):
+                    lines.append(f'{METRIC_PREFIX}_stage_wall_seconds_bucket{{{labels},le="{upper_bound}"}} {count}')
+                lines.append(f'{METRIC_PREFIX}_stage_wall_seconds_bucket{{{labels},le="+Inf"}} {self._count[(stage, size)]}')
+                lines.append(f'{METRIC_PREFIX}_stage_wall_seconds_sum{{{labels}}} {self._wall_seconds[(stage, size)]}')
+                lines.append(f'{METRIC_PREFIX}_stage_wall_seconds_count{{{labels}}} {self._count[(stage, size)]}')
+
+            lines += [
+                f'# HELP {METRIC_PREFIX}_stage_cpu_seconds_total CPU time of the calibration stages.',
+                f'# TYPE {METRIC_PREFIX}_stage_cpu_seconds_total counter',
+            ]
+            for stage, size in keys:
+                lines.append(f'{METRIC_PREFIX}_stage_cpu_seconds_total{{stage="{stage}",samples="{size}"}} {self._cpu_seconds[(stage, size)]}')
+
+            lines += [
+                f'# HELP {METRIC_PREFIX}_errors_total Failed calibrations.',
+                f'# TYPE {METRIC_PREFIX}_errors_total counter',
+            ]
+            for (status_code, size), count in sorted(self._errors.items()):
+                lines.append(f'{METRIC_PREFIX}_errors_total{{status_code="{status_code}",samples="{size}"}} {count}')
+
+        peak_rss = peak_rss_bytes()
+        if peak_rss is not None:
+            lines += [
+                f'# HELP {METRIC_PREFIX}_process_peak_rss_bytes Peak resident set size of the function worker process.',
+                f'# TYPE {METRIC_PREFIX}_process_peak_rss_bytes gauge',
+                f'{METRIC_PREFIX}_process_peak_rss_bytes{{pid="{os.getpid()}"}} {peak_rss}',
+            ]
+
+        return '\n'.join(lines) + '\n'
+
+
+metrics = StageMetrics()
@@ -0,0 +1,227 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+import pandas as pd
+import calibration
+import instrumentation
+import batch
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class JobStore:
+    """
+    Asynchronous calibration jobs, of single calibrations (submit) or batches of them (submit_batch).
+
+    Jobs run in a thread pool of the function worker process that received them. Their state
+    (status, progress, result or error) is kept in one JSON file per job under job_dir, written to a
+    temporary file first and renamed, so status, result and cancel requests can be answered by any
+    worker process sharing job_dir. Cancellation is requested by creating a flag file, which the
+    running job checks on every progress report. Finished jobs are removed ttl seconds after their
+    last update.
+
+    Every progress report rewrites the job file, and between reports (HMM fit, waiting in the queue) a
+    heartbeat thread touches the files of the jobs of this process. A queued or running job whose file
+    was not modified for stale_after seconds lost its worker process (recycled or crashed) and is
+    reported failed.
+    """
+
+    def __init__(self, job_dir: str, max_workers: int = 2, ttl: float = 3600, stale_after: float = 600):
+        self.job_dir = job_dir
+        self.ttl = ttl
+        self.stale_after = stale_after
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='calibration-job')
+        os.makedirs(self.job_dir, exist_ok=True)
+        # queued and running jobs of this process, kept alive by the heartbeat thread:
+        self._active = set()
+        self._active_lock = threading.Lock()
+        self._heartbeat_thread = None
+
+    def _path(self, job_id: str, suffix: str = 'json') -> str:
+        return os.path.join(self.job_dir, f'{job_id}.{suffix}')
+
+    def _write(self, job: Dict) -> None:
+        job['updated_at'] = time.time()
+        tmp_path = self._path(f'.{uuid.uuid4().hex}', 'tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(job, f)
+        os.replace(tmp_path, self._path(job['job_id']))
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        # job ids are uuid4 hex strings, anything else cannot name a job file:
+        try:
+            uuid.UUID(hex=job_id)
+        except (TypeError, ValueError):
+            return None
+
+        try:
+            with open(self._path(job_id)) as f:
+                job = json.load(f)
+                modified_at = os.fstat(f.fileno()).st_mtime
+        except (OSError, ValueError):
+            return None
+
+        if job['status'] not in FINISHED_STATES and time.time() - modified_at > self.stale_after:
+            logging.warning(f"Calibration job {job_id} had no heartbeat for {self.stale_after} s, its worker process is gone.")
+            job.update(status=FAILED, error='calibration job lost its worker process, submit it again', status_code=500)
+            self._write(job)
+
+        return job
+
+    def _heartbeat(self) -> None:
+        while True:
+            time.sleep(self.stale_after / 4)
+            with self._active_lock:
+                job_ids = list(self._active)
+            for job_id in job_ids:
+                try:
+                    os.utime(self._path(job_id))
+                except OSError:
+                    pass
+
+    def submit(self, df: pd.DataFrame, options: Dict, timer: Optional[instrumentation.StageTimer] = None) -> Dict:
+        """
+        Starts a calibration job, timer records its stages and is reported with the result (return_timings).
+        """
+
+        timer = timer or instrumentation.StageTimer()
+
+        def compute(progress):
+            result, cache_hit = calibration.run_cached_calibration(df, options, progress=progress, timer=timer)
+            return calibration.timed_result(result, options, timer), cache_hit
+
+        return self._submit(compute, timer)
+
+    def submit_batch(self, items: List[Dict], shared_options: Dict) -> Dict:
+        """
+        Starts a job calibrating the batch items with batch.calibrator, its progress counts the
+        calibrated items and its result is the batch response.
+        """
+
+        def compute(progress):
+            response = batch.calibrator.run(items, shared_options, progress=lambda completed, total: progress('batch', completed, total))
+            return response, None
+
+        return self._submit(compute)
+
+    def _submit(self, compute: Callable[[Callable], Tuple[Dict, Optional[bool]]],
+                timer: Optional[instrumentation.StageTimer] = None) -> Dict:
+        # compute(progress) returns the job result and whether it was served from the result cache
+        self.expire()
+
+        job = {
+            'job_id': uuid.uuid4().hex,
+            'status': QUEUED,
+            'stage': None,
+            'progress': {'completed': 0, 'total': 0},
+            'submitted_at': time.time(),
+        }
+        self._write(job)
+        with self._active_lock:
+            self._active.add(job['job_id'])
+            if self._heartbeat_thread is None:
+                self._heartbeat_thread = threading.Thread(target=self._heartbeat, name='calibration-job-heartbeat', daemon=True)
+                self._heartbeat_thread.start()
+        self.executor.submit(self._run, dict(job), compute, timer)
+
+        return job
+
+    def cancel(self, job_id: str) -> Optional[Dict]:
+        job = self.get(job_id)
+        if job is None or job['status'] in FINISHED_STATES:
+            return job
+
+        open(self._path(job_id, 'cancel'), 'w').close()
+        if job['status'] == QUEUED:
+            # not started yet, _run skips it
+            job['status'] = CANCELLED
+            self._write(job)
+
+        return job
+
+    def cancel_requested(self, job_id: str) -> bool:
+        return os.path.exists(self._path(job_id, 'cancel'))
+
+    def _run(self, job: Dict, compute: Callable, timer: Optional[instrumentation.StageTimer]) -> None:
+        try:
+            self._run_job(job, compute, timer)
+        finally:
+            with self._active_lock:
+                self._active.discard(job['job_id'])
+
+    def _run_job(self, job: Dict, compute: Callable, timer: Optional[instrumentation.StageTimer]) -> None:
+
+        if self.cancel_requested(job['job_id']):
+            job['status'] = CANCELLED
+            self._write(job)
+            return
+
+        def progress(stage, completed, total):
+            if self.cancel_requested(job['job_id']):
+                raise calibration.CalibrationCancelled()
+            job.update(stage=stage, progress={'completed': completed, 'total': total})
+            self._write(job)
+
+        job['status'] = RUNNING
+        self._write(job)
+        try:
+            job['result'], job['cache_hit'] = compute(progress)
+            job['status'] = SUCCEEDED
+        except calibration.CalibrationCancelled:
+            logging.info(f"Calibration job {job['job_id']} cancelled.")
+            job['status'] = CANCELLED
+        except calibration.CalibrationError as e:
+            job.update(status=FAILED, error=str(e), status_code=400)
+        except Exception as e:
+            logging.exception(f"Calibration job {job['job_id']} failed.")
+            job.update(status=FAILED, error=str(e), status_code=500)
+
+        # the items of a batch job are observed by batch.calibrator:
+        if job['status'] == FAILED and timer is not None:
+            instrumentation.metrics.observe(timer.records, timer.samples)
+            instrumentation.metrics.observe_error(job['status_code'], timer.samples)
+
+        self._write(job)
+
+    def expire(self) -> None:
+
+        now = time.time()
+        for entry in os.scandir(self.job_dir):
+            if entry.name.endswith('.cancel'):
+                # left behind by a job removed in the meantime:
+                if not os.path.exists(self._path(entry.name[:-len('.cancel')])):
+                    try:
+                        os.remove(entry.path)
+                    except OSError:
+                        pass
+                continue
+            if not entry.name.endswith('.json'):
+                continue
+            # marks stale jobs failed, they expire ttl seconds later:
+            job = self.get(entry.name[:-len('.json')])
+            if job is None or job['status'] not in FINISHED_STATES or now - job['updated_at'] < self.ttl:
+                continue
+            for suffix in ('json', 'cancel'):
+                try:
+                    os.remove(self._path(job['job_id'], suffix))
+                except OSError:
+                    pass
+
+
+store = JobStore(
+    job_dir=os.environ.get('MHPDT_JOB_DIR', os.path.join(tempfile.gettempdir(), 'mhpdt-calibration-jobs')),
+    max_workers=int(os.environ.get('MHPDT_JOB_WORKERS', 2)),
+    ttl=float(os.environ.get('MHPDT_JOB_TTL', 3600)),
+    stale_after=float(os.environ.get('MHPDT_JOB_STALE_AFTER', 600)),
+)
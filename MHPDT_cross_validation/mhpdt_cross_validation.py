@@ -1,10 +1,17 @@
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import numpy as np
 import pandas as pd
 import skopt
 from skopt import gp_minimize
+from skopt.utils import cook_estimator
 import utils
 import micro_filter
 import sklearn.metrics
+from scipy.optimize import OptimizeResult
 from typing import Dict
 
 def fast_MHPDT(df, feature_to_use='mhp', threshold=0.1, andon_uptime_threshold=5):
@@ -17,23 +24,46 @@ def andon_state_from_mhpdt(df, andon_threshold=pd.to_timedelta('30s')):
     if 'is_cycle' not in df.columns:
         return list()
 
-    df['timestamp'] = df.index
-    run_list = df.to_dict('records')
-    andon_prediction_list = list()
+    is_cycle = df['is_cycle'].values
+    timestamps = df.index.values.astype('datetime64[ns]').view(np.int64)
+    andon_state = andon_state_from_cycles(is_cycle, timestamps, pd.Timedelta(andon_threshold).value)
 
-    andon_state = np.zeros_like(df['is_cycle'].values)
-    last_csp = df.index[0] - andon_threshold
+    return andon_state.astype(is_cycle.dtype, copy=False)
 
-    for i, item in enumerate(run_list):
-        if i > 0:
-            if not item['is_cycle']:
-                if last_csp + andon_threshold < item['timestamp']:
-                    andon_state[i] = 0
-                else:
-                    andon_state[i] = 1
-            else:
-                andon_state[i] = 1
-                last_csp = item['timestamp']
+def andon_state_from_cycles(is_cycle: np.ndarray, timestamps: np.ndarray, andon_threshold: int) -> np.ndarray:
+    """
+    Array based andon state machine.
+
+    A sample is up (1) if it is a cycle sample or if the last cycle sample happened at most
+    andon_threshold before it. The first sample is always down and, as in the original
+    row-by-row implementation, it never counts as a cycle sample.
+
+    Parameters
+    ----------
+    is_cycle            0/1 array of cycle detections
+    timestamps          int64 timestamps in nanoseconds
+    andon_threshold     andon threshold in nanoseconds
+
+    Returns             np.array of andon states
+    -------
+
+    """
+
+    n = is_cycle.size
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    cycle_mask = is_cycle != 0
+    # the first sample seeds the 'last cycle timestamp' with timestamps[0] - andon_threshold:
+    seed_mask = cycle_mask.copy()
+    seed_mask[0] = True
+    last_cycle_position = np.maximum.accumulate(np.where(seed_mask, np.arange(n), 0))
+
+    last_cycle_timestamp = timestamps[last_cycle_position]
+    last_cycle_timestamp[last_cycle_position == 0] = timestamps[0] - andon_threshold
+
+    andon_state = (cycle_mask | (last_cycle_timestamp + andon_threshold >= timestamps)).astype(np.int64)
+    andon_state[0] = 0
 
     return andon_state
 
@@ -46,7 +76,7 @@ def andon_prediction_with_filtering(df, params):
 
     # ANDON:
     andon_threshold = pd.Timedelta(seconds=params['model_params']["andon_uptime_threshold"])
-    andon_state_from_mhpdt_array = andon_state_from_mhpdt(prediction_df.copy(), andon_threshold=andon_threshold)
+    andon_state_from_mhpdt_array = andon_state_from_mhpdt(prediction_df, andon_threshold=andon_threshold)
 
     prediction_df['state'] = andon_state_from_mhpdt_array
     up_filter_size = str(params['model_params']["up_filter_size"]) + 's'
@@ -79,23 +109,310 @@ def hmm_tagged_mhpdt_score(df,
 
     return score
 
-def run_optimization(df_input, labels):
+class CalibrationContext:
+    """
+    Feature, timestamp and label arrays of one calibration request.
+
+    Built once per request, it scores MHPDT parameter sets with plain NumPy passes over
+    contiguous arrays, giving the same predictions and scores as andon_prediction_with_filtering
+    and hmm_tagged_mhpdt_score without any DataFrame copies.
+    """
+
+    def __init__(self, df: pd.DataFrame, labels: pd.Series, feature_to_use: str = 'mhp'):
+        self.feature = np.ascontiguousarray(df[feature_to_use].values, dtype=np.float64)
+        self.timestamps = np.ascontiguousarray(micro_filter.index_to_nanoseconds(df.index))
+        self.labels = np.ascontiguousarray(np.asarray(labels, dtype=np.float64))
+
+    @classmethod
+    def from_arrays(cls, feature: np.ndarray, timestamps: np.ndarray, labels: np.ndarray) -> 'CalibrationContext':
+        context = cls.__new__(cls)
+        context.feature = feature
+        context.timestamps = timestamps
+        context.labels = labels
+        return context
+
+    def andon_state(self, mhp_threshold: float, andon_uptime_threshold: float = 5) -> np.ndarray:
+        is_cycle = (self.feature >= mhp_threshold).astype(np.int64)
+        andon_threshold = pd.Timedelta(seconds=andon_uptime_threshold).value
+
+        return andon_state_from_cycles(is_cycle, self.timestamps, andon_threshold)
+
+    def up_filter(self, states: np.ndarray, up_filter_size: float) -> np.ndarray:
+        if up_filter_size == 0:
+            return states
+        return micro_filter.fill_short_runs(states, self.timestamps, pd.Timedelta(seconds=up_filter_size).value,
+                                            run_value=1, fill_value=0)
+
+    def down_filter(self, states: np.ndarray, down_filter_size: float) -> np.ndarray:
+        if down_filter_size == 0:
+            return states
+        return micro_filter.fill_short_runs(states, self.timestamps, pd.Timedelta(seconds=down_filter_size).value,
+                                            run_value=0, fill_value=1)
+
+    def predict(self, mhp_threshold, andon_uptime_threshold=5, up_filter_size=0, down_filter_size=0, first_filter='down'):
+        states = self.andon_state(mhp_threshold, andon_uptime_threshold)
+
+        if first_filter == 'down':
+            return self.up_filter(self.down_filter(states, down_filter_size), up_filter_size)
+        elif first_filter == 'up':
+            return self.down_filter(self.up_filter(states, up_filter_size), down_filter_size)
+        raise ValueError(f"Invalid first_filter '{first_filter}'. first_filter = 'down' or 'up'")
+
+    def score(self, mhp_threshold, andon_uptime_threshold=5, up_filter_size=0, down_filter_size=0, first_filter='down'):
+        predicted_states = self.predict(mhp_threshold, andon_uptime_threshold, up_filter_size, down_filter_size, first_filter)
+
+        return np.sum(np.abs(self.labels - predicted_states))
+
+    def up_filter_scores(self, states: np.ndarray, up_filter_sizes) -> np.ndarray:
+        """
+        Scores of up filtering states with every size of up_filter_sizes, without materializing
+        the filtered series: a filtered up-run contributes a fixed score change, so the score of
+        a size is the unfiltered score plus the cumulated changes of all shorter up-runs.
+        """
+
+        up_filter_sizes = np.asarray(up_filter_sizes)
+        base_score = np.sum(np.abs(self.labels - states))
+
+        starts, _, values, durations = micro_filter.run_length_encoding(states, self.timestamps)
+        if values.size < 3:
+            return np.full(up_filter_sizes.size, base_score)
+
+        change = np.diff(values)
+        up_runs = np.flatnonzero((change[:-1] == 1) & (change[1:] == -1)) + 1
+
+        # score change of zeroing each sample, summed over the samples of each up-run
+        # (the first sample of the following down-run is already 0):
+        score_change = np.abs(self.labels) - np.abs(self.labels - states)
+        cumulated_change = np.concatenate(([0.0], np.cumsum(score_change)))
+        run_score_change = cumulated_change[starts[up_runs + 1]] - cumulated_change[starts[up_runs]]
+
+        order = np.argsort(durations[up_runs], kind='stable')
+        sorted_durations = durations[up_runs][order]
+        cumulated_run_change = np.concatenate(([0.0], np.cumsum(run_score_change[order])))
+
+        size_ns = np.array([pd.Timedelta(seconds=size).value for size in up_filter_sizes], dtype=np.int64)
+        filtered_run_count = np.searchsorted(sorted_durations, size_ns, side='left')
+        filtered_run_count[up_filter_sizes == 0] = 0
+
+        return base_score + cumulated_run_change[filtered_run_count]
+
+def run_grid_search(df_input, labels, thresholds=None, up_filter_sizes=range(0, 121), down_filter_sizes=range(0, 121),
+                    threshold_step=0.05, andon_uptime_threshold=5, progress=None):
+    """
+    Exhaustive alternative of run_optimization over the same search space.
+
+    The andon state is computed once per threshold and the down filter once per (threshold, down)
+    pair, the scores of all up filter sizes are then derived from the down filtered runs at once.
+
+    Parameters
+    ----------
+    df_input            DataFrame with mhp feature
+    labels              HMM tagged states
+    thresholds          mhp thresholds to evaluate, defaults to [0.1, 4] with threshold_step steps
+    up_filter_sizes     up filter sizes in seconds
+    down_filter_sizes   down filter sizes in seconds
+    progress            optional progress(completed, total) callback, called after every threshold
+
+    Returns             OptimizeResult with the global optimum as x = [mhp_threshold, up_filter_size, down_filter_size],
+    -------             its score as fun and the score_surface indexed [threshold, up_filter_size, down_filter_size]
+
+    """
+
+    if thresholds is None:
+        thresholds = np.round(np.arange(0.1, 4 + threshold_step / 2, threshold_step), 3)
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    up_filter_sizes = np.asarray(up_filter_sizes)
+    down_filter_sizes = np.asarray(down_filter_sizes)
+
+    context = CalibrationContext(df_input, labels)
+    score_surface = np.empty((thresholds.size, up_filter_sizes.size, down_filter_sizes.size))
+
+    for i, threshold in enumerate(thresholds):
+        states = context.andon_state(threshold, andon_uptime_threshold)
+        for k, down_filter_size in enumerate(down_filter_sizes):
+            down_filtered_states = context.down_filter(states, down_filter_size)
+            score_surface[i, :, k] = context.up_filter_scores(down_filtered_states, up_filter_sizes)
+        if progress is not None:
+            progress(i + 1, thresholds.size)
+
+    i, j, k = np.unravel_index(np.argmin(score_surface), score_surface.shape)
+
+    return OptimizeResult(
+        x=[thresholds[i], up_filter_sizes[j], down_filter_sizes[k]],
+        fun=score_surface[i, j, k],
+        score_surface=score_surface,
+        thresholds=thresholds,
+        up_filter_sizes=up_filter_sizes,
+        down_filter_sizes=down_filter_sizes,
+    )
+
+def optimization_space():
+    return [skopt.space.Real(0.1, 4, name='mhp_threshold'),
+            skopt.space.Integer(0, 120, name='up_filter_size'),
+            skopt.space.Integer(0, 120, name='down_filter_size')]
+
+def optimizer_workers() -> int:
+    """
+    Number of worker processes used for scoring optimizer candidates, set with the
+    MHPDT_OPTIMIZER_WORKERS environment variable (a server setting, not a request option). Defaults
+    to 1, i.e. the serial gp_minimize run, and is at most the number of CPUs.
+    """
+    return min(max(int(os.environ.get('MHPDT_OPTIMIZER_WORKERS', 1)), 1), os.cpu_count() or 1)
+
+def run_optimization(df_input, labels, progress=None, n_calls=50):
+    """
+    progress is an optional progress(completed, total) callback, called after every objective evaluation.
+    """
     np.random.seed(314156)
 
+    context = CalibrationContext(df_input, labels)
+
     def f(x):
-        score = hmm_tagged_mhpdt_score(df_input,
-                                       labels,
-                                       feature_threshold=x[0],
-                                       up_filter_size=x[1],
-                                       down_filter_size=x[2])
+        score = context.score(mhp_threshold=x[0],
+                              andon_uptime_threshold=5,
+                              up_filter_size=x[1],
+                              down_filter_size=x[2])
 
         return score
 
-    space = [skopt.space.Real(0.1, 4, name='mhp_threshold'),
-             skopt.space.Integer(0, 120, name='up_filter_size'),
-             skopt.space.Integer(0, 120, name='down_filter_size')]
+    space = optimization_space()
+
+    callback = None
+    if progress is not None:
+        callback = lambda res: progress(len(res.x_iters), n_calls)
+
+    res = gp_minimize(f, space, n_calls=n_calls, random_state=314156, callback=callback)
+    return res
+
+def _shared_memory_module():
+    # multiprocessing.shared_memory is new in python 3.8, the function image may still run python 3.7
+    try:
+        from multiprocessing import shared_memory
+    except ImportError:
+        return None
+    return shared_memory
+
+# calibration context of a run_parallel_optimization worker process, attached to the shared memory block
+# of the calibration it last scored candidates of (kept until the next calibration attaches its block):
+_worker_shared_memory = None
+_worker_context = None
+
+def _attach_worker_context(shared_memory_name: str, n_samples: int):
+    global _worker_shared_memory, _worker_context
+
+    if _worker_shared_memory is not None:
+        if _worker_shared_memory.name == shared_memory_name:
+            return
+        _worker_context = None
+        _worker_shared_memory.close()
+
+    _worker_shared_memory = _shared_memory_module().SharedMemory(name=shared_memory_name)
+    arrays = np.ndarray((3, n_samples), dtype=np.float64, buffer=_worker_shared_memory.buf)
+    _worker_context = CalibrationContext.from_arrays(feature=arrays[0], timestamps=arrays[1].view(np.int64), labels=arrays[2])
+
+def _score_in_worker(shared_memory_name: str, n_samples: int, x):
+    _attach_worker_context(shared_memory_name, n_samples)
+    return _worker_context.score(mhp_threshold=x[0],
+                                 andon_uptime_threshold=5,
+                                 up_filter_size=x[1],
+                                 down_filter_size=x[2])
+
+# worker process pool of run_parallel_optimization, created on first use and kept for later calibrations
+# so worker processes are started (and pay for their imports) once. A call with another number of
+# workers replaces it, there is never more than one:
+_optimizer_pool_executor = None
+_optimizer_pool_workers = None
+_optimizer_pool_lock = threading.Lock()
+
+def _optimizer_pool(n_workers: int) -> ProcessPoolExecutor:
+    global _optimizer_pool_executor, _optimizer_pool_workers
+
+    with _optimizer_pool_lock:
+        if _optimizer_pool_executor is not None and _optimizer_pool_workers != n_workers:
+            _optimizer_pool_executor.shutdown(wait=False)
+            _optimizer_pool_executor = None
+        if _optimizer_pool_executor is None:
+            _optimizer_pool_executor = ProcessPoolExecutor(max_workers=n_workers)
+            _optimizer_pool_workers = n_workers
+        return _optimizer_pool_executor
+
+def _reset_optimizer_pool(executor: ProcessPoolExecutor):
+    global _optimizer_pool_executor
+
+    with _optimizer_pool_lock:
+        if _optimizer_pool_executor is executor:
+            _optimizer_pool_executor = None
+    executor.shutdown(wait=False)
+
+def run_parallel_optimization(df_input, labels, n_workers=None, n_points=None, n_calls=50, progress=None):
+    """
+    Batched alternative of run_optimization: every iteration asks the optimizer for n_points candidates
+    (constant liar strategy) and scores them concurrently in a pool of n_workers processes. The feature,
+    timestamp and label arrays are placed once in a shared memory block the workers attach to, so only
+    the candidate parameters are pickled per task. The pool is kept across calls, a pool broken by a
+    dying worker is recreated on the next call. Without multiprocessing.shared_memory (python < 3.8)
+    it falls back to the serial run_optimization. An objective evaluation takes well under a millisecond
+    next to the optimizer's own work per step, so this only pays off when that work is small against
+    the scoring; benchmarks/bench_parallel_optimization.py measures it on a machine before
+    MHPDT_OPTIMIZER_WORKERS is raised.
+
+    Parameters
+    ----------
+    df_input        DataFrame with mhp feature
+    labels          HMM tagged states
+    n_workers       number of worker processes, defaults to optimizer_workers()
+    n_points        candidates per iteration, defaults to n_workers
+    n_calls         total number of objective evaluations
+    progress        optional progress(completed, total) callback, called after every batch of candidates
+
+    Returns         OptimizeResult as returned by gp_minimize
+    -------
+
+    """
+
+    shared_memory = _shared_memory_module()
+    if shared_memory is None:
+        logging.warning("multiprocessing.shared_memory unavailable, running the serial optimization.")
+        return run_optimization(df_input, labels, progress=progress, n_calls=n_calls)
+
+    np.random.seed(314156)
+
+    n_workers = n_workers or optimizer_workers()
+    n_points = n_points or n_workers
+
+    context = CalibrationContext(df_input, labels)
+    n_samples = context.feature.size
+
+    space = optimization_space()
+    rng = np.random.RandomState(314156)
+    base_estimator = cook_estimator('GP', space=space, random_state=rng.randint(0, np.iinfo(np.int32).max), noise='gaussian')
+    optimizer = skopt.Optimizer(space, base_estimator, acq_func='gp_hedge', n_initial_points=10, random_state=rng)
+
+    block = shared_memory.SharedMemory(create=True, size=max(3 * n_samples * 8, 1))
+    try:
+        arrays = np.ndarray((3, n_samples), dtype=np.float64, buffer=block.buf)
+        arrays[0] = context.feature
+        arrays[1] = context.timestamps.view(np.float64)
+        arrays[2] = context.labels
+
+        res = None
+        executor = _optimizer_pool(n_workers)
+        try:
+            while len(optimizer.Xi) < n_calls:
+                candidates = optimizer.ask(n_points=min(n_points, n_calls - len(optimizer.Xi)))
+                scores = list(executor.map(_score_in_worker, [block.name] * len(candidates), [n_samples] * len(candidates), candidates))
+                res = optimizer.tell(candidates, scores)
+                if progress is not None:
+                    progress(len(optimizer.Xi), n_calls)
+        except BrokenProcessPool:
+            _reset_optimizer_pool(executor)
+            raise
+    finally:
+        # the views into the block must be gone before it can be closed
+        arrays = None
+        block.close()
+        block.unlink()
 
-    res = gp_minimize(f, space, n_calls=50, random_state=314156)
     return res
 
 def optimization_score(df: pd.DataFrame, params: Dict, tagged_labels: pd.Series) -> float:
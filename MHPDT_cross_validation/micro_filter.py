@@ -1,65 +1,133 @@
+import numpy as np
 import pandas as pd
+from typing import Tuple
 
 
-def up_filter(df: pd.DataFrame, andon_flag='andon', up_filter_size='15s'):
-    
-    df = df.copy()
+def index_to_nanoseconds(index: pd.DatetimeIndex) -> np.ndarray:
+    return index.values.astype('datetime64[ns]').view(np.int64)
+
+
+def run_length_encoding(states: np.ndarray, timestamps: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+
+    Parameters
+    ----------
+    states          array of andon states
+    timestamps      int64 timestamps in nanoseconds
+
+    Returns         run starts, run ends (inclusive positions), run values and run durations in nanoseconds.
+    -------         A run lasts until the first sample of the next run, the last run until the last sample.
+
+    """
+
+    if states.size == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, states[:0], empty
+
+    starts = np.flatnonzero(np.concatenate(([True], states[1:] != states[:-1])))
+    ends = np.append(starts[1:] - 1, states.size - 1)
+    values = states[starts]
+    durations = np.append(timestamps[starts[1:]], timestamps[-1]) - timestamps[starts]
+
+    return starts, ends, values, durations
+
+
+def fill_short_runs(states: np.ndarray, timestamps: np.ndarray, filter_size: int, run_value=1, fill_value=0) -> np.ndarray:
+    """
+    Run-length based micro filter.
+
+    Every run of run_value entered by a change from fill_value and left by a change back to
+    fill_value that lasts less than filter_size is overwritten with fill_value, together with
+    the first sample of the next run (same as the df.loc[run_start:next_run_start] label slice
+    used previously, for a DatetimeIndex without duplicated timestamps).
+
+    Parameters
+    ----------
+    states          array of 0/1 andon states
+    timestamps      int64 timestamps in nanoseconds
+    filter_size     filter size in nanoseconds
+    run_value       state of the runs to filter out: 1 for the up filter, 0 for the down filter
+    fill_value      state written over the filtered runs
+
+    Returns         np.array of filtered states
+    -------
+
+    """
+
+    filtered = states.copy()
+    starts, _, values, durations = run_length_encoding(states, timestamps)
+    if values.size < 3:
+        return filtered
+
+    change = np.diff(values)
+    short_runs = (
+        (change[:-1] == run_value - fill_value)
+        & (change[1:] == fill_value - run_value)
+        & (durations[1:-1] < filter_size)
+    )
+    short_runs = np.flatnonzero(short_runs) + 1
+    if short_runs.size == 0:
+        return filtered
+
+    first = starts[short_runs]
+    last = starts[short_runs + 1]
+    coverage = np.cumsum(np.bincount(first, minlength=states.size + 1) - np.bincount(last + 1, minlength=states.size + 1))
+    filtered[coverage[:states.size] > 0] = fill_value
+
+    return filtered
+
+
+def _add_up_filter_column(df: pd.DataFrame, andon_flag='andon', up_filter_size='15s') -> pd.DataFrame:
+
     if up_filter_size == '0s':
         df[f'{andon_flag}_up_filtered'] = df[andon_flag]
         return df
 
-    df[f'{andon_flag}_up_filtered'] = df[andon_flag]
+    df[f'{andon_flag}_up_filtered'] = fill_short_runs(df[andon_flag].values,
+                                                     index_to_nanoseconds(df.index),
+                                                     pd.to_timedelta(up_filter_size).value,
+                                                     run_value=1,
+                                                     fill_value=0)
     df['andon_change'] = df[andon_flag].diff()
 
-    up_starts = df.loc[df['andon_change'] == 1].index
-    down_starts = df.loc[df['andon_change'] == -1.0].index
-
-    if not down_starts.empty:
-        down_starts = [ds for ds in down_starts if ds > up_starts[0]]
-    if len(up_starts) > len(down_starts):
-        up_starts = up_starts[:len(down_starts)]
-
-    for us, ds in zip(up_starts, down_starts):
-        if ds - us < pd.to_timedelta(up_filter_size):
-            df.loc[us:ds, f'{andon_flag}_up_filtered'] = 0
-
     return df
 
 
-def down_filter(df: pd.DataFrame, andon_flag='andon', down_filter_size='15s'):
-    
-    df = df.copy()
+def _add_down_filter_column(df: pd.DataFrame, andon_flag='andon', down_filter_size='15s') -> pd.DataFrame:
+
     if down_filter_size == '0s':
         df[f'{andon_flag}_down_filtered'] = df[andon_flag]
         return df
 
-    df[f'{andon_flag}_down_filtered'] = df[andon_flag]
+    df[f'{andon_flag}_down_filtered'] = fill_short_runs(df[andon_flag].values,
+                                                       index_to_nanoseconds(df.index),
+                                                       pd.to_timedelta(down_filter_size).value,
+                                                       run_value=0,
+                                                       fill_value=1)
     df['andon_change'] = df[andon_flag].diff()
 
-    up_starts = df.loc[df['andon_change'] == 1.0].index
-    down_starts = df.loc[df['andon_change'] == -1.0].index
+    return df
 
-    if not down_starts.empty:
-        up_starts = [us for us in up_starts if us > down_starts[0]]
-    if len(down_starts) > len(up_starts):
-        down_starts = down_starts[:len(up_starts)]
 
-    for ds, us in zip(down_starts, up_starts):
-        if us - ds < pd.to_timedelta(down_filter_size):
-            df.loc[ds:us, f'{andon_flag}_down_filtered'] = 1
+def up_filter(df: pd.DataFrame, andon_flag='andon', up_filter_size='15s'):
 
-    return df
+    return _add_up_filter_column(df.copy(), andon_flag=andon_flag, up_filter_size=up_filter_size)
+
+
+def down_filter(df: pd.DataFrame, andon_flag='andon', down_filter_size='15s'):
+
+    return _add_down_filter_column(df.copy(), andon_flag=andon_flag, down_filter_size=down_filter_size)
 
 
 def filtering(df: pd.DataFrame, andon_flag='andon', up_filter_size='15s', down_filter_size='10s', first_filter='down'):
     df = df.copy()
     if first_filter == 'down':
-        df = down_filter(df, andon_flag=andon_flag, down_filter_size=down_filter_size)
-        df = up_filter(df, andon_flag=f'{andon_flag}_down_filtered', up_filter_size=up_filter_size)
+        df = _add_down_filter_column(df, andon_flag=andon_flag, down_filter_size=down_filter_size)
+        df = _add_up_filter_column(df, andon_flag=f'{andon_flag}_down_filtered', up_filter_size=up_filter_size)
         df[f'{andon_flag}_filtered'] = df[f'{andon_flag}_down_filtered_up_filtered']
     elif first_filter == 'up':
-        df = up_filter(df, andon_flag=andon_flag, up_filter_size=up_filter_size)
-        df = down_filter(df, andon_flag=f'{andon_flag}_up_filtered', down_filter_size=down_filter_size)
+        df = _add_up_filter_column(df, andon_flag=andon_flag, up_filter_size=up_filter_size)
+        df = _add_down_filter_column(df, andon_flag=f'{andon_flag}_up_filtered', down_filter_size=down_filter_size)
         df[f'{andon_flag}_filtered'] = df[f'{andon_flag}_up_filtered_down_filtered']
 
-    return df
\ No newline at end of file
+    return df
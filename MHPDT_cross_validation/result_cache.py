@@ -0,0 +1,135 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+import uuid
+from typing import Dict, Optional
+import numpy as np
+import pandas as pd
+
+# bump when a change of the calibration pipeline changes its results, invalidating all entries:
+CACHE_VERSION = 2
+
+# options that change the calibration result; optimizer_workers changes it for the bayesian
+# method only (parallel candidate batches follow a different search path than serial gp_minimize):
+KEY_OPTIONS = ('method', 'grid_threshold_step', 'return_score_surface', 'hmm_warm_start', 'hmm_decimation', 'hmm_params',
+               'hmm_report_agreement')
+
+
+def calibration_key(df: pd.DataFrame, options: Dict, mhp_window_size: str) -> str:
+    """
+
+    Parameters
+    ----------
+    df                  basic accelerations DataFrame (timestamp index, x, y, z columns) of the calibration window
+    options             calibration_options
+    mhp_window_size     mhp window size the calibration features are computed with
+
+    Returns             hex digest identifying the calibration result of df and options
+    -------
+
+    """
+
+    settings = {key: options[key] for key in KEY_OPTIONS}
+    if options['method'] == 'bayesian':
+        settings['optimizer_workers'] = max(int(options['optimizer_workers']), 1)
+    settings.update(version=CACHE_VERSION, mhp_window_size=mhp_window_size)
+
+    digest = hashlib.sha256(json.dumps(settings, sort_keys=True).encode('utf-8'))
+    digest.update(np.ascontiguousarray(pd.DatetimeIndex(df.index).asi8).tobytes())
+    for column in ('x', 'y', 'z'):
+        digest.update(np.ascontiguousarray(df[column].to_numpy(dtype=np.float64)).tobytes())
+
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Size bounded, disk backed store of calibration results keyed by calibration_key.
+
+    Every entry is one JSON file under cache_dir, written to a temporary file first and renamed, so
+    all function worker processes sharing cache_dir share the results. Entries older than ttl
+    seconds are treated as missing and removed, and the least recently used entries are removed
+    once the total size exceeds max_bytes.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 64 * 1024 ** 2, ttl: float = 7 * 24 * 3600):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f'{key}.json')
+
+    def get(self, key: str) -> Optional[Dict]:
+
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if time.time() - entry['created_at'] > self.ttl:
+            self._remove(path)
+            return None
+
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        return entry['result']
+
+    def put(self, key: str, result: Dict) -> None:
+
+        tmp_path = os.path.join(self.cache_dir, f'.{uuid.uuid4().hex}.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump({'created_at': time.time(), 'result': result}, f)
+        os.replace(tmp_path, self._path(key))
+
+        self.evict()
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            # removed by another worker in the meantime
+            pass
+
+    def evict(self) -> None:
+
+        now = time.time()
+        entries = []
+        total_size = 0
+        for entry in os.scandir(self.cache_dir):
+            if not entry.name.endswith('.json'):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            # mtime is refreshed on access, a file untouched for ttl seconds is expired for sure:
+            if now - stat.st_mtime > self.ttl:
+                self._remove(entry.path)
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total_size += stat.st_size
+
+        for _, entry_size, path in sorted(entries):
+            if total_size <= self.max_bytes:
+                break
+            logging.info(f'Evicting calibration result cache entry {os.path.basename(path)}')
+            self._remove(path)
+            total_size -= entry_size
+
+
+cache = ResultCache(
+    cache_dir=os.environ.get('MHPDT_RESULT_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'mhpdt-calibration-results')),
+    max_bytes=int(os.environ.get('MHPDT_RESULT_CACHE_MAX_BYTES', 64 * 1024 ** 2)),
+    ttl=float(os.environ.get('MHPDT_RESULT_CACHE_TTL', 7 * 24 * 3600)),
+)
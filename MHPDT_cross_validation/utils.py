@@ -1,8 +1,12 @@
 import numpy as np
 import pandas as pd
+import pyarrow as pa
 import logging
 from typing import Tuple,List,Dict
 
+import features
+from features import magnitude_highpass, linear_acceleration, gravity_free_magnitude
+
 def generate_basic_df(accelerations: List[Dict]) -> pd.DataFrame:
     """
 
@@ -26,72 +30,143 @@ def generate_basic_df(accelerations: List[Dict]) -> pd.DataFrame:
 
     return df
 
-def magnitude_highpass(df: pd.DataFrame, axes: List = ['x', 'y', 'z'], window_size: str = '3s') -> np.array:
+ARROW_STREAM_CONTENT_TYPE = 'application/vnd.apache.arrow.stream'
+
+def accelerations_to_arrow_stream(df: pd.DataFrame, compression: str = 'zstd') -> bytes:
     """
 
     Parameters
     ----------
-    df              input pd.Dataframe
-    axes            axes to include in magnitude highpass calculation
-    window_size     size of rolling window, e.g. 3 or '3s'
+    df              accelerations DataFrame with timestamp index and x, y, z columns
+    compression     Arrow IPC buffer compression: 'zstd', 'lz4' or None
 
-    Returns         np.array of magnitude highpass values
+    Returns         Arrow IPC stream with timestamp[ns] and float64 x, y, z columns
     -------
 
+    Binary alternative of the downTimeCalibrationData JSON array, see generate_basic_df_from_arrow.
+
     """
 
-    mhp = df[axes].values - df[axes].rolling(window=window_size).mean().values
-    # magnitude calculation:
-    mhp = np.sqrt(np.sum(np.power(mhp, 2), axis=1))
+    table = pa.table({
+        'timestamp': pa.array(df.index.values.astype('datetime64[ns]'), type=pa.timestamp('ns')),
+        'x': df['x'].to_numpy(dtype=np.float64),
+        'y': df['y'].to_numpy(dtype=np.float64),
+        'z': df['z'].to_numpy(dtype=np.float64),
+    })
 
-    return mhp
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema, options=pa.ipc.IpcWriteOptions(compression=compression)) as writer:
+        writer.write_table(table)
 
+    return sink.getvalue().to_pybytes()
 
-def linear_acceleration(data_array: np.array, alpha: float = 0.8) -> np.array:
+def generate_basic_df_from_arrow(body: bytes) -> pd.DataFrame:
     """
 
     Parameters
     ----------
-    data_array
-    alpha
+    body        Arrow IPC stream (optionally compressed) with a timestamp column, either timestamp typed
+                or int64 nanoseconds since epoch, and x, y, z columns
 
-    Returns
+    Returns     basic pd.DataFrame with timestamp as index, same as generate_basic_df
     -------
 
     """
 
-    gravity = np.ones_like(data_array) * data_array.values[0]
-    for i in range(data_array.size)[1:]:
-        # gravity can be considered as the low passed version of
-        # the signal (using exponential smoothing):
-        gravity[i] = alpha * gravity[i - 1] + (1 - alpha) * data_array[i]
+    table = pa.ipc.open_stream(pa.py_buffer(body)).read_all()
 
-    gravity = pd.Series(gravity, index=data_array.index)
+    timestamps = table.column('timestamp')
+    if pa.types.is_integer(timestamps.type):
+        timestamps = timestamps.to_numpy().astype(np.int64).view('datetime64[ns]')
+    else:
+        timestamps = timestamps.to_numpy().astype('datetime64[ns]')
 
-    gravity_free_acceleration = data_array - gravity
+    df = pd.DataFrame({axis: table.column(axis).to_numpy().astype(np.float64) for axis in ['x', 'y', 'z']},
+                      index=pd.DatetimeIndex(timestamps, name='timestamp'))
 
-    return gravity_free_acceleration
+    return df
 
+def _parse_csv_timestamps(timestamps: pd.Series) -> pd.Series:
+    try:
+        return pd.to_datetime(timestamps, format='%Y-%m-%dT%H:%M:%S.%f')
+    except ValueError:
+        # exports drop the fraction of whole seconds, which newer pandas no longer accept for %f
+        whole_seconds = ~timestamps.str.contains('.', regex=False)
+        return pd.to_datetime(timestamps.where(~whole_seconds, timestamps + '.0'), format='%Y-%m-%dT%H:%M:%S.%f')
 
-def gravity_free_magnitude(df: pd.DataFrame, alpha: float = 0.8):
+def read_accelerations_csv(filepath_or_buffer, chunksize: int = 100000, axis_dtype=np.float64) -> pd.DataFrame:
     """
 
     Parameters
     ----------
-    df
-    alpha
+    filepath_or_buffer  accelerations CSV (timestamp,x,y,z) file path or binary/text file-like object
+    chunksize           number of rows parsed at a time
+    axis_dtype          dtype of the x, y, z columns
 
-    Returns
+    Returns             basic pd.DataFrame with timestamp as index
     -------
 
+    The CSV is parsed in chunks with fixed column types, so peak memory stays close to the size of the
+    resulting arrays instead of several times the size of the text.
+
+    """
+
+    timestamp_chunks = []
+    axes_chunks = []
+
+    reader = pd.read_csv(filepath_or_buffer,
+                         sep=',',
+                         usecols=['timestamp', 'x', 'y', 'z'],
+                         dtype={'timestamp': str, 'x': axis_dtype, 'y': axis_dtype, 'z': axis_dtype},
+                         chunksize=chunksize)
+    for chunk in reader:
+        timestamps = _parse_csv_timestamps(chunk['timestamp'])
+        timestamp_chunks.append(timestamps.values.astype('datetime64[ns]').view(np.int64))
+        axes_chunks.append(chunk[['x', 'y', 'z']].to_numpy(dtype=axis_dtype))
+
+    if not timestamp_chunks:
+        return pd.DataFrame(columns=['x', 'y', 'z'], dtype=axis_dtype, index=pd.DatetimeIndex([], name='timestamp'))
+
+    index = pd.DatetimeIndex(np.concatenate(timestamp_chunks).view('datetime64[ns]'), name='timestamp')
+    df = pd.DataFrame(np.concatenate(axes_chunks), index=index, columns=['x', 'y', 'z'])
+
+    return df
+
+def merge_accelerations(frames: List[pd.DataFrame]) -> pd.DataFrame:
+    """
+
+    Parameters
+    ----------
+    frames      basic accelerations DataFrames (timestamp index, x, y, z columns), e.g. consecutive
+                exports of the same sensor
+
+    Returns     one basic DataFrame with the samples of all frames ordered by timestamp, of samples
+    -------     sharing a timestamp only the first one is kept: within a frame the first row, across
+                frames that of the frame starting first (of frames starting together, the first given)
+
+    The frames are concatenated in the order of their first timestamp and sorted with a stable sort
+    on the int64 timestamps. Timsort merges the already sorted runs, so this is a k-way merge:
+    O(n) for non overlapping exports, O(n log k) for k interleaved ones.
+
     """
 
-    df_gravity_free = df[['x', 'y', 'z']].copy()
-    for axis in ['x', 'y', 'z']:
-        df_gravity_free[axis] = linear_acceleration(df_gravity_free[axis].copy(), alpha=alpha)
-    magnitude = np.sqrt(df_gravity_free.pow(2).sum(axis=1))
+    frames = [df for df in frames if not df.empty]
+    if not frames:
+        return pd.DataFrame(columns=['x', 'y', 'z'], dtype=np.float64, index=pd.DatetimeIndex([], name='timestamp'))
+
+    frames = sorted(frames, key=lambda df: df.index[0])
+    timestamps = np.concatenate([df.index.values.astype('datetime64[ns]').view(np.int64) for df in frames])
+    axes = np.concatenate([df[['x', 'y', 'z']].to_numpy() for df in frames])
 
-    return magnitude
+    order = np.argsort(timestamps, kind='stable')
+    timestamps = timestamps[order]
+    unique = np.ones(timestamps.size, dtype=bool)
+    unique[1:] = timestamps[1:] != timestamps[:-1]
+    if not unique.all():
+        logging.info(f'dropping {np.count_nonzero(~unique)} samples with duplicate timestamps')
+
+    index = pd.DatetimeIndex(timestamps[unique].view('datetime64[ns]'), name='timestamp')
+    return pd.DataFrame(axes[order[unique]], index=index, columns=['x', 'y', 'z'])
 
 def add_features_to_df(df: pd.DataFrame, **kwargs) -> pd.DataFrame:
     """
@@ -107,14 +182,11 @@ def add_features_to_df(df: pd.DataFrame, **kwargs) -> pd.DataFrame:
 
     alpha = kwargs.get('alpha', 0.8)
     mhp_window_size = kwargs.get('mhp_window_size', '3s')
+    feature_names = kwargs.get('features', ['magnitude', 'mhp', 'no_gravity'])
 
     logging.info(f'using parameters mhp_window_size: {mhp_window_size} and alpha: {alpha}')
 
-    df['magnitude'] = np.sqrt(df.x ** 2 + df.y ** 2 + df.z ** 2)
-    df['mhp'] = magnitude_highpass(df, window_size=mhp_window_size)
-    df['no_gravity'] = gravity_free_magnitude(df, alpha=alpha)
-
-    return df
+    return features.compute_features(df, feature_names, mhp_window_size=mhp_window_size, alpha=alpha)
 
 def std_based_state_flipping(feature_series, state_series):
     flipped_states = np.zeros(state_series.size)
@@ -1,5 +1,6 @@
 import json
 import logging, sys
+import os
 import dash
 from dash.dependencies import Input, Output, State
 import dash_core_components as dcc
@@ -9,6 +10,7 @@ from dash.exceptions import PreventUpdate
 import requests
 import pandas as pd
 import dash_utils
+import calibration_client
 import charts
 import plotly.graph_objs as go
 from plotly.subplots import make_subplots
@@ -42,6 +44,7 @@ app.layout = html.Div(
         dcc.Store(id="dataframe-json-storage"),
         dcc.Store(id="mhpdt-calibration-period-storage"),
         dcc.Store(id="mhpdt-calibration-param-storage"),
+        dcc.Store(id="mhpdt-calibration-job-storage"),
     ]
 )
 
@@ -54,8 +57,7 @@ app.layout = html.Div(
 )
 def update_output(list_of_contents, list_of_names, list_of_dates):
     if list_of_contents is not None:
-        children = [dash_utils.parse_contents(c, n, d) for c, n, d in zip(list_of_contents, list_of_names, list_of_dates)]
-        return children
+        return dash_utils.parse_uploads(list_of_contents, list_of_names, list_of_dates)
 
 
 @app.callback(Output("main-tabs", "value"), Input("dataframe-json-storage", "data"))
@@ -68,14 +70,27 @@ def init_tab_switch_on_upload(data):
         return "acceleration-charts-tab"
 
 
-@app.callback(Output("mag-mhp-subplot-graph", "figure"), Input("dataframe-json-storage", "data"))
-def update_mhp_chart(json_data):
+@app.callback(
+    Output("mag-mhp-subplot-graph", "figure"),
+    Input("dataframe-json-storage", "data"),
+    Input("mag-mhp-subplot-graph", "relayoutData"),
+)
+def update_mhp_chart(json_data, relayoutData):
 
     if json_data is None:
         raise PreventUpdate
 
-    df = dash_utils.load_df_from_local_storage(json_data)
-    fig = charts.generate_subplots_chart(df)
+    ctx = dash.callback_context
+    trigger_id = ctx.triggered[0]["prop_id"].split(".")[0] if ctx.triggered else None
+
+    x_range = None
+    if trigger_id == "mag-mhp-subplot-graph":
+        if relayoutData is None or not dash_utils.is_x_range_change(relayoutData):
+            raise PreventUpdate
+        x_range = dash_utils.x_range_from_relayout(relayoutData)
+
+    df = dash_utils.load_df_from_local_storage(json_data, feature_names=["magnitude", "mhp"])
+    fig = charts.generate_subplots_chart(df, x_range=x_range, uirevision=json_data[0])
 
     return fig
 
@@ -99,7 +114,7 @@ def update_rangeselector_chart(json_data, n_clicks, start_date_str, end_date_str
     if json_data is None:
         raise PreventUpdate
 
-    df = dash_utils.load_df_from_local_storage(json_data)
+    df = dash_utils.load_df_from_local_storage(json_data, feature_names=["mhp"])
 
     fail_div_msg = None
     relayoutData = None
@@ -170,60 +185,103 @@ def update_slider_output_values(relayoutData, json_data, calibration_period):
     return output_message_div, calibration_period
 
 
+def submit_mhpdt_calibration_job(acceleration_data: pd.DataFrame) -> requests.Response:
+    # "arrow": compressed Arrow IPC stream body, "json": gzip compressed downTimeCalibrationData JSON body
+    wire_format = os.environ.get("CALIBRATION_WIRE_FORMAT", "arrow")
+
+    if wire_format == "arrow":
+        return calibration_client.client.post(
+            "api/MHPDT_cross_validation/submit",
+            headers={"Content-Type": dash_utils.utils.ARROW_STREAM_CONTENT_TYPE},
+            data=dash_utils.utils.accelerations_to_arrow_stream(acceleration_data),
+        )
+
+    calibration_json = dash_utils.accelerations_csv_to_json(acceleration_data, json_attribute="downTimeCalibrationData", file_path=None)
+    return calibration_client.client.post_json("api/MHPDT_cross_validation/submit", calibration_json)
+
+
 @app.callback(
     Output(component_id="mhpdt-results-div", component_property="children"),
+    Output(component_id="mhpdt-calibration-progress-div", component_property="children"),
+    Output(component_id="mhpdt-calibration-job-storage", component_property="data"),
+    Output(component_id="mhpdt-calibration-poll-interval", component_property="disabled"),
+    Output(component_id="mhpdt-calibration-param-storage", component_property="data"),
     [
         Input(component_id="button-mhpdt-calibration", component_property="n_clicks"),
+        Input(component_id="mhpdt-calibration-poll-interval", component_property="n_intervals"),
+        Input(component_id="button-cancel-mhpdt-calibration", component_property="n_clicks"),
         State(component_id="dataframe-json-storage", component_property="data"),
         State(component_id="mhpdt-calibration-period-storage", component_property="data"),
+        State(component_id="mhpdt-calibration-job-storage", component_property="data"),
     ],
 )
-def click_button_call_mhpdt_calibration(n_clicks, json_data, calibration_period_json):
+def click_button_call_mhpdt_calibration(n_clicks, n_intervals, n_clicks_cancel, json_data, calibration_period_json, job_id):
+    """
+    Calibrations run as asynchronous jobs of the azure function: the run button submits the job,
+    the poll interval is enabled while the job runs and fetches its progress and, once finished,
+    its result. The cancel button cancels the running job, so does running a new calibration while
+    one is still running: only the latest job is polled.
+    """
+
+    triggered = [prop["prop_id"] for prop in dash.callback_context.triggered]
+    job_path = "api/MHPDT_cross_validation"
+
+    if "button-mhpdt-calibration.n_clicks" in triggered:
+        if n_clicks is None or json_data is None:
+            raise PreventUpdate
 
-    if n_clicks is None:
-        raise PreventUpdate
+        calibration_period = dash_utils.load_calibration_period_from_local_storage(calibration_period_json)
+        df = dash_utils.load_df_from_local_storage(json_data)
+        acceleration_data = df.copy().loc[calibration_period].round(3)
 
-    if json_data is None:
+        try:
+            if job_id is not None:
+                # the previous job would keep running unpolled, holding a function worker thread
+                calibration_client.client.post(f"{job_path}/cancel", params={"job_id": job_id})
+            r = submit_mhpdt_calibration_job(acceleration_data)
+        except requests.exceptions.RequestException:
+            return dash.no_update, "Unable to connect to server hosting azure functions.", None, True, dash.no_update
+        if r.status_code != 202:
+            return dash.no_update, r.text, None, True, dash.no_update
+
+        job = r.json()
+        return dash.no_update, f"Calibration {job['status']}", job["job_id"], False, dash.no_update
+
+    if job_id is None:
         raise PreventUpdate
 
-    calibration_period = dash_utils.load_calibration_period_from_local_storage(calibration_period_json)
-    df = dash_utils.load_df_from_local_storage(json_data)
-
-    acceleration_data = df.copy().loc[calibration_period].round(3)
-    calibration_json = dash_utils.accelerations_csv_to_json(acceleration_data, json_attribute="downTimeCalibrationData", file_path=None)
-
-    azure_func_url = os.environ.get("AZURE_FUNC_URL", "http://localhost:7071")
+    if "button-cancel-mhpdt-calibration.n_clicks" in triggered:
+        try:
+            calibration_client.client.post(f"{job_path}/cancel", params={"job_id": job_id})
+        except requests.exceptions.RequestException:
+            return dash.no_update, "Unable to connect to server hosting azure functions.", dash.no_update, dash.no_update, dash.no_update
+        return dash.no_update, "Calibration cancelled", None, True, dash.no_update
 
-    calibration_result=None
     try:
-        r = requests.post(
-            f"{azure_func_url}/api/MHPDT_cross_validation",
-            headers={"Content-Type": "application/json"},
-            json=calibration_json,
-        )
-    except requests.exceptions.RequestException as e:
-        calibration_result = "Unable to connect to server hosting azure functions."
-        r = None
+        r = calibration_client.client.get(f"{job_path}/result", params={"job_id": job_id})
+    except requests.exceptions.RequestException:
+        # keep polling, the function host may be restarting
+        return dash.no_update, "Unable to connect to server hosting azure functions.", dash.no_update, False, dash.no_update
 
-    if r:
-        try:
-            calibration_result = r.json()
-        except ValueError:
-            calibration_result = r.text
-
-    str_result = str(calibration_result)
-    return html.Div(str_result, style={"margin-left": "80px"})
+    if r.status_code == 202:
+        job = r.json()
+        progress = job["progress"]
+        stage = f"{job['stage']} {progress['completed']}/{progress['total']}" if progress["total"] else job["stage"] or ""
+        return dash.no_update, f"Calibration {job['status']}: {stage}", dash.no_update, False, dash.no_update
 
+    if r.status_code != 200:
+        return dash.no_update, r.text, None, True, dash.no_update
 
-@app.callback(
-    Output("mhpdt-calibration-param-storage", "data"),
-    Input(component_id="mhpdt-results-div", component_property="children"),
-)
-def store_mhpdt_calibration_parameters(input_data):
-    if input_data is None:
-        raise PreventUpdate
+    try:
+        calibration_result = r.json()
+    except ValueError:
+        return dash.no_update, r.text, None, True, dash.no_update
 
-    return input_data["props"]
+    logger.info(f"Calibration client latencies: {calibration_client.client.metrics()}")
+    # the charts read the parameters from the stored response, the div only displays it
+    str_result = json.dumps(calibration_result)
+    status = "Calibration succeeded (cached result)" if r.headers.get("X-Calibration-Cache") == "hit" else "Calibration succeeded"
+    return html.Div(str_result, style={"margin-left": "80px"}), status, None, True, calibration_result
 
 
 @app.callback(
@@ -241,14 +299,11 @@ def plot_mhpdt_calibration_results(calibration_params, json_data, calibration_pe
 
     calibration_period = dash_utils.load_calibration_period_from_local_storage(calibration_period_json)
 
-    df = dash_utils.load_df_from_local_storage(json_data)
-    df_calibration = df.copy().loc[calibration_period].round(3)
+    df_calibration = dash_utils.load_calibration_features(json_data, calibration_period.start, calibration_period.stop)
 
-    if "calibration_score" in calibration_params["children"]:
+    if "calibration_score" in calibration_params:
 
-        # convert calibration params:
-        params_json_format = calibration_params["children"].replace("'", '"')
-        params = json.loads(params_json_format)
+        params = calibration_params
         # generate figure
         params["model_params"]["first_filter"] = "down"
         fig = charts.generate_mhpdt_calibration_chart(df_calibration, params)
@@ -274,14 +329,11 @@ def plot_mhpdt_calibration_applied_to_whole_period(n_clicks, df_json_data, calib
     if calibration_params is None:
         raise PreventUpdate
 
-    df = dash_utils.load_df_from_local_storage(df_json_data)
-    df_calibration = df.copy().round(3)
+    df_calibration = dash_utils.load_calibration_features(df_json_data)
 
-    if "calibration_score" in calibration_params["children"]:
+    if "calibration_score" in calibration_params:
 
-        # convert calibration params:
-        params_json_format = calibration_params["children"].replace("'", '"')
-        params = json.loads(params_json_format)
+        params = calibration_params
         # generate figure
         fig = charts.generate_mhpdt_calibration_chart(df_calibration, params)
 
@@ -305,7 +357,8 @@ def update_evaluate_chart(n_clicks, json_data, eval_expression):
     elif json_data is None:
         raise PreventUpdate
     else:
-        df = dash_utils.load_df_from_local_storage(json_data).round(3)
+        feature_names = dash_utils.features_referenced_by(eval_expression)
+        df = dash_utils.load_df_from_local_storage(json_data, feature_names=feature_names).round(3)
         df_plot = None
         try:
             df_plot = df.eval(eval_expression, inplace=False)
@@ -316,7 +369,7 @@ def update_evaluate_chart(n_clicks, json_data, eval_expression):
 
         if df_plot is not None:
             fig = go.Figure()
-            fig.add_scatter(x=df_plot.index, y=df_plot.values, name=df_plot.name, showlegend=True)
+            charts.add_downsampled_scatter(fig, df_plot.index, df_plot, name=df_plot.name, showlegend=True)
             fig.update_layout(title=f"Acceleration's feature chart from '{eval_expression}' evaluated expression")
         else:
             fig = go.Figure()
@@ -388,14 +441,11 @@ def update_custom_model_chart(n_clicks_plot, n_clicks_clear, fig, checklist, df_
             },
             "period": model_param_args[6],
         }
-        df = dash_utils.load_df_from_local_storage(df_json)
         if params["period"] == "calibration":
             # filter df:
-            start_date_str = period_json["start"]
-            end_date_str = period_json["stop"]
-            start_date = pd.to_datetime(start_date_str)
-            end_date = pd.to_datetime(end_date_str)
-            df = df[(df.index > start_date) & (df.index < end_date)]
+            df = dash_utils.load_calibration_features(df_json, period_json["start"], period_json["stop"], inclusive=False)
+        else:
+            df = dash_utils.load_calibration_features(df_json)
 
         fig = charts.generate_custom_mhpdt_chart(fig, df, params, n_clicks_plot, add_feature_data)
 
@@ -435,11 +485,9 @@ def update_mhpdt_param_inputs(n_clicks_reset, n_clicks_load, params_json):
         if params_json is None:
             raise PreventUpdate
 
-        if "calibration_score" in params_json["children"]:
+        if "calibration_score" in params_json:
 
-            # convert calibration params:
-            params_json_format = params_json["children"].replace("'", '"')
-            params = json.loads(params_json_format)
+            params = params_json
 
             thr = params["model_params"]["mhp_threshold"]
             min_cyc = params["model_params"]["min_cycle_time"]
@@ -0,0 +1,223 @@
+"""
+Headless batch calibration of a directory of survey CSVs, without the dashboard or the azure function.
+
+Every *_accelerations.csv file (timestamp,x,y,z) found in the directory is calibrated as a whole with
+the pipeline of the MHPDT_cross_validation function (HMM tagging and parameter optimization), in a
+pool of worker processes. One JSON line per file is appended to the report as soon as the file is
+done, so an interrupted run picks up where it stopped when started again with the same report.
+
+usage: python batch_calibrate.py <survey directory> [--report calibrations.jsonl] [--parquet calibrations.parquet]
+       python batch_calibrate.py --help
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "MHPDT_cross_validation"))
+import utils
+import calibration
+
+logger = logging.getLogger(__name__)
+
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+def _file_state(path: str) -> Dict:
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def calibrate_file(path: str, options: Dict) -> Dict:
+    """
+    Calibrates the survey CSV at path, returns its report record. Failures are reported in the record.
+    """
+
+    record = {"file": path, **_file_state(path)}
+    start = time.perf_counter()
+    try:
+        # rounded like the dashboard rounds the calibration data it sends
+        df = utils.read_accelerations_csv(path).round(3)
+        df = df.sort_index(kind="stable")
+        parsed = time.perf_counter()
+        record["samples"] = len(df)
+        if df.empty:
+            raise calibration.CalibrationError("survey holds no samples")
+
+        record["result"] = calibration.run_calibration(df, options)
+        record["status"] = SUCCEEDED
+        record["timings"] = {"parse_seconds": parsed - start, "calibration_seconds": time.perf_counter() - parsed}
+    except Exception as e:
+        record.update(status=FAILED, error=f"{type(e).__name__}: {e}")
+
+    record["total_seconds"] = time.perf_counter() - start
+    return record
+
+
+def completed_files(report_path: str, retry_failed: bool = False) -> Dict[str, Dict]:
+    """
+    Records of the report by file, the files calibrated by an earlier (interrupted) run. Failed files
+    are left out with retry_failed. A partially written last line (run killed while writing) is ignored.
+    """
+
+    completed = {}
+    if not os.path.exists(report_path):
+        return completed
+
+    with open(report_path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if retry_failed and record["status"] == FAILED:
+                completed.pop(record["file"], None)
+                continue
+            completed[record["file"]] = record
+
+    return completed
+
+
+def write_parquet_report(report_path: str, parquet_path: str) -> None:
+    """
+    Writes the report records, the latest one per file, as a flat table (nested attributes as dotted columns).
+    """
+
+    with open(report_path) as f:
+        records = {}
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            records[record["file"]] = record
+
+    df = pd.json_normalize(list(records.values()))
+    # lists such as the fitted hmm_params do not fit a flat column
+    for column in df.columns:
+        if df[column].map(lambda value: isinstance(value, (list, dict))).any():
+            df[column] = df[column].map(json.dumps)
+    df.to_parquet(parquet_path, index=False)
+
+
+def _shutdown_now(executor: ProcessPoolExecutor, futures) -> None:
+    """
+    Cancels the calibrations not started yet and returns without waiting for the running ones, which
+    are interrupted by the same Ctrl+C.
+    """
+
+    for future in futures:
+        future.cancel()
+    try:
+        executor.shutdown(wait=False, cancel_futures=True)
+    except TypeError:
+        # cancel_futures is new in python 3.9, the futures are cancelled above
+        executor.shutdown(wait=False)
+
+
+def _positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"{value} is not a positive number")
+    return number
+
+
+def _grid_threshold_step(value: str) -> float:
+    step = float(value)
+    # also rejects nan
+    if not calibration.MIN_GRID_THRESHOLD_STEP <= step <= calibration.MAX_GRID_THRESHOLD_STEP:
+        raise argparse.ArgumentTypeError(
+            f"{value} is not in [{calibration.MIN_GRID_THRESHOLD_STEP}, {calibration.MAX_GRID_THRESHOLD_STEP}]"
+        )
+    return step
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Calibrates every survey CSV of a directory with the MHPDT calibration pipeline.")
+    parser.add_argument("directory", help="directory searched (recursively) for survey CSVs")
+    parser.add_argument("--pattern", default="*_accelerations.csv", help="file name pattern of the survey CSVs")
+    parser.add_argument("--report", default="calibrations.jsonl", help="JSON lines report, appended to and used to resume")
+    parser.add_argument("--parquet", default=None, help="also write the report as a Parquet file once done")
+    parser.add_argument("--workers", type=_positive_int, default=os.cpu_count() or 1, help="worker processes calibrating files")
+    parser.add_argument("--retry-failed", action="store_true", help="calibrate the files failed in an earlier run again")
+    parser.add_argument("--method", default="bayesian", choices=calibration.OPTIMIZATION_METHODS)
+    parser.add_argument("--grid-threshold-step", type=_grid_threshold_step, default=0.05, help="threshold step of the grid method")
+    parser.add_argument("--hmm-warm-start", action="store_true", help="warm start the HMM fit from a decimated pre-fit")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+
+    options = calibration.calibration_options(
+        {
+            "method": args.method,
+            "grid_threshold_step": args.grid_threshold_step,
+            "hmm_warm_start": args.hmm_warm_start,
+        }
+    )
+    # one calibration per worker process, its optimizer runs serially:
+    options["optimizer_workers"] = 1
+
+    paths = sorted(os.path.abspath(path) for path in glob.glob(os.path.join(args.directory, "**", args.pattern), recursive=True))
+    completed = completed_files(args.report, retry_failed=args.retry_failed)
+    # a file changed since its calibration is calibrated again:
+    pending = [
+        path for path in paths if path not in completed or _file_state(path) != {k: completed[path][k] for k in ("size", "mtime_ns")}
+    ]
+    logger.info(f"{len(paths)} surveys found, {len(paths) - len(pending)} already calibrated, {len(pending)} to calibrate")
+
+    # terminate a line left partially written by a killed run, it is skipped when resuming
+    if os.path.exists(args.report) and os.path.getsize(args.report) > 0:
+        with open(args.report, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            truncated = f.read(1) != b"\n"
+        if truncated:
+            with open(args.report, "a") as report:
+                report.write("\n")
+
+    failed = 0
+    # not a with block: leaving it on an interrupt would wait for every queued calibration
+    executor = ProcessPoolExecutor(max_workers=args.workers)
+    with open(args.report, "a") as report:
+        futures = [executor.submit(calibrate_file, path, options) for path in pending]
+        try:
+            for done, future in enumerate(as_completed(futures), start=1):
+                record = future.result()
+                report.write(json.dumps(record) + "\n")
+                report.flush()
+
+                failed += record["status"] == FAILED
+                message = record.get("error") or f"calibration_score {record['result']['calibration_score']}"
+                logger.info(f"[{done}/{len(pending)}] {record['file']} {record['status']} in {record['total_seconds']:.1f} s: {message}")
+        except KeyboardInterrupt:
+            logger.info("interrupted, run again with the same report to resume")
+            _shutdown_now(executor, futures)
+            return 130
+    executor.shutdown()
+
+    if args.parquet:
+        write_parquet_report(args.report, args.parquet)
+        logger.info(f"report written to {args.parquet}")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    # progress of the batch only, the per step messages of the calibration pipeline are left out
+    logging.basicConfig(
+        format="[%(asctime)s %(levelname)s] %(message)s",
+        datefmt="%m/%d/%Y %I:%M:%S %p",
+        level=logging.WARNING,
+        handlers=[logging.StreamHandler(sys.stdout)],
+    )
+    logger.setLevel(logging.INFO)
+    sys.exit(main())
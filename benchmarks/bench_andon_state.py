@@ -0,0 +1,46 @@
+"""
+Benchmark of the array based andon state machine against the original row by row implementation,
+on the bundled test_data survey. Their equivalence is tested in tests/test_andon_state.py.
+
+usage: python benchmarks/bench_andon_state.py
+"""
+import os
+import sys
+import timeit
+
+import pandas as pd
+
+repo_path = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, os.path.join(repo_path, "MHPDT_cross_validation"))
+sys.path.insert(0, os.path.join(repo_path, "tests"))
+import utils
+import mhpdt_cross_validation as mhpdt_cv
+from test_andon_state import andon_state_from_mhpdt_loop
+
+SURVEY_PATH = os.path.join(repo_path, "test_data", "survey_1d4911c5-477d-4a4a-882a-43035fa7b0d5_accelerations.csv")
+
+
+def load_survey() -> pd.DataFrame:
+    df = pd.read_csv(SURVEY_PATH, sep=",")
+    df["timestamp"] = pd.to_datetime(df.timestamp, format="%Y-%m-%dT%H:%M:%S.%f")
+    df = df.set_index("timestamp").round(3)
+    df = utils.add_features_to_df(df, mhp_window_size="6s")
+    return utils.drop_transient_mhp_window_sized_data(df, mhp_window_size="6s")
+
+
+def main():
+    df = load_survey()
+
+    df_cycles = mhpdt_cv.fast_MHPDT(df, threshold=0.5)
+    andon_threshold = pd.Timedelta(seconds=5)
+    number = 10
+    loop_time = timeit.timeit(lambda: andon_state_from_mhpdt_loop(df_cycles.copy(), andon_threshold), number=number) / number
+    array_time = timeit.timeit(lambda: mhpdt_cv.andon_state_from_mhpdt(df_cycles, andon_threshold), number=number) / number
+
+    print(f"{len(df)} samples")
+    print(f"row by row: {loop_time * 1e3:.3f} ms")
+    print(f"array based: {array_time * 1e3:.3f} ms ({loop_time / array_time:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""
+Benchmark of the IIR filter based gravity removal against the original exponential smoothing loop,
+on the bundled test_data survey. Their equivalence is tested in tests/test_linear_acceleration.py.
+
+usage: python benchmarks/bench_linear_acceleration.py
+"""
+import os
+import sys
+import timeit
+
+import pandas as pd
+
+repo_path = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, os.path.join(repo_path, "MHPDT_cross_validation"))
+sys.path.insert(0, os.path.join(repo_path, "tests"))
+import utils
+from test_linear_acceleration import gravity_free_magnitude_loop
+
+SURVEY_PATH = os.path.join(repo_path, "test_data", "survey_1d4911c5-477d-4a4a-882a-43035fa7b0d5_accelerations.csv")
+
+
+def load_survey() -> pd.DataFrame:
+    df = pd.read_csv(SURVEY_PATH, sep=",")
+    df["timestamp"] = pd.to_datetime(df.timestamp, format="%Y-%m-%dT%H:%M:%S.%f")
+    return df.set_index("timestamp")
+
+
+def main():
+    df = load_survey()
+
+    number = 5
+    loop_time = timeit.timeit(lambda: gravity_free_magnitude_loop(df), number=number) / number
+    iir_time = timeit.timeit(lambda: utils.gravity_free_magnitude(df), number=number) / number
+
+    print(f"{len(df)} samples")
+    print(f"exponential smoothing loop: {loop_time * 1e3:.3f} ms")
+    print(f"IIR filter: {iir_time * 1e3:.3f} ms ({loop_time / iir_time:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Benchmark of run_parallel_optimization against the serial run_optimization on the bundled test_data
+survey, and of the process pool start-up that reusing the optimizer pool across calibrations saves.
+
+usage: python benchmarks/bench_parallel_optimization.py [n_workers]
+"""
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+repo_path = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, os.path.join(repo_path, "MHPDT_cross_validation"))
+import utils
+import hmm_tagging
+import mhpdt_cross_validation as mhpdt_cv
+
+SURVEY_PATH = os.path.join(repo_path, "test_data", "survey_1d4911c5-477d-4a4a-882a-43035fa7b0d5_accelerations.csv")
+
+
+def load_survey():
+    df = utils.read_accelerations_csv(SURVEY_PATH).round(3)
+    df = utils.add_features_to_df(df, mhp_window_size="6s", features=["mhp"])
+    df = utils.drop_transient_mhp_window_sized_data(df, mhp_window_size="6s")
+    return df, hmm_tagging.generate_tagged_data(df)
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+def pool_start_up(n_workers: int) -> float:
+    # what every calibration paid when the pool was created per call: start the workers and run a first task on each
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        list(executor.map(np.sqrt, range(n_workers)))
+    return time.perf_counter() - start
+
+
+def main():
+    n_workers = int(sys.argv[1]) if len(sys.argv) > 1 else max(os.cpu_count() or 1, 2)
+    df, tagged_states = load_survey()
+    print(f"{len(df)} samples, {n_workers} workers, {os.cpu_count()} CPUs")
+
+    serial, serial_time = timed(lambda: mhpdt_cv.run_optimization(df, tagged_states))
+    print(f"run_optimization: {serial_time:.2f} s, score {serial.fun}")
+
+    first, first_time = timed(lambda: mhpdt_cv.run_parallel_optimization(df, tagged_states, n_workers=n_workers))
+    print(f"run_parallel_optimization, first call (pool start-up): {first_time:.2f} s, score {first.fun}")
+
+    times = []
+    for _ in range(3):
+        res, seconds = timed(lambda: mhpdt_cv.run_parallel_optimization(df, tagged_states, n_workers=n_workers))
+        assert res.x == first.x and res.fun == first.fun, "reused pool changed the optimization result"
+        times.append(seconds)
+    print(f"run_parallel_optimization, pool reused: {min(times):.2f} s")
+
+    start_up = min(pool_start_up(n_workers) for _ in range(3))
+    print(f"pool start-up saved per calibration: {start_up * 1e3:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""
+Benchmark of the calibration pipeline stages on synthetic surveys of increasing length and on the
+bundled test_data survey: wall time and peak memory per stage, and how the time of every stage
+scales with the number of samples.
+
+Stages:
+    features        utils.add_features_to_df, 6s window mhp as the calibration computes it
+    hmm_tagging     hmm_tagging.hmm_based_andon_tag, fit and decode
+    prediction      mhpdt_cv.andon_prediction_with_filtering
+    micro_filter    micro_filter.filtering of the predicted andon states
+    optimization    mhpdt_cv.run_optimization with --n-calls objective evaluations
+
+Peak memory is the tracemalloc peak of the stage (numpy and pandas buffers included), measured in a
+second run of the stage so tracing does not distort its time. Stages are skipped on surveys longer
+than their MAX_SAMPLES limit (see --no-limits).
+
+usage: python benchmarks/bench_pipeline.py [--sizes 1000 10000 100000 1000000] [--output results.jsonl]
+       python benchmarks/bench_pipeline.py --help
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+repo_path = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, os.path.join(repo_path, "MHPDT_cross_validation"))
+import utils
+import hmm_tagging
+import micro_filter
+import mhpdt_cross_validation as mhpdt_cv
+
+from synthetic import synthetic_survey
+
+SURVEY_PATH = os.path.join(repo_path, "test_data", "survey_1d4911c5-477d-4a4a-882a-43035fa7b0d5_accelerations.csv")
+
+STAGES = ["features", "hmm_tagging", "prediction", "micro_filter", "optimization"]
+# default maximum survey length per stage, beyond it a single run takes minutes:
+MAX_SAMPLES = {"features": 10_000_000, "hmm_tagging": 1_000_000, "prediction": 10_000_000, "micro_filter": 10_000_000, "optimization": 100_000}
+
+PARAMS = {
+    "model_params": {
+        "mhp_threshold": 0.1,
+        "andon_uptime_threshold": 5,
+        "up_filter_size": 30,
+        "down_filter_size": 30,
+        "first_filter": "down",
+    }
+}
+
+
+def load_test_survey() -> pd.DataFrame:
+    return utils.read_accelerations_csv(SURVEY_PATH).round(3)
+
+
+def measure(function, repeat: int = 1, memory: bool = True):
+    """
+    Returns the result of function(), its best wall time of repeat runs in seconds and its
+    tracemalloc peak in bytes (None without memory).
+    """
+
+    seconds = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        seconds = min(seconds, time.perf_counter() - start)
+
+    peak = None
+    if memory:
+        tracemalloc.start()
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return result, seconds, peak
+
+
+def run_stages(df: pd.DataFrame, stages, max_samples, n_calls: int, repeat: int, memory: bool):
+    """
+    Runs the pipeline on the basic accelerations DataFrame df, yields (stage, seconds, peak bytes) of
+    the requested stages. Stages the requested ones depend on run untimed.
+    """
+
+    def skipped(stage):
+        return stage not in stages or len(df) > max_samples[stage]
+
+    def features():
+        df_features = utils.add_features_to_df(df.copy(), mhp_window_size="6s", features=["mhp"])
+        return utils.drop_transient_mhp_window_sized_data(df_features, mhp_window_size="6s")
+
+    if skipped("features"):
+        df_features = features()
+    else:
+        df_features, seconds, peak = measure(features, repeat, memory)
+        yield "features", seconds, peak
+
+    need_tags = "optimization" in stages and len(df) <= max_samples["optimization"]
+    if not skipped("hmm_tagging"):
+        (_, state_seq), seconds, peak = measure(lambda: hmm_tagging.hmm_based_andon_tag(df_features, "mhp"), repeat, memory)
+        yield "hmm_tagging", seconds, peak
+        tagged_states = utils.std_based_state_flipping(df_features.mhp, pd.Series(state_seq, index=df_features.index))
+    elif need_tags:
+        tagged_states = hmm_tagging.generate_tagged_data(df_features)
+
+    if not skipped("prediction"):
+        _, seconds, peak = measure(lambda: mhpdt_cv.andon_prediction_with_filtering(df_features, PARAMS), repeat, memory)
+        yield "prediction", seconds, peak
+
+    if not skipped("micro_filter"):
+        df_states = mhpdt_cv.fast_MHPDT(df_features, threshold=PARAMS["model_params"]["mhp_threshold"])
+        df_states["state"] = mhpdt_cv.andon_state_from_mhpdt(df_states, andon_threshold=pd.Timedelta(seconds=5))
+
+        def filtering():
+            return micro_filter.filtering(df_states.copy(), andon_flag="state", up_filter_size="30s", down_filter_size="30s")
+
+        _, seconds, peak = measure(filtering, repeat, memory)
+        yield "micro_filter", seconds, peak
+
+    if need_tags:
+        # a single run, gp_minimize dominates and is seeded
+        _, seconds, peak = measure(lambda: mhpdt_cv.run_optimization(df_features, tagged_states, n_calls=n_calls), 1, memory)
+        yield "optimization", seconds, peak
+
+
+def scaling_exponent(samples, seconds) -> float:
+    # slope of log(time) over log(samples): 1 is linear scaling
+    if len(samples) < 2:
+        return float("nan")
+    return float(np.polyfit(np.log(samples), np.log(seconds), 1)[0])
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=repo_path, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Times the calibration pipeline stages on synthetic surveys.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000], help="synthetic survey lengths")
+    parser.add_argument("--stages", nargs="+", default=STAGES, choices=STAGES)
+    parser.add_argument("--no-limits", action="store_true", help="run every stage on every survey, ignoring the per stage length limits")
+    parser.add_argument("--sample-rate", type=float, default=5.0, help="synthetic sample rate in Hz")
+    parser.add_argument("--duty-cycle", type=float, default=0.6, help="fraction of the time the synthetic machine runs")
+    parser.add_argument("--noise", type=float, default=0.01, help="synthetic sensor noise in g")
+    parser.add_argument("--n-calls", type=int, default=10, help="objective evaluations of the optimization stage")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage, the best time is reported")
+    parser.add_argument("--no-memory", action="store_true", help="skip the peak memory measurement")
+    parser.add_argument("--no-test-survey", action="store_true", help="skip the bundled test_data survey")
+    parser.add_argument("--output", default=None, help="append the results as JSON lines, e.g. to track them across commits")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    max_samples = {stage: (sys.maxsize if args.no_limits else limit) for stage, limit in MAX_SAMPLES.items()}
+    memory = not args.no_memory
+
+    surveys = []
+    if not args.no_test_survey:
+        surveys.append(("test_data", load_test_survey))
+    for size in args.sizes:
+        surveys.append(
+            (
+                f"synthetic_{size}",
+                lambda size=size: synthetic_survey(size, sample_rate=args.sample_rate, duty_cycle=args.duty_cycle, noise=args.noise)[0],
+            )
+        )
+
+    revision = git_revision()
+    results = []
+    print(f"{'survey':<20} {'samples':>10} {'stage':<14} {'seconds':>10} {'peak MiB':>10}")
+    for survey, load in surveys:
+        df = load()
+        for stage, seconds, peak in run_stages(df, args.stages, max_samples, args.n_calls, args.repeat, memory):
+            peak_mib = peak / 1024 ** 2 if peak is not None else None
+            print(f"{survey:<20} {len(df):>10} {stage:<14} {seconds:>10.4f} {peak_mib if peak_mib is not None else float('nan'):>10.1f}")
+            results.append({"survey": survey, "samples": len(df), "stage": stage, "seconds": seconds, "peak_bytes": peak})
+
+    print("\nscaling with the number of samples (time ~ samples ^ exponent):")
+    for stage in args.stages:
+        synthetic = [r for r in results if r["stage"] == stage and r["survey"].startswith("synthetic")]
+        exponent = scaling_exponent([r["samples"] for r in synthetic], [r["seconds"] for r in synthetic])
+        print(f"  {stage:<14} {exponent:.2f}")
+
+    if args.output:
+        settings = {k: getattr(args, k) for k in ("sample_rate", "duty_cycle", "noise", "n_calls", "repeat")}
+        with open(args.output, "a") as f:
+            for result in results:
+                f.write(json.dumps({"revision": revision, "settings": settings, **result}) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Synthetic accelerometer surveys for the benchmarks: a machine alternating between running (vibrating)
+and stopped periods, recorded by a sensor tilted against gravity.
+"""
+import numpy as np
+import pandas as pd
+
+
+def synthetic_survey(
+    n_samples: int,
+    sample_rate: float = 5.0,
+    duty_cycle: float = 0.6,
+    mean_period: float = 300.0,
+    noise: float = 0.01,
+    vibration: float = 0.15,
+    seed: int = 314156,
+    start: str = "2021-05-07T00:00:00",
+):
+    """
+
+    Parameters
+    ----------
+    n_samples       number of samples
+    sample_rate     mean sample rate in Hz, sample intervals are jittered by +-20 %
+    duty_cycle      fraction of the time the machine runs
+    mean_period     mean length in seconds of a running plus a stopped period, period lengths are
+                    exponentially distributed
+    noise           standard deviation of the sensor noise, in g
+    vibration       amplitude of the vibration while running, in g
+    seed            random seed, the same arguments give the same survey
+    start           timestamp of the first sample
+
+    Returns         basic accelerations DataFrame (timestamp index, x, y, z columns) and the running
+    -------         state of every sample as pd.Series (1 running, 0 stopped)
+
+    """
+
+    rng = np.random.default_rng(seed)
+
+    intervals = rng.uniform(0.8, 1.2, n_samples) / sample_rate
+    intervals[0] = 0
+    seconds = np.cumsum(intervals)
+
+    # alternating stopped (even) / running (odd) periods until the survey is covered:
+    n_periods = int(2 * seconds[-1] / mean_period) + 2
+    lengths = rng.exponential(mean_period, n_periods)
+    while True:
+        durations = lengths * np.where(np.arange(len(lengths)) % 2 == 0, 1 - duty_cycle, duty_cycle)
+        if durations.sum() > seconds[-1]:
+            break
+        # more periods, drawn afresh so the alternation continues from the last one
+        lengths = np.append(lengths, rng.exponential(mean_period, n_periods))
+    period_index = np.searchsorted(np.cumsum(durations), seconds, side="right")
+    running = (period_index % 2).astype(np.int64)
+
+    # gravity seen by a tilted sensor, vibration of the running machine and sensor noise:
+    gravity = np.array([0.05, -0.05, -0.99])
+    phase = 2 * np.pi * rng.uniform(0.5, 2.0, 3) * seconds[:, np.newaxis]
+    axes = gravity + noise * rng.standard_normal((n_samples, 3))
+    axes += running[:, np.newaxis] * vibration * np.sin(phase + rng.uniform(0, 2 * np.pi, 3))
+
+    index = pd.DatetimeIndex(pd.Timestamp(start).value + (seconds * 1e9).astype(np.int64), name="timestamp")
+    df = pd.DataFrame(axes.round(3), index=index, columns=["x", "y", "z"])
+
+    return df, pd.Series(running, index=index, name="running")
@@ -0,0 +1,150 @@
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FUNC_URL = "http://localhost:7071"
+DEFAULT_POOL_SIZE = 10
+DEFAULT_CONNECT_TIMEOUT = 3.05
+DEFAULT_READ_TIMEOUT = 60.0
+DEFAULT_RETRIES = 3
+DEFAULT_RETRY_BACKOFF = 0.5
+# request bodies smaller than this are sent uncompressed:
+DEFAULT_GZIP_MIN_BYTES = 1024
+
+# gateway errors of a host that is starting or overloaded. A 500 is the function's answer, e.g. the
+# result of a failed calibration job, and would be answered again:
+RETRY_STATUS_CODES = (502, 503, 504)
+
+
+class CalibrationClient:
+    """
+    HTTP client of the MHPDT_cross_validation azure function.
+
+    All requests go through one requests.Session whose connection pool keeps connections to the
+    function host alive, so consecutive calibration requests (job submit, result polling) of a
+    dashboard worker reuse them. Every request has a connect and a read timeout. Connection errors,
+    e.g. while the function host is cold starting, are retried with exponential backoff before
+    surfacing as an exception. GET requests are also retried after read errors and the 5xx
+    responses of RETRY_STATUS_CODES. POST requests (job submit and cancel) are not: the function may have acted on them already,
+    and a failing calibration would fail again. JSON bodies are gzip compressed. The
+    latency of every request is recorded per endpoint, see metrics().
+    """
+
+    def __init__(
+        self,
+        base_url: str = DEFAULT_FUNC_URL,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+        read_timeout: float = DEFAULT_READ_TIMEOUT,
+        retries: int = DEFAULT_RETRIES,
+        retry_backoff: float = DEFAULT_RETRY_BACKOFF,
+        gzip_min_bytes: int = DEFAULT_GZIP_MIN_BYTES,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.gzip_min_bytes = gzip_min_bytes
+
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=retry_backoff,
+            status_forcelist=RETRY_STATUS_CODES,
+            # read errors and RETRY_STATUS_CODES responses are retried for these methods only, connection errors
+            # (request not sent) for all of them:
+            allowed_methods=frozenset(["GET"]),
+            # the last response is returned instead of raising, callers report its body:
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._metrics_lock = threading.Lock()
+        self._metrics = {}
+
+    def _record(self, endpoint: str, elapsed: float, failed: bool) -> None:
+
+        with self._metrics_lock:
+            metrics = self._metrics.setdefault(endpoint, {"requests": 0, "errors": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+            metrics["requests"] += 1
+            metrics["errors"] += int(failed)
+            metrics["total_seconds"] += elapsed
+            metrics["max_seconds"] = max(metrics["max_seconds"], elapsed)
+            metrics["last_seconds"] = elapsed
+
+    def request(self, method: str, path: str, **kwargs) -> requests.Response:
+        """
+        Sends a request to base_url/path through the pooled session, with the client timeouts unless
+        a timeout is passed. Raises requests.exceptions.RequestException once all retries failed.
+        """
+
+        kwargs.setdefault("timeout", self.timeout)
+        endpoint = f"{method} {path}"
+
+        start = time.perf_counter()
+        failed = True
+        try:
+            r = self.session.request(method, f"{self.base_url}/{path.lstrip('/')}", **kwargs)
+            failed = r.status_code >= 500
+            return r
+        finally:
+            elapsed = time.perf_counter() - start
+            self._record(endpoint, elapsed, failed)
+            logger.debug(f"{endpoint} took {elapsed:.3f} s")
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path: str, data: Optional[bytes] = None, headers: Optional[dict] = None, **kwargs) -> requests.Response:
+        return self.request("POST", path, data=data, headers=headers, **kwargs)
+
+    def post_json(self, path: str, body, **kwargs) -> requests.Response:
+        """
+        Posts body as JSON, gzip compressed (Content-Encoding: gzip) once it exceeds gzip_min_bytes.
+        """
+
+        data = json.dumps(body).encode("utf-8")
+        headers = {"Content-Type": "application/json"}
+        if len(data) >= self.gzip_min_bytes:
+            data = gzip.compress(data, compresslevel=6)
+            headers["Content-Encoding"] = "gzip"
+
+        return self.post(path, data=data, headers=headers, **kwargs)
+
+    def metrics(self) -> dict:
+        """
+        Returns per endpoint ("<METHOD> <path>") request count, error count (connection errors and
+        5xx responses after retries), total, mean, max and last latency in seconds.
+        """
+
+        with self._metrics_lock:
+            snapshot = {endpoint: dict(metrics) for endpoint, metrics in self._metrics.items()}
+
+        for metrics in snapshot.values():
+            metrics["mean_seconds"] = metrics["total_seconds"] / metrics["requests"]
+
+        return snapshot
+
+
+client = CalibrationClient(
+    base_url=os.environ.get("AZURE_FUNC_URL", DEFAULT_FUNC_URL),
+    pool_size=int(os.environ.get("CALIBRATION_POOL_SIZE", DEFAULT_POOL_SIZE)),
+    connect_timeout=float(os.environ.get("CALIBRATION_CONNECT_TIMEOUT", DEFAULT_CONNECT_TIMEOUT)),
+    read_timeout=float(os.environ.get("CALIBRATION_READ_TIMEOUT", DEFAULT_READ_TIMEOUT)),
+    retries=int(os.environ.get("CALIBRATION_RETRIES", DEFAULT_RETRIES)),
+    retry_backoff=float(os.environ.get("CALIBRATION_RETRY_BACKOFF", DEFAULT_RETRY_BACKOFF)),
+)
@@ -3,23 +3,43 @@ import pandas as pd
 import plotly.graph_objs as go
 from plotly.subplots import make_subplots
 
+import downsampling
+
 dir_path = os.path.dirname(os.path.realpath("./MHPDT_cross_validation/*"))
 sys.path.insert(0, dir_path)
-import utils
 import micro_filter
 import hmm_tagging
 import mhpdt_cross_validation as mhpdt_cv
 
 
+def add_downsampled_scatter(fig: go.Figure, x, y, step: bool = False, max_points: int = None, **kwargs) -> go.Figure:
+    """
+    fig.add_scatter with the trace downsampled to the point budget, see downsampling.downsample.
+    """
+
+    x, y = downsampling.downsample(x, y, max_points=max_points, step=step)
+    fig.add_scatter(x=x, y=y, **kwargs)
+    return fig
+
+
 def generate_chart(df: pd.DataFrame, feature_name: str) -> go.Figure:
 
     fig = go.Figure()
-    fig.add_scatter(x=df.index, y=df[feature_name], name=feature_name, showlegend=True)
+    add_downsampled_scatter(fig, df.index, df[feature_name], name=feature_name, showlegend=True)
     fig.update_layout(title=f"Acceleration's {feature_name} feature chart")
     return fig
 
 
-def generate_subplots_chart(df: pd.DataFrame, feature_names: str = ("magnitude", "mhp")) -> go.Figure:
+def generate_subplots_chart(df: pd.DataFrame, feature_names: str = ("magnitude", "mhp"), x_range=None, uirevision=None) -> go.Figure:
+    """
+    x_range     (start, stop) of the visible window. Only samples of the window are plotted, so zooming in
+                re-renders the window at full resolution (up to the point budget of each trace).
+    uirevision  identifies the survey plotted, e.g. its DataFrame cache key. Zoom level and legend state are
+                kept while it stays the same and reset when another survey is plotted.
+    """
+
+    if x_range is not None:
+        df = df.loc[x_range[0] : x_range[1]]
 
     row_count = len(feature_names)
     fig = make_subplots(
@@ -35,7 +55,12 @@ def generate_subplots_chart(df: pd.DataFrame, feature_names: str = ("magnitude",
 
     for i, col in enumerate(feature_names, start=1):
         if col in df.columns:
-            fig.add_scatter(x=df.index, y=df[col], name=col, showlegend=True, row=i, col=1)
+            add_downsampled_scatter(fig, df.index, df[col], name=col, showlegend=True, row=i, col=1)
+
+    # keeps zoom level and legend state when the figure is re-rendered for a new window of the same survey:
+    fig.update_layout(uirevision=uirevision)
+    if x_range is not None:
+        fig.update_xaxes(range=list(x_range))
 
     return fig
 
@@ -45,7 +70,7 @@ def generate_chart_with_rangeselector(df: pd.DataFrame, feature_name: str) -> go
     # Create figure
     fig = go.Figure()
 
-    fig.add_scatter(x=df.index, y=df[feature_name], name=feature_name)
+    add_downsampled_scatter(fig, df.index, df[feature_name], name=feature_name)
 
     # Set title
     fig.update_layout(title_text="Select calibration period:")
@@ -67,10 +92,10 @@ def generate_chart_with_rangeselector(df: pd.DataFrame, feature_name: str) -> go
     return fig
 
 
-def generate_mhpdt_calibration_chart(df_calibration, params):
-
-    df_calibration_transient = utils.add_features_to_df(df_calibration[["x", "y", "z"]].copy().round(3), mhp_window_size="6s")
-    df_calibration_transient_dropped = utils.drop_transient_mhp_window_sized_data(df_calibration_transient, mhp_window_size="6s")
+def generate_mhpdt_calibration_chart(df_calibration_transient_dropped, params):
+    """
+    df_calibration_transient_dropped    calibration window with the 6s window mhp feature, see dash_utils.load_calibration_features
+    """
 
     tagged_states = hmm_tagging.generate_tagged_data(df_calibration_transient_dropped)
     prediction_df = mhpdt_cv.andon_prediction_with_filtering(df_calibration_transient_dropped, params)
@@ -80,15 +105,21 @@ def generate_mhpdt_calibration_chart(df_calibration, params):
     print(f"{calibration_score}")
 
     fig = go.Figure()
-    fig.add_scatter(x=prediction_df.index, y=prediction_df.mhp, name="mhp")
-    fig.add_scatter(x=tagged_states.index, y=tagged_states, mode="lines", name="tagged sequence")
+    add_downsampled_scatter(fig, prediction_df.index, prediction_df.mhp, name="mhp")
+    add_downsampled_scatter(fig, tagged_states.index, tagged_states, step=True, mode="lines", name="tagged sequence")
 
     # For 3 state hmm labeling:
     # tagged_states = hmm_tagging.relabel_active_states(tagged_states)
     # fig.add_scatter(x=tagged_states.index,y=tagged_states,mode='lines',name='tagged sequence relabeled')
 
-    fig.add_scatter(
-        x=prediction_df.index, y=prediction_df.state_filtered, mode="lines", line=dict(dash="dash"), name="mhpdt andon_states filtered"
+    add_downsampled_scatter(
+        fig,
+        prediction_df.index,
+        prediction_df.state_filtered,
+        step=True,
+        mode="lines",
+        line=dict(dash="dash"),
+        name="mhpdt andon_states filtered",
     )
 
     fig.update_layout(title_text=f"MHPDT calibration result - accuracy score: {calibration_score} %")
@@ -96,17 +127,17 @@ def generate_mhpdt_calibration_chart(df_calibration, params):
     return fig
 
 
-def generate_custom_mhpdt_chart(fig, df, params, n_clicks, add_feature_data=True):
-
-    df_transient = utils.add_features_to_df(df[["x", "y", "z"]].copy().round(3), mhp_window_size="6s")
-    df_transient_dropped = utils.drop_transient_mhp_window_sized_data(df_transient, mhp_window_size="6s")
+def generate_custom_mhpdt_chart(fig, df_transient_dropped, params, n_clicks, add_feature_data=True):
+    """
+    df_transient_dropped    period with the 6s window mhp feature, see dash_utils.load_calibration_features
+    """
 
     df_plot = mhpdt_cv.andon_prediction_with_filtering(df_transient_dropped, params)
 
     if add_feature_data:
-        fig.add_scatter(x=df_plot.index, y=df_plot.mhp, name="mhp")
+        add_downsampled_scatter(fig, df_plot.index, df_plot.mhp, name="mhp")
 
     legend = f"filtered mhpdt andon model #{int(n_clicks)}"
-    fig.add_scatter(x=df_plot.index, y=df_plot.state_filtered, mode="lines", name=legend)
+    add_downsampled_scatter(fig, df_plot.index, df_plot.state_filtered, step=True, mode="lines", name=legend)
 
     return fig
@@ -79,6 +79,9 @@ def tab_mhpdt_calibration() -> dcc.Tab:
             ),
             html.Hr(),
             html.Button("Run MHPDT calibration", id="button-mhpdt-calibration", style={"margin-left": "80px", "margin-bottom": "10px"}),
+            html.Button("Cancel calibration", id="button-cancel-mhpdt-calibration", style={"margin-left": "10px", "margin-bottom": "10px"}),
+            html.Div(id="mhpdt-calibration-progress-div", style={"margin-left": "80px"}),
+            dcc.Interval(id="mhpdt-calibration-poll-interval", interval=2000, disabled=True),
             dcc.Loading(
                 id="mhpdt-calibration-loading",
                 type="circle",
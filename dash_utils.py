@@ -1,14 +1,26 @@
 import base64
 import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
 import dash_html_components as html
 import plotly.graph_objs as go
 
 import pandas as pd
 import numpy as np
 from typing import List, Dict, Union
-from sklearn.decomposition import PCA
 import json
 import logging
+import re
+
+from dash.exceptions import PreventUpdate
+
+import df_cache
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "MHPDT_cross_validation"))
+import features
+import utils
+from features import magnitude_highpass, linear_acceleration, gravity_free_magnitude
 
 # change default plotly theme
 import plotly.io
@@ -17,94 +29,61 @@ plotly.io.templates.default = "plotly_white"
 
 logger = logging.getLogger(__name__)
 
-
-def magnitude_highpass(df: pd.DataFrame, axes: List = ["x", "y", "z"], window_size: str = "3s") -> np.array:
-    """
-
-    Parameters
-    ----------
-    df              input pd.Dataframe
-    axes            axes to include in magnitude highpass calculation
-    window_size     size of rolling window, e.g. 3 or '3s'
-
-    Returns         np.array of magnitude highpass values
-    -------
-
-    """
-
-    mhp = df[axes].values - df[axes].rolling(window=window_size).mean().values
-    # magnitude calculation:
-    mhp = np.sqrt(np.sum(np.power(mhp, 2), axis=1))
-
-    return mhp
+# features available for every uploaded survey, computed on first access:
+DASHBOARD_FEATURES = ["magnitude", "mhp", "no_gravity", "pca", "rolling_avg"]
+DASHBOARD_FEATURE_PARAMS = dict(mhp_window_size="3s", alpha=0.8)
+# mhp of the MHPDT calibration charts, computed like the calibration function computes it:
+CALIBRATION_FEATURE_PARAMS = dict(mhp_window_size="6s", alpha=0.8)
+CALIBRATION_FEATURES_NAME = "calibration_mhp"
+# uploads parsed concurrently when several files are uploaded at once:
+UPLOAD_PARSE_WORKERS = int(os.environ.get("UPLOAD_PARSE_WORKERS", min(4, os.cpu_count() or 1)))
 
 
-def linear_acceleration(data_array: np.array, alpha: float = 0.8) -> np.array:
+def generate_basic_df(filepath: str) -> pd.DataFrame:
     """
 
     Parameters
     ----------
-    data_array
-    alpha
+    filepath    filepath as string or file-like object
 
-    Returns
+    Returns     basic pd.DataFrame with timestamp as index
     -------
 
     """
+    df = utils.read_accelerations_csv(filepath)
 
-    gravity = np.ones_like(data_array) * data_array.values[0]
-    for i in range(data_array.size)[1:]:
-        # gravity can be considered as the low passed version of
-        # the signal (using exponential smoothing):
-        gravity[i] = alpha * gravity[i - 1] + (1 - alpha) * data_array[i]
-
-    gravity = pd.Series(gravity, index=data_array.index)
-
-    gravity_free_acceleration = data_array - gravity
+    if not df.index.is_monotonic_increasing:
+        print("Warning: Dataframe DatetimeIndex is not monotonically increasing.")
 
-    return gravity_free_acceleration
+    return df
 
 
-def gravity_free_magnitude(df: pd.DataFrame, alpha: float = 0.8):
+class Base64Reader(io.RawIOBase):
     """
-
-    Parameters
-    ----------
-    df
-    alpha
-
-    Returns
-    -------
-
+    Read-only binary stream decoding a base64 encoded string (e.g. dcc.Upload contents) chunk by chunk,
+    so an upload is never decoded into memory as a whole.
     """
 
-    df_gravity_free = df[["x", "y", "z"]].copy()
-    for axis in ["x", "y", "z"]:
-        df_gravity_free[axis] = linear_acceleration(df_gravity_free[axis].copy(), alpha=alpha)
-    magnitude = np.sqrt(df_gravity_free.pow(2).sum(axis=1))
+    def __init__(self, encoded: str, start: int = 0, chunk_size: int = 4 * 1024 ** 2):
+        self._encoded = encoded
+        self._position = start
+        # base64 decodes 4 characters into 3 bytes, a smaller chunk would read as the end of the stream:
+        self._chunk_size = max(chunk_size - chunk_size % 4, 4)
+        self._buffer = b""
 
-    return magnitude
+    def readable(self) -> bool:
+        return True
 
+    def readinto(self, b) -> int:
+        if not self._buffer and self._position < len(self._encoded):
+            encoded_chunk = self._encoded[self._position : self._position + self._chunk_size]
+            self._position += len(encoded_chunk)
+            self._buffer = base64.b64decode(encoded_chunk)
 
-def generate_basic_df(filepath: str) -> pd.DataFrame:
-    """
-
-    Parameters
-    ----------
-    filepath    filepath as string
-
-    Returns     basic pd.DataFrame with timestamp as index
-    -------
-
-    """
-    df = pd.read_csv(filepath, sep=",")
-    df["timestamp"] = pd.to_datetime(df.timestamp, format="%Y-%m-%dT%H:%M:%S.%f")
-    df = df.set_index("timestamp")
-
-    if not df.index.is_monotonic_increasing:
-        print("Warning: Dataframe DatetimeIndex is not monotonically increasing.")
-
-    return df
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
 
 
 def add_features_to_df(df: pd.DataFrame, **kwargs) -> pd.DataFrame:
@@ -119,38 +98,32 @@ def add_features_to_df(df: pd.DataFrame, **kwargs) -> pd.DataFrame:
 
     """
 
-    alpha = kwargs.get("alpha", 0.8)
-    mhp_window_size = kwargs.get("mhp_window_size", "3s")
+    alpha = kwargs.get("alpha", DASHBOARD_FEATURE_PARAMS["alpha"])
+    mhp_window_size = kwargs.get("mhp_window_size", DASHBOARD_FEATURE_PARAMS["mhp_window_size"])
     logger.setLevel(logging.INFO)
     logger.info(f"using parameters mhp_window_size: {mhp_window_size} and alpha: {alpha}")
 
-    df["magnitude"] = np.sqrt(df.x ** 2 + df.y ** 2 + df.z ** 2)
-    df["mhp"] = magnitude_highpass(df, window_size=mhp_window_size)
-    df["no_gravity"] = gravity_free_magnitude(df, alpha=alpha)
-    df["pca"] = PCA(n_components=1).fit_transform(df[["x", "y", "z"]].fillna(0))
+    return features.compute_features(df, DASHBOARD_FEATURES, mhp_window_size=mhp_window_size, alpha=alpha)
 
-    # add rolling averages
-    for axis in ["x", "y", "z"]:
-        df[f"{axis}_{mhp_window_size}_avg"] = df[axis].rolling(mhp_window_size).mean().fillna(0)
 
-    return df
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+
+
+def _accelerations_elements(df: pd.DataFrame, timestamps) -> List[Dict[str, Union[str, Dict[str, float]]]]:
+    # to_numpy casts x, y, z to their common dtype, the same values iterrows() yields per row
+    return [
+        {"timestamp": timestamp, "acceleration": {"x": x, "y": y, "z": z}}
+        for timestamp, (x, y, z) in zip(timestamps, df[["x", "y", "z"]].to_numpy().tolist())
+    ]
 
 
 def df_to_json_accelerations(df: pd.DataFrame, timestamp_as_string=False) -> List[Dict[str, Union[str, Dict[str, float]]]]:
     """
     reproduces input identical to what GM consumes. useful for testing haris-oee-ml module prediction methods
     """
-    accelerations = []
+    timestamps = df.index.strftime(TIMESTAMP_FORMAT) if timestamp_as_string else df.index
 
-    for row in df[["x", "y", "z"]].iterrows():
-        if timestamp_as_string:
-            timestamp = row[0].strftime("%Y-%m-%dT%H:%M:%S.%f")
-        else:
-            timestamp = row[0]
-
-        temp_dict = {"timestamp": timestamp, "acceleration": {"x": row[1][0], "y": row[1][1], "z": row[1][2]}}
-        accelerations += [temp_dict]
-    return accelerations
+    return _accelerations_elements(df, timestamps)
 
 
 def andon_state_list_generator(states_array: pd.Series) -> List:
@@ -275,62 +248,268 @@ def rolling_std_feature(df, window_size="3s"):
     return feature
 
 
-def accelerations_csv_to_json(df: pd.DataFrame, json_attribute="cycleTimeCalibrationData", file_path=None):
+def _dump_accelerations_json(df: pd.DataFrame, json_attribute: str, file_path: str, chunk_size: int = 10000) -> None:
+    """
+    Streams {json_attribute: [...]} to file_path chunk by chunk, byte-identical to
+    json.dump(calibration_json, f, sort_keys=True, indent=2, separators=(",", ": ")) of the whole document.
+    """
+
+    dump_kwargs = dict(sort_keys=True, indent=2, separators=(",", ": "))
+
+    with open(file_path, "w") as f:
+        if df.empty:
+            json.dump({json_attribute: []}, f, **dump_kwargs)
+            return
 
-    calibration_json = {json_attribute: []}
-    for row in df[["x", "y", "z"]].iterrows():
-        try:
-            ts = row[0].strftime("%Y-%m-%dT%H:%M:%S.%f")
-        except ValueError:
-            ts = row[0].strftime("%Y-%m-%dT%H:%M:%S.0")
-        x, y, z = row[1][0], row[1][1], row[1][2]
+        f.write("{\n  " + json.dumps(json_attribute) + ": [\n")
+        for start in range(0, len(df), chunk_size):
+            chunk = df.iloc[start : start + chunk_size]
+            # elements of a dumped list are one indentation level less deep than inside the document:
+            lines = json.dumps(_accelerations_elements(chunk, chunk.index.strftime(TIMESTAMP_FORMAT)), **dump_kwargs).split("\n")[1:-1]
+            if start > 0:
+                f.write(",\n")
+            f.write("\n".join("  " + line for line in lines))
+        f.write("\n  ]\n}")
 
-        json_element = {"timestamp": ts, "acceleration": {"x": x, "y": y, "z": z}}
-        calibration_json[json_attribute].append(json_element)
+
+def accelerations_csv_to_json(df: pd.DataFrame, json_attribute="cycleTimeCalibrationData", file_path=None):
 
     if file_path:
-        with open(file_path, "w") as f:
-            json.dump(calibration_json, f, sort_keys=True, indent=2, separators=(",", ": "))
+        _dump_accelerations_json(df, json_attribute, file_path)
     else:
-        return calibration_json
+        return {json_attribute: df_to_json_accelerations(df, timestamp_as_string=True)}
 
 
-def load_df_from_local_storage(json_data):
+def load_df_from_local_storage(json_data, feature_names=()):
+    """
+    Loads the parsed survey referenced by the upload key held in dataframe-json-storage
+    from the server side DataFrame cache.
 
-    df = pd.DataFrame.from_dict(json_data[0])
-    df["timestamp"] = pd.to_datetime(df.timestamp)
-    df = df.set_index("timestamp")
+    Parameters
+    ----------
+    json_data       dataframe-json-storage data
+    feature_names   DASHBOARD_FEATURES to add to the survey. Features are computed on first access
+                    and memoized in the cache entry of the survey, so they are paid for only once
+                    and only if a chart actually uses them.
+
+    Returns         pd.DataFrame with x, y, z and the requested feature columns
+    -------
+
+    """
+
+    key = json_data[0]
+    if not isinstance(key, str):
+        # upload failed to parse, nothing was cached
+        raise PreventUpdate
+
+    df = df_cache.cache.get(key)
+    if df is None:
+        logger.error(f"Survey {key} is no longer available in the DataFrame cache, upload the file again.")
+        raise PreventUpdate
+
+    for name in feature_names:
+        columns = features.feature_columns([name], **DASHBOARD_FEATURE_PARAMS)
+
+        df_feature = df_cache.cache.get(key, name=name)
+        if df_feature is None:
+            features.compute_features(df, [name], **DASHBOARD_FEATURE_PARAMS)
+            df_cache.cache.put(key, df[columns].reset_index(drop=True), name=name)
+        else:
+            for column in columns:
+                df[column] = df_feature[column].values
 
     return df
 
 
+def load_calibration_features(json_data, start=None, stop=None, inclusive: bool = True) -> pd.DataFrame:
+    """
+    Calibration window of the survey with the 6s window mhp feature, as the MHPDT charts use it: the
+    x, y, z columns rounded to 3 decimals and the transient first mhp window of the period dropped.
+
+    The feature is computed once over the whole survey, memoized in the cache entry of the survey,
+    and any window is served by slicing it. The time based rolling window of a sample only reaches
+    one window size back, so past the dropped transient a window's values are the ones computed from
+    the window's samples alone, the samples preceding the window only serve as its warm-up.
+
+    Parameters
+    ----------
+    json_data       dataframe-json-storage data
+    start           first timestamp of the window, start of the survey if None
+    stop            last timestamp of the window, end of the survey if None
+    inclusive       include samples at start and stop
+
+    Returns         pd.DataFrame with x, y, z and mhp columns
+    -------
+
+    """
+
+    df = load_df_from_local_storage(json_data)
+
+    df_feature = df_cache.cache.get(json_data[0], name=CALIBRATION_FEATURES_NAME)
+    if df_feature is None:
+        df_feature = features.compute_features(df[features.AXES].round(3), ["mhp"], **CALIBRATION_FEATURE_PARAMS)
+        df_cache.cache.put(json_data[0], df_feature.reset_index(drop=True), name=CALIBRATION_FEATURES_NAME)
+    else:
+        df_feature.index = df.index
+
+    mask = np.ones(len(df_feature), dtype=bool)
+    if start is not None:
+        start = pd.to_datetime(start)
+        mask &= (df_feature.index >= start) if inclusive else (df_feature.index > start)
+    if stop is not None:
+        stop = pd.to_datetime(stop)
+        mask &= (df_feature.index <= stop) if inclusive else (df_feature.index < stop)
+
+    df_window = df_feature[mask]
+    if df_window.empty:
+        return df_window
+
+    return utils.drop_transient_mhp_window_sized_data(df_window, mhp_window_size=CALIBRATION_FEATURE_PARAMS["mhp_window_size"])
+
+
+def features_referenced_by(expression: str) -> List[str]:
+    """
+    DASHBOARD_FEATURES whose columns are referenced by a pandas eval expression.
+    """
+
+    names = set(re.findall(r"[A-Za-z_][A-Za-z0-9_]*", expression or ""))
+    referenced = []
+    for name in DASHBOARD_FEATURES:
+        if names.intersection(features.feature_columns([name], **DASHBOARD_FEATURE_PARAMS)):
+            referenced.append(name)
+
+    return referenced
+
+
 def load_calibration_period_from_local_storage(json_data) -> slice:
     range_start = pd.to_datetime(json_data["start"])
     range_stop = pd.to_datetime(json_data["stop"])
     return slice(range_start, range_stop)
 
 
-def parse_contents(contents, filename, date):
-    # content_type, content_string = contents.split(',')
-    _, content_string = contents.split(",")
+def _read_upload(contents: str, filename: str, content_start: int):
+    """
+    Parses an upload into a basic DataFrame, returns the html.Div error message to show instead if it cannot be parsed.
+    """
 
-    decoded = base64.b64decode(content_string)
     try:
         if "csv" in filename:
 
-            df = generate_basic_df(io.StringIO(decoded.decode("utf-8")))
-            df = add_features_to_df(df)
+            # decoded and parsed in chunks, features are computed lazily by load_df_from_local_storage
+            with io.BufferedReader(Base64Reader(contents, start=content_start)) as decoded:
+                return generate_basic_df(decoded)
 
         else:
             return html.Div(["The uploaded filetype can only be CSV."])
 
     except Exception as e:
         print(e)
-        return html.Div(["There was an error processing this file."])
+        return html.Div([f"There was an error processing {filename}."])
+
+
+def parse_contents(contents, filename, date):
+    """
+    Parses an uploaded survey into the server side DataFrame cache.
+
+    Returns     the cache key (content hash) of the parsed survey, which is all that gets stored in the browser
+    -------
+
+    """
+    # contents: 'data:<content_type>;base64,<content_string>', the content string is read in place
+    content_start = contents.index(",") + 1
+
+    key = df_cache.content_hash(contents, start=content_start)
+    if df_cache.cache.contains(key):
+        logger.info(f"{filename} already parsed, using cached DataFrame {key}")
+        return key
+
+    df = _read_upload(contents, filename, content_start)
+    if not isinstance(df, pd.DataFrame):
+        return df
+
+    df_cache.cache.put(key, df)
+    return key
+
+
+def _load_upload(contents: str, filename: str):
+    # one part of a multi file upload: reuses the survey if the file was uploaded alone before, parts are not cached
+    content_start = contents.index(",") + 1
+
+    df = df_cache.cache.get(df_cache.content_hash(contents, start=content_start))
+    if df is not None:
+        return df
+
+    return _read_upload(contents, filename, content_start)
+
+
+def parse_uploads(list_of_contents, list_of_names, list_of_dates) -> List:
+    """
+    Parses the uploaded surveys into the server side DataFrame cache. Several files (e.g. hourly exports
+    of the same sensor) are parsed concurrently and merged into one survey ordered by timestamp, see
+    utils.merge_accelerations, which is stored under a key derived from the content hashes of the files
+    that parsed. Uploading the same files again only hits the cache when all of them parsed, so the error
+    messages of a partial survey are shown every time. Features are then computed once on the merged
+    survey, across the file boundaries.
+
+    Returns     dataframe-json-storage data: the cache key of the survey, followed by the error
+    -------     messages of the files that could not be parsed
+
+    """
+
+    if len(list_of_contents) == 1:
+        return [parse_contents(list_of_contents[0], list_of_names[0], list_of_dates[0])]
+
+    keys = [df_cache.content_hash(contents, start=contents.index(",") + 1) for contents in list_of_contents]
+    key = df_cache.merged_key(keys)
+    if df_cache.cache.contains(key):
+        logger.info(f"{', '.join(list_of_names)} already parsed, using cached DataFrame {key}")
+        return [key]
+
+    with ThreadPoolExecutor(max_workers=UPLOAD_PARSE_WORKERS) as executor:
+        parsed = list(executor.map(_load_upload, list_of_contents, list_of_names))
+
+    frames = [df for df in parsed if isinstance(df, pd.DataFrame)]
+    errors = [error for error in parsed if not isinstance(error, pd.DataFrame)]
+    if not frames:
+        return errors
+    if errors:
+        # the survey of the parsed files only, not to be found under the key of all the files
+        key = df_cache.merged_key([file_key for file_key, df in zip(keys, parsed) if isinstance(df, pd.DataFrame)])
+
+    df = utils.merge_accelerations(frames)
+    logger.info(f"merged {len(frames)} uploads into {len(df)} samples, cached as DataFrame {key}")
+    df_cache.cache.put(key, df)
+
+    return [key] + errors
+
+
+def is_x_range_change(relayoutData: dict) -> bool:
+    """
+    True if relayoutData was triggered by zooming/panning the x axis of a (shared x axes) chart or by resetting it.
+    """
+
+    return any(key.startswith("xaxis") and (".range" in key or ".autorange" in key) for key in relayoutData)
+
+
+def x_range_from_relayout(relayoutData: dict):
+    """
+
+    Parameters
+    ----------
+    relayoutData    relayoutData of a chart with shared x axes
+
+    Returns         (start, stop) of the zoomed x range, None when the chart was reset to the full range
+    -------
+
+    """
+
+    for key, value in relayoutData.items():
+        if key.startswith("xaxis") and key.endswith(".range[0]"):
+            return pd.to_datetime(value), pd.to_datetime(relayoutData[key.replace("[0]", "[1]")])
+        if key.startswith("xaxis") and key.endswith(".range"):
+            return pd.to_datetime(value[0]), pd.to_datetime(value[1])
 
-    df = df.reset_index(drop=False)
-    json_data = df.to_dict("records")
-    return json_data
+    return None
 
 
 def calculate_calibration_period_based_on_user_action(df: pd.DataFrame, relayoutData: dict, calibration_period: dict) -> dict:
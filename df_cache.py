@@ -0,0 +1,131 @@
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import uuid
+from typing import Optional
+
+import pandas as pd
+import pyarrow as pa
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "mhpdt-dashboard-cache")
+DEFAULT_CACHE_MAX_BYTES = 2 * 1024 ** 3
+
+
+def content_hash(contents: str, start: int = 0, chunk_size: int = 4 * 1024 ** 2) -> str:
+    """
+
+    Parameters
+    ----------
+    contents    upload contents string as sent by dcc.Upload
+    start       position of the first character to hash
+    chunk_size  number of characters hashed at a time
+
+    Returns     hex digest used as the cache key of the upload
+    -------
+
+    """
+
+    digest = hashlib.sha1()
+    for position in range(start, len(contents), chunk_size):
+        digest.update(contents[position : position + chunk_size].encode("utf-8"))
+
+    return digest.hexdigest()
+
+
+def merged_key(keys) -> str:
+    """
+    Cache key of the survey merged from the uploads with the given keys, independent of their order.
+    """
+
+    return hashlib.sha1(("merged:" + ",".join(sorted(set(keys)))).encode("utf-8")).hexdigest()
+
+
+class DataFrameCache:
+    """
+    Size bounded, disk backed store of parsed survey DataFrames.
+
+    Every entry is a directory named after its key holding uncompressed Arrow IPC files, so all
+    dashboard workers (gunicorn processes) pointing at the same cache_dir share the entries, and
+    entries survive restarts when cache_dir is on a persistent volume. Files are memory mapped on
+    read: re-opening a survey maps its columns into the DataFrame without parsing or copying them
+    (the resulting arrays are read-only). Files are written to a temporary name first and renamed,
+    which keeps concurrent readers from ever seeing a partially written entry. The directory mtime
+    is refreshed on every access and the least recently used entries are removed once the total
+    size exceeds max_bytes.
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def _frame_path(self, key: str, name: str) -> str:
+        return os.path.join(self._entry_dir(key), f"{name}.arrow")
+
+    def contains(self, key: str, name: str = "frame") -> bool:
+        return os.path.exists(self._frame_path(key, name))
+
+    def put(self, key: str, df: pd.DataFrame, name: str = "frame") -> None:
+        """
+        Stores df under the entry key. An entry holds the parsed survey as "frame" and can hold
+        further frames sharing its index, e.g. lazily computed feature columns.
+        """
+
+        entry_dir = self._entry_dir(key)
+        os.makedirs(entry_dir, exist_ok=True)
+
+        table = pa.Table.from_pandas(df)
+        tmp_path = os.path.join(entry_dir, f".{uuid.uuid4().hex}.tmp")
+        with pa.OSFile(tmp_path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, self._frame_path(key, name))
+
+        self.evict()
+
+    def get(self, key: str, name: str = "frame") -> Optional[pd.DataFrame]:
+
+        try:
+            table = pa.ipc.open_file(pa.memory_map(self._frame_path(key, name), "r")).read_all()
+            os.utime(self._entry_dir(key))
+        except (OSError, pa.ArrowInvalid):
+            logger.info(f"DataFrame cache miss for {name} of key {key}")
+            return None
+
+        # split_blocks keeps every column in its own block, so columns are not consolidated (copied)
+        return table.to_pandas(split_blocks=True)
+
+    def evict(self) -> None:
+
+        entries = []
+        total_size = 0
+        for entry in os.scandir(self.cache_dir):
+            if not entry.is_dir():
+                continue
+            try:
+                entry_size = sum(f.stat().st_size for f in os.scandir(entry.path))
+                entries.append((entry.stat().st_mtime, entry_size, entry.path))
+            except OSError:
+                # entry removed by another worker in the meantime
+                continue
+            total_size += entry_size
+
+        for _, entry_size, path in sorted(entries):
+            if total_size <= self.max_bytes:
+                break
+            logger.info(f"Evicting DataFrame cache entry {os.path.basename(path)}")
+            shutil.rmtree(path, ignore_errors=True)
+            total_size -= entry_size
+
+
+cache = DataFrameCache(
+    cache_dir=os.environ.get("DF_CACHE_DIR", DEFAULT_CACHE_DIR),
+    max_bytes=int(os.environ.get("DF_CACHE_MAX_BYTES", DEFAULT_CACHE_MAX_BYTES)),
+)
@@ -0,0 +1,132 @@
+import os
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+
+# maximum number of points sent to the browser per plotly trace:
+MAX_POINTS_PER_TRACE = int(os.environ.get("MAX_POINTS_PER_TRACE", 5000))
+
+
+def _as_numeric(x: np.ndarray) -> np.ndarray:
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype("datetime64[ns]").view(np.int64).astype(np.float64)
+    return x.astype(np.float64)
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets downsampling.
+
+    Parameters
+    ----------
+    x       sample positions (numeric or datetime64)
+    y       sample values, NaN values are treated as 0 when selecting points
+    n_out   number of points to keep
+
+    Returns np.array of the indices of the kept samples, first and last sample included
+    -------
+
+    """
+
+    n = y.size
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x = _as_numeric(x)
+    y = np.nan_to_num(y.astype(np.float64))
+
+    # first and last point are kept, the remaining samples are split in n_out - 2 buckets:
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+
+    previous = 0
+    for i in range(n_out - 2):
+        start, stop = edges[i], edges[i + 1]
+        next_start, next_stop = edges[i + 1], edges[i + 2] if i + 2 < edges.size else n
+
+        # third triangle corner: average of the next bucket
+        next_x = x[next_start:next_stop].mean()
+        next_y = y[next_start:next_stop].mean()
+
+        bucket_x = x[start:stop]
+        bucket_y = y[start:stop]
+        area = np.abs((x[previous] - next_x) * (bucket_y - y[previous]) - (x[previous] - bucket_x) * (next_y - y[previous]))
+
+        previous = start + int(np.argmax(area))
+        selected[i + 1] = previous
+
+    return selected
+
+
+def minmax_indices(y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Min-max downsampling: keeps the minimum and the maximum of n_out // 2 equally sized buckets.
+    """
+
+    n = y.size
+    if n_out >= n or n_out < 2:
+        return np.arange(n)
+
+    edges = np.linspace(0, n, n_out // 2 + 1).astype(np.int64)
+    values = np.nan_to_num(y.astype(np.float64))
+    minima = np.minimum.reduceat(values, edges[:-1])
+    maxima = np.maximum.reduceat(values, edges[:-1])
+
+    indices = []
+    for start, stop, minimum, maximum in zip(edges[:-1], edges[1:], minima, maxima):
+        bucket = values[start:stop]
+        indices.append(start + int(np.argmax(bucket == minimum)))
+        indices.append(start + int(np.argmax(bucket == maximum)))
+
+    return np.unique(indices)
+
+
+def step_indices(y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Transition preserving compression of step (state) series: keeps the first and last sample and
+    the samples on both sides of every state change, so lines drawn through the kept samples are
+    identical to the full resolution ones. Falls back to min-max downsampling when the series has
+    more transitions than the point budget allows.
+    """
+
+    n = y.size
+    if n_out >= n:
+        return np.arange(n)
+
+    changes = np.flatnonzero(y[1:] != y[:-1])
+    indices = np.unique(np.concatenate(([0, n - 1], changes, changes + 1)))
+    if indices.size > n_out:
+        return minmax_indices(y, n_out)
+
+    return indices
+
+
+def downsample(x: pd.Index, y: pd.Series, max_points: int = None, step: bool = False) -> Tuple[pd.Index, pd.Series]:
+    """
+
+    Parameters
+    ----------
+    x               trace x values, e.g. a DatetimeIndex
+    y               trace y values
+    max_points      point budget of the trace, defaults to MAX_POINTS_PER_TRACE
+    step            y is a step (state) series: transitions are preserved instead of using LTTB
+
+    Returns         downsampled x and y values
+    -------
+
+    """
+
+    max_points = max_points or MAX_POINTS_PER_TRACE
+    if len(y) <= max_points:
+        return x, y
+
+    values = np.asarray(y)
+    if step:
+        indices = step_indices(values, max_points)
+    else:
+        indices = lttb_indices(np.asarray(x), values, max_points)
+
+    return x[indices], y.iloc[indices] if isinstance(y, pd.Series) else values[indices]
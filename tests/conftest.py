@@ -0,0 +1,44 @@
+"""
+Shared fixtures of the tests. The function package modules import each other as top level modules, as
+in the azure function, so its directory is put on sys.path like the benchmarks do.
+
+usage: python -m pytest tests
+"""
+import os
+import sys
+import tempfile
+
+repo_path = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, repo_path)
+sys.path.insert(0, os.path.join(repo_path, "MHPDT_cross_validation"))
+
+# the stores created when the function and dashboard modules are imported must not touch the real ones:
+_scratch_dir = tempfile.mkdtemp(prefix="mhpdt-tests-")
+for variable in ("DF_CACHE_DIR", "MHPDT_JOB_DIR", "MHPDT_RESULT_CACHE_DIR"):
+    os.environ[variable] = os.path.join(_scratch_dir, variable.lower())
+
+import pandas as pd
+import pytest
+import utils
+
+SURVEY_PATH = os.path.join(repo_path, "test_data", "survey_1d4911c5-477d-4a4a-882a-43035fa7b0d5_accelerations.csv")
+
+
+@pytest.fixture(scope="session")
+def survey():
+    # rounded like the dashboard rounds the calibration data it sends
+    return utils.read_accelerations_csv(SURVEY_PATH).round(3)
+
+
+@pytest.fixture(scope="session")
+def raw_survey():
+    # samples as read from the CSV, unrounded
+    df = pd.read_csv(SURVEY_PATH, sep=",")
+    df["timestamp"] = pd.to_datetime(df.timestamp, format="%Y-%m-%dT%H:%M:%S.%f")
+    return df.set_index("timestamp")
+
+
+@pytest.fixture(scope="session")
+def survey_features(survey):
+    df = utils.add_features_to_df(survey.copy(), mhp_window_size="6s", features=["mhp"])
+    return utils.drop_transient_mhp_window_sized_data(df, mhp_window_size="6s")
@@ -0,0 +1,53 @@
+import json
+
+import pytest
+
+pytest.importorskip("dash")
+import dash_utils  # noqa: E402
+
+ATTRIBUTE = "cycleTimeCalibrationData"
+
+
+def dumped(df, tmp_path, **kwargs):
+    file_path = tmp_path / "calibration.json"
+    dash_utils._dump_accelerations_json(df, ATTRIBUTE, str(file_path), **kwargs)
+    return file_path.read_bytes()
+
+
+def whole_document(df, tmp_path):
+    file_path = tmp_path / "expected.json"
+    with open(file_path, "w") as f:
+        json.dump({ATTRIBUTE: dash_utils.df_to_json_accelerations(df, timestamp_as_string=True)}, f,
+                  sort_keys=True, indent=2, separators=(",", ": "))
+    return file_path.read_bytes()
+
+
+@pytest.mark.parametrize("rows", [1, 2, 9, 10, 11])
+@pytest.mark.parametrize("chunk_size", [1, 3, 10])
+def test_chunk_boundaries(survey, tmp_path, rows, chunk_size):
+    df = survey.iloc[:rows]
+
+    assert dumped(df, tmp_path, chunk_size=chunk_size) == whole_document(df, tmp_path)
+
+
+def test_survey_with_the_default_chunk_size(raw_survey, tmp_path):
+    # unrounded, so float formatting is compared too; long enough to span several chunks
+    assert len(raw_survey) > 10000
+
+    assert dumped(raw_survey, tmp_path) == whole_document(raw_survey, tmp_path)
+
+
+def test_empty_input(survey, tmp_path):
+    df = survey.iloc[:0]
+
+    assert dumped(df, tmp_path) == whole_document(df, tmp_path)
+    assert json.loads(dumped(df, tmp_path)) == {ATTRIBUTE: []}
+
+
+def test_file_path_streams_the_returned_document(survey, tmp_path):
+    df = survey.iloc[:25]
+    file_path = tmp_path / "streamed.json"
+
+    dash_utils.accelerations_csv_to_json(df, json_attribute=ATTRIBUTE, file_path=str(file_path))
+
+    assert json.loads(file_path.read_text()) == dash_utils.accelerations_csv_to_json(df, json_attribute=ATTRIBUTE)
@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import mhpdt_cross_validation as mhpdt_cv
+
+
+def andon_state_from_mhpdt_loop(df, andon_threshold=pd.to_timedelta("30s")):
+    # original row by row implementation, kept as reference
+    if "is_cycle" not in df.columns:
+        return list()
+
+    df["timestamp"] = df.index
+    run_list = df.to_dict("records")
+
+    andon_state = np.zeros_like(df["is_cycle"].values)
+    last_csp = df.index[0] - andon_threshold
+
+    for i, item in enumerate(run_list):
+        if i > 0:
+            if not item["is_cycle"]:
+                if last_csp + andon_threshold < item["timestamp"]:
+                    andon_state[i] = 0
+                else:
+                    andon_state[i] = 1
+            else:
+                andon_state[i] = 1
+                last_csp = item["timestamp"]
+
+    return andon_state
+
+
+@pytest.mark.parametrize("threshold", [0.1, 0.25, 0.5, 1.0, 2.0, 4.0])
+@pytest.mark.parametrize("andon_uptime_threshold", [0, 1, 5, 30])
+def test_andon_state_matches_row_by_row_implementation(survey_features, threshold, andon_uptime_threshold):
+    df_cycles = mhpdt_cv.fast_MHPDT(survey_features, threshold=threshold)
+    andon_threshold = pd.Timedelta(seconds=andon_uptime_threshold)
+
+    expected = andon_state_from_mhpdt_loop(df_cycles.copy(), andon_threshold=andon_threshold)
+    result = mhpdt_cv.andon_state_from_mhpdt(df_cycles, andon_threshold=andon_threshold)
+
+    assert result.dtype == expected.dtype
+    np.testing.assert_array_equal(result, expected)
+
+
+def test_andon_state_holds_up_for_the_threshold_after_a_cycle():
+    timestamps = pd.Timestamp("2021-05-07").value + np.arange(8, dtype=np.int64) * 10 ** 9
+    is_cycle = np.array([1, 0, 1, 0, 0, 0, 0, 1])
+
+    andon_state = mhpdt_cv.andon_state_from_cycles(is_cycle, timestamps, andon_threshold=2 * 10 ** 9)
+
+    # the first sample is always down and never counts as a cycle
+    np.testing.assert_array_equal(andon_state, [0, 0, 1, 1, 1, 0, 0, 1])
+
+
+def test_andon_state_without_cycle_column():
+    assert mhpdt_cv.andon_state_from_mhpdt(pd.DataFrame({"mhp": [0.5]})) == []
@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+import utils
+
+
+def stream(table, compression=None):
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema, options=pa.ipc.IpcWriteOptions(compression=compression)) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+@pytest.mark.parametrize("compression", ["zstd", "lz4", None])
+def test_round_trip(survey, compression):
+    df = survey[["x", "y", "z"]]
+
+    decoded = utils.generate_basic_df_from_arrow(utils.accelerations_to_arrow_stream(df, compression=compression))
+
+    pd.testing.assert_frame_equal(decoded, df, check_freq=False)
+
+
+def test_compressed_buffers_are_smaller(survey):
+    compressed = utils.accelerations_to_arrow_stream(survey, compression="zstd")
+
+    assert len(compressed) < len(utils.accelerations_to_arrow_stream(survey, compression=None))
+
+
+@pytest.mark.parametrize("compression", ["zstd", None])
+def test_int64_nanosecond_timestamps(survey, compression):
+    df = survey[["x", "y", "z"]]
+    table = pa.table({
+        "timestamp": pa.array(df.index.values.astype("datetime64[ns]").view(np.int64), type=pa.int64()),
+        "x": df.x.to_numpy(),
+        "y": df.y.to_numpy(),
+        "z": df.z.to_numpy(),
+    })
+
+    decoded = utils.generate_basic_df_from_arrow(stream(table, compression))
+
+    pd.testing.assert_frame_equal(decoded, df, check_freq=False)
+
+
+def test_other_timestamp_units_are_converted_to_nanoseconds():
+    index = pd.DatetimeIndex(["2021-05-07T10:29:56.172", "2021-05-07T10:29:56.378"], name="timestamp")
+    timestamps = pa.array(index.values.astype("datetime64[ms]"), type=pa.timestamp("ms"))
+    table = pa.table({"timestamp": timestamps, "x": [0.1, 0.2], "y": [0.0, 0.0], "z": [-1.0, -1.0]})
+
+    decoded = utils.generate_basic_df_from_arrow(stream(table))
+
+    pd.testing.assert_index_equal(decoded.index, index)
+
+
+def test_stream_without_samples_gives_an_empty_frame(survey):
+    # the function answers it with 400, downTimeCalibrationData missing
+    decoded = utils.generate_basic_df_from_arrow(utils.accelerations_to_arrow_stream(survey.iloc[:0]))
+
+    assert decoded.empty
+    assert list(decoded.columns) == ["x", "y", "z"]
+
+
+@pytest.mark.parametrize("body", [b"", b"not an arrow stream", b"\xff\xff\xff\xff\x10\x00\x00\x00"])
+def test_invalid_streams_raise_value_error(body):
+    # ValueError, OSError and KeyError are answered with 400 by the function
+    with pytest.raises((ValueError, OSError)):
+        utils.generate_basic_df_from_arrow(body)
+
+
+def test_truncated_stream_raises(survey):
+    body = utils.accelerations_to_arrow_stream(survey)
+
+    with pytest.raises((ValueError, OSError)):
+        utils.generate_basic_df_from_arrow(body[: len(body) // 2])
+
+
+def test_missing_column_raises_key_error():
+    table = pa.table({"timestamp": pa.array([0, 1], type=pa.int64()), "x": [0.1, 0.2], "y": [0.0, 0.0]})
+
+    with pytest.raises(KeyError):
+        utils.generate_basic_df_from_arrow(stream(table))
@@ -0,0 +1,43 @@
+import base64
+import io
+
+import pytest
+
+pytest.importorskip("dash")
+import dash_utils  # noqa: E402
+from conftest import SURVEY_PATH  # noqa: E402
+
+PREFIX = "data:text/csv;base64,"
+
+
+def read(contents, start, chunk_size, read_size=-1):
+    with io.BufferedReader(dash_utils.Base64Reader(contents, start=start, chunk_size=chunk_size), buffer_size=8) as decoded:
+        if read_size < 0:
+            return decoded.read()
+        parts = []
+        while True:
+            part = decoded.read(read_size)
+            if not part:
+                return b"".join(parts)
+            parts.append(part)
+
+
+# 30, 31 and 32 bytes are encoded with no, two and one "=" of padding
+@pytest.mark.parametrize("size", [0, 1, 2, 3, 30, 31, 32])
+@pytest.mark.parametrize("chunk_size", [1, 4, 5, 8, 12, 4 * 1024 ** 2])
+@pytest.mark.parametrize("read_size", [-1, 1, 3, 7])
+def test_padding_at_the_read_boundaries(size, chunk_size, read_size):
+    data = bytes(range(size))
+    contents = PREFIX + base64.b64encode(data).decode()
+
+    assert read(contents, len(PREFIX), chunk_size, read_size) == data
+
+
+def test_uploads_are_parsed_like_the_file(raw_survey):
+    with open(SURVEY_PATH, "rb") as f:
+        contents = PREFIX + base64.b64encode(f.read()).decode()
+
+    with io.BufferedReader(dash_utils.Base64Reader(contents, start=len(PREFIX), chunk_size=1001)) as decoded:
+        df = dash_utils.generate_basic_df(decoded)
+
+    assert df.index.equals(raw_survey.index)
@@ -0,0 +1,94 @@
+import pytest
+
+import batch
+import calibration
+import instrumentation
+
+SHARED_OPTIONS = {"method": "grid", "grid_threshold_step": 0.5, "use_cache": False}
+
+
+@pytest.fixture(scope="module")
+def calibrator():
+    calibrator = batch.BatchCalibrator(max_workers=1)
+    yield calibrator
+    if calibrator._executor is not None:
+        calibrator._executor.shutdown()
+
+
+@pytest.fixture(scope="module")
+def calibration_data(survey):
+    # request body format of the dashboard
+    return [
+        {"timestamp": timestamp.strftime("%Y-%m-%dT%H:%M:%S.%f"), "acceleration": acceleration}
+        for timestamp, acceleration in zip(survey.index, survey[["x", "y", "z"]].to_dict("records"))
+    ]
+
+
+@pytest.fixture
+def metrics(monkeypatch):
+    metrics = instrumentation.StageMetrics()
+    monkeypatch.setattr(instrumentation, "metrics", metrics)
+    return metrics
+
+
+def test_items_are_calibrated_in_order(calibrator, calibration_data, metrics):
+    items = [
+        {"name": "first", "downTimeCalibrationData": calibration_data},
+        {"name": "second", "downTimeCalibrationData": calibration_data, "return_timings": True},
+    ]
+
+    response = calibrator.run(items, SHARED_OPTIONS)
+
+    assert (response["succeeded"], response["failed"]) == (2, 0)
+    assert [result["name"] for result in response["results"]] == ["first", "second"]
+    for result in response["results"]:
+        assert result["status"] == batch.SUCCEEDED
+        assert result["cache"] == "miss"
+        assert 0 <= result["result"]["calibration_score"] <= 1
+        assert result["timings"]["samples"] == len(calibration_data)
+    # the stage timings are returned only when asked for, but observed either way
+    assert "stages" not in response["results"][0]["timings"]
+    assert response["results"][1]["timings"]["stages"]
+    assert 'stage="dataframe_build"' in metrics.exposition()
+
+
+def test_failed_items_do_not_fail_the_batch(calibrator, calibration_data, metrics):
+    items = [
+        {"name": "bad input", "downTimeCalibrationData": [{"timestamp": "yesterday"}]},
+        {"name": "bad option", "downTimeCalibrationData": calibration_data, "method": "random"},
+        {"name": "good", "downTimeCalibrationData": calibration_data},
+    ]
+
+    response = calibrator.run(items, SHARED_OPTIONS)
+
+    assert (response["succeeded"], response["failed"]) == (1, 2)
+    bad_input, bad_option, good = response["results"]
+    assert bad_input["status"] == batch.FAILED
+    assert bad_input["status_code"] == 400
+    assert bad_input["error"].startswith("Bad input")
+    assert bad_input["timings"]["samples"] == 1
+    assert bad_option["status"] == batch.FAILED
+    assert bad_option["status_code"] == 400
+    assert "random" in bad_option["error"]
+    assert good["status"] == batch.SUCCEEDED
+
+    exposition = metrics.exposition()
+    assert 'mhpdt_calibration_errors_total{status_code="400",samples="1e3"} 1' in exposition
+    assert 'mhpdt_calibration_errors_total{status_code="400",samples="1e5"} 1' in exposition
+
+
+def test_progress_counts_items_and_can_cancel_the_rest(calibrator, calibration_data, metrics):
+    items = [{"name": str(i), "downTimeCalibrationData": calibration_data} for i in range(3)]
+    reports = []
+
+    def progress(completed, total):
+        reports.append((completed, total))
+        if completed == 1:
+            raise calibration.CalibrationCancelled()
+
+    with pytest.raises(calibration.CalibrationCancelled):
+        calibrator.run(items, SHARED_OPTIONS, progress=progress)
+
+    assert reports == [(1, 3)]
+    # the pool takes the next batch
+    assert calibrator.run(items[:1], SHARED_OPTIONS)["succeeded"] == 1
@@ -0,0 +1,21 @@
+import pytest
+
+import batch_calibrate
+import calibration
+
+
+@pytest.mark.parametrize("argument", [["--workers", "0"], ["--workers", "-2"], ["--workers", "two"]]
+                         + [["--grid-threshold-step", step] for step in ["0", "-0.05", "nan", "inf", "4", "step"]])
+def test_invalid_arguments_exit_with_a_usage_error(argument, capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        batch_calibrate.parse_args(["surveys", *argument])
+
+    assert exit_info.value.code == 2
+    assert argument[0] in capsys.readouterr().err
+
+
+def test_valid_arguments():
+    args = batch_calibrate.parse_args(["surveys", "--workers", "3", "--grid-threshold-step", str(calibration.MAX_GRID_THRESHOLD_STEP)])
+
+    assert args.workers == 3
+    assert args.grid_threshold_step == calibration.MAX_GRID_THRESHOLD_STEP
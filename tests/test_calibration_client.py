@@ -0,0 +1,62 @@
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+import calibration_client
+
+
+class Handler(BaseHTTPRequestHandler):
+    responses = {}
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        status_code = self.responses[self.path].pop(0)
+        body = b"Calibration failed" if status_code >= 400 else b"{}"
+        self.send_response(status_code)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def client():
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    Handler.requests.clear()
+    yield calibration_client.CalibrationClient(f"http://127.0.0.1:{server.server_port}", retry_backoff=0)
+    server.shutdown()
+    server.server_close()
+
+
+def test_failed_job_results_are_not_retried(client):
+    Handler.responses["/result"] = [500, 200]
+
+    r = client.get("result")
+
+    assert r.status_code == 500
+    assert r.text == "Calibration failed"
+    assert Handler.requests == ["/result"]
+    assert client.metrics()["GET result"]["errors"] == 1
+
+
+@pytest.mark.parametrize("status_code", [502, 503, 504])
+def test_gateway_errors_are_retried(client, status_code):
+    Handler.responses["/status"] = [status_code, status_code, 200]
+
+    r = client.get("status")
+
+    assert r.status_code == 200
+    assert Handler.requests == ["/status"] * 3
+
+
+def test_last_gateway_error_is_returned(client):
+    Handler.responses["/status"] = [503] * (calibration_client.DEFAULT_RETRIES + 1)
+
+    assert client.get("status").status_code == 503
+    assert len(Handler.requests) == calibration_client.DEFAULT_RETRIES + 1
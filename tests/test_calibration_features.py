@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("dash")
+import dash_utils  # noqa: E402
+import df_cache  # noqa: E402
+
+WINDOWS = [(None, None), (300, 2000), (1234, 1300), (5000, None), (None, 777)]
+
+
+@pytest.fixture(scope="module")
+def json_data(raw_survey):
+    key = "test-calibration-features"
+    df_cache.cache.put(key, raw_survey[["x", "y", "z"]])
+    return [key]
+
+
+def per_window_features(raw_survey, start, stop, inclusive):
+    # what the MHPDT charts computed before: the features of the window's samples alone
+    df = raw_survey[["x", "y", "z"]].round(3)
+    mask = np.ones(len(df), dtype=bool)
+    if start is not None:
+        mask &= (df.index >= start) if inclusive else (df.index > start)
+    if stop is not None:
+        mask &= (df.index <= stop) if inclusive else (df.index < stop)
+    window = dash_utils.add_features_to_df(df[mask].copy(), **dash_utils.CALIBRATION_FEATURE_PARAMS)
+    return dash_utils.utils.drop_transient_mhp_window_sized_data(window[["x", "y", "z", "mhp"]], mhp_window_size="6s")
+
+
+@pytest.mark.parametrize("inclusive", [True, False])
+@pytest.mark.parametrize("start_row, stop_row", WINDOWS)
+def test_slices_equal_the_features_of_the_window(raw_survey, json_data, start_row, stop_row, inclusive):
+    start = None if start_row is None else raw_survey.index[start_row]
+    stop = None if stop_row is None else raw_survey.index[stop_row]
+
+    # first call computes and caches the survey wide feature, the second slices the cached one
+    for _ in range(2):
+        df = dash_utils.load_calibration_features(json_data, start=start, stop=stop, inclusive=inclusive)
+
+        expected = per_window_features(raw_survey, start, stop, inclusive)
+        assert not expected.empty
+        pd.testing.assert_frame_equal(df[["x", "y", "z", "mhp"]], expected, check_freq=False, rtol=1e-12)
+
+
+def test_window_without_samples(raw_survey, json_data):
+    start = raw_survey.index[100]
+
+    assert dash_utils.load_calibration_features(json_data, start=start, stop=start, inclusive=False).empty
@@ -0,0 +1,73 @@
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import df_cache
+
+
+def survey_frame(n=100, seed=0):
+    rng = np.random.default_rng(seed)
+    # parsed surveys carry no index frequency
+    index = pd.DatetimeIndex(pd.date_range("2021-05-07", periods=n, freq="200ms").values, name="timestamp")
+    return pd.DataFrame(rng.normal(size=(n, 3)).round(3), index=index, columns=["x", "y", "z"])
+
+
+def test_put_get_round_trip(tmp_path):
+    cache = df_cache.DataFrameCache(cache_dir=str(tmp_path))
+    df = survey_frame()
+
+    cache.put("key", df)
+
+    assert cache.contains("key")
+    pd.testing.assert_frame_equal(cache.get("key"), df)
+
+
+def test_entry_holds_named_frames(tmp_path):
+    cache = df_cache.DataFrameCache(cache_dir=str(tmp_path))
+    df = survey_frame()
+    features = pd.DataFrame({"mhp": np.arange(len(df), dtype=np.float64)}, index=df.index)
+
+    cache.put("key", df)
+    cache.put("key", features, name="features")
+
+    pd.testing.assert_frame_equal(cache.get("key", name="features"), features)
+    pd.testing.assert_frame_equal(cache.get("key"), df)
+    assert not cache.contains("key", name="other")
+
+
+def test_missing_entry_is_a_miss(tmp_path):
+    cache = df_cache.DataFrameCache(cache_dir=str(tmp_path))
+
+    assert cache.get("missing") is None
+    assert not cache.contains("missing")
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = df_cache.DataFrameCache(cache_dir=str(tmp_path), max_bytes=10 ** 9)
+    for i, key in enumerate(["old", "used", "new"]):
+        cache.put(key, survey_frame(seed=i))
+        # entry mtimes order the entries, keep them apart on coarse timestamp file systems
+        os.utime(tmp_path / key, (time.time() - 100 + i, time.time() - 100 + i))
+    # reading an entry makes it the most recently used one
+    assert cache.get("old") is not None
+    cache.max_bytes = sum(f.stat().st_size for key in ("old", "new") for f in os.scandir(tmp_path / key))
+    cache.evict()
+
+    assert cache.contains("old")
+    assert not cache.contains("used")
+    assert cache.contains("new")
+
+
+def test_content_hash_identifies_contents():
+    contents = "data:text/csv;base64," + "A" * 1000
+
+    assert df_cache.content_hash(contents) == df_cache.content_hash(contents, chunk_size=7)
+    assert df_cache.content_hash(contents) != df_cache.content_hash(contents + "B")
+    assert df_cache.content_hash(contents, start=5) == df_cache.content_hash(contents[5:])
+
+
+def test_merged_key_ignores_upload_order():
+    assert df_cache.merged_key(["a", "b"]) == df_cache.merged_key(["b", "a", "a"])
+    assert df_cache.merged_key(["a", "b"]) != df_cache.merged_key(["a"])
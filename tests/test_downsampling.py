@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+
+import downsampling
+
+
+def trace(n=10_000, seed=0):
+    rng = np.random.default_rng(seed)
+    x = pd.DatetimeIndex(pd.date_range("2021-05-07", periods=n, freq="200ms"), name="timestamp")
+    return x, pd.Series(rng.normal(size=n).cumsum(), index=x)
+
+
+def test_short_traces_are_left_unchanged():
+    x, y = trace(n=100)
+
+    x_out, y_out = downsampling.downsample(x, y, max_points=100)
+
+    assert x_out is x and y_out is y
+
+
+def test_lttb_keeps_the_budget_the_end_points_and_the_spikes():
+    x, y = trace()
+    y.iloc[5000] = 1000.0
+
+    x_out, y_out = downsampling.downsample(x, y, max_points=500)
+
+    assert len(x_out) == len(y_out) == 500
+    assert x_out[0] == x[0] and x_out[-1] == x[-1]
+    assert x_out.is_monotonic_increasing
+    assert y_out.max() == 1000.0
+    pd.testing.assert_series_equal(y_out, y.loc[x_out])
+
+
+def test_minmax_keeps_bucket_extremes():
+    y = np.array([0, 5, -3, 1, 2, 9, -1, 4], dtype=np.float64)
+
+    indices = downsampling.minmax_indices(y, 4)
+
+    # buckets [0, 5, -3, 1] and [2, 9, -1, 4]:
+    np.testing.assert_array_equal(indices, [1, 2, 5, 6])
+
+
+def test_step_series_keep_every_transition():
+    states = np.zeros(10_000, dtype=np.int64)
+    states[1000:3000] = 1
+    states[7000:7001] = 1
+    x = pd.date_range("2021-05-07", periods=states.size, freq="200ms")
+
+    x_out, y_out = downsampling.downsample(x, pd.Series(states, index=x), max_points=100, step=True)
+
+    np.testing.assert_array_equal(y_out.index, x_out)
+    # the line through the kept samples is the full resolution one:
+    full = pd.Series(states, index=x)
+    np.testing.assert_array_equal(y_out.reindex(x, method="ffill").values, full.values)
+
+
+def test_step_series_with_too_many_transitions_fall_back_to_minmax():
+    states = np.tile([0, 1], 5000)
+
+    indices = downsampling.step_indices(states, 100)
+
+    assert indices.size <= 100
+    assert set(states[indices]) == {0, 1}
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+
+import features
+
+
+def test_columns_are_reused_for_the_same_parameters(survey, monkeypatch):
+    df = features.compute_features(survey[["x", "y", "z"]].copy(), ["mhp"], mhp_window_size="6s")
+    mhp = df.mhp.copy()
+
+    def fail(*args, **kwargs):
+        raise AssertionError("mhp recomputed")
+
+    monkeypatch.setitem(features.FEATURES, "mhp", features.Feature(columns=features.FEATURES["mhp"].columns, compute=fail))
+    features.compute_features(df, ["mhp"], mhp_window_size="6s")
+
+    pd.testing.assert_series_equal(df.mhp, mhp)
+
+
+def test_columns_are_recomputed_when_the_parameters_change(survey):
+    df = features.compute_features(survey[["x", "y", "z"]].copy(), ["mhp", "no_gravity"], mhp_window_size="3s", alpha=0.8)
+
+    features.compute_features(df, ["mhp", "no_gravity"], mhp_window_size="6s", alpha=0.5)
+
+    expected = features.compute_features(survey[["x", "y", "z"]].copy(), ["mhp", "no_gravity"], mhp_window_size="6s", alpha=0.5)
+    pd.testing.assert_frame_equal(df, expected)
+    assert df.attrs[features.FEATURE_PARAMS_ATTR]["mhp"] == dict(mhp_window_size="6s", alpha=0.5)
+
+
+def test_columns_of_unknown_origin_are_recomputed(survey):
+    df = survey[["x", "y", "z"]].copy()
+    df["mhp"] = 0.0
+
+    features.compute_features(df, ["mhp"])
+
+    np.testing.assert_array_equal(df.mhp.values, features.magnitude_highpass(df, window_size="3s"))
+
+
+def test_derived_frames_do_not_share_the_parameter_record(survey):
+    df = features.compute_features(survey[["x", "y", "z"]].copy(), ["mhp"], mhp_window_size="6s")
+    window = df.iloc[:1000].copy()
+
+    features.compute_features(window, ["mhp"], mhp_window_size="3s")
+
+    assert df.attrs[features.FEATURE_PARAMS_ATTR]["mhp"]["mhp_window_size"] == "6s"
+    assert window.attrs[features.FEATURE_PARAMS_ATTR]["mhp"]["mhp_window_size"] == "3s"
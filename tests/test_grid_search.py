@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+import calibration
+import hmm_tagging
+import mhpdt_cross_validation as mhpdt_cv
+
+UP_FILTER_SIZES = np.arange(0, 121, 7)
+
+
+@pytest.fixture(scope="module")
+def context(survey_features):
+    return mhpdt_cv.CalibrationContext(survey_features, hmm_tagging.generate_tagged_data(survey_features))
+
+
+@pytest.mark.parametrize("threshold", [0.1, 0.3, 1.0])
+@pytest.mark.parametrize("down_filter_size", [0, 20, 90])
+def test_up_filter_scores_equal_scoring_every_size(context, threshold, down_filter_size):
+    states = context.down_filter(context.andon_state(threshold), down_filter_size)
+
+    scores = context.up_filter_scores(states, UP_FILTER_SIZES)
+
+    expected = [context.score(threshold, up_filter_size=size, down_filter_size=down_filter_size) for size in UP_FILTER_SIZES]
+    np.testing.assert_array_equal(scores, expected)
+
+
+def test_grid_search_finds_the_best_scored_grid_point(survey_features, context):
+    thresholds = [0.1, 0.2, 0.5]
+    down_filter_sizes = [0, 30, 60]
+
+    res = mhpdt_cv.run_grid_search(survey_features, context.labels, thresholds=thresholds, up_filter_sizes=UP_FILTER_SIZES,
+                                   down_filter_sizes=down_filter_sizes)
+
+    best = min(context.score(threshold, up_filter_size=up, down_filter_size=down)
+               for threshold in thresholds for up in UP_FILTER_SIZES for down in down_filter_sizes)
+    assert res.fun == best
+    assert context.score(res.x[0], up_filter_size=res.x[1], down_filter_size=res.x[2]) == best
+
+
+@pytest.mark.parametrize("step", [0, -0.05, float("nan"), float("inf"), 1e-9, 4])
+def test_out_of_range_threshold_steps_are_rejected(step):
+    with pytest.raises(calibration.CalibrationError, match="grid_threshold_step"):
+        calibration.calibration_options({"method": "grid", "grid_threshold_step": step})
+
+
+@pytest.mark.parametrize("step", [calibration.MIN_GRID_THRESHOLD_STEP, 0.05, calibration.MAX_GRID_THRESHOLD_STEP])
+def test_threshold_steps_in_range_are_accepted(step):
+    assert calibration.calibration_options({"method": "grid", "grid_threshold_step": step})["grid_threshold_step"] == step
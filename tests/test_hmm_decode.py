@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+import hmm_tagging
+
+
+def hmmlearn_decode(ghmm, obs_seq, trans=hmm_tagging.DECODE_TRANSITION):
+    # original decode: transition reset on the fitted model and GaussianHMM.decode
+    ghmm.transmat_ = np.array([[1 - trans, trans], [trans, 1 - trans]])
+    return ghmm.decode(obs_seq)
+
+
+@pytest.fixture(scope="module")
+def obs_seq(survey_features):
+    return np.array(survey_features[["mhp"]])
+
+
+@pytest.fixture(scope="module")
+def fitted_hmm(obs_seq):
+    return hmm_tagging.fit_andon_hmm(obs_seq)[0]
+
+
+def test_decode_with_fitted_hmm_restores_the_fitted_transitions(obs_seq, fitted_hmm):
+    fitted_transmat = fitted_hmm.transmat_.copy()
+
+    logprob, state_seq = hmm_tagging.decode_with_fitted_hmm(fitted_hmm, obs_seq)
+
+    np.testing.assert_array_equal(fitted_hmm.transmat_, fitted_transmat)
+    expected_logprob, expected = hmmlearn_decode(fitted_hmm, obs_seq)
+    fitted_hmm.transmat_ = fitted_transmat
+    np.testing.assert_array_equal(state_seq, expected)
+    assert logprob == expected_logprob
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+import calibration
+import hmm_tagging
+
+
+@pytest.fixture(scope="module")
+def obs_seq(survey_features):
+    return survey_features[["mhp"]].to_numpy()
+
+
+@pytest.fixture(scope="module")
+def cold_tags(survey_features):
+    return hmm_tagging.generate_tagged_data(survey_features)
+
+
+def test_decimated_prefit_tags_agree_with_a_cold_fit(survey_features, obs_seq, cold_tags):
+    ghmm, initialisation = hmm_tagging.fit_andon_hmm(obs_seq, warm_start=True)
+
+    assert initialisation == hmm_tagging.DECIMATED
+    tags = hmm_tagging.generate_tagged_data(survey_features, ghmm=ghmm)
+    assert hmm_tagging.tagging_agreement(tags, cold_tags) > 0.99
+
+
+def test_restart_from_previous_params_agrees_with_a_cold_fit(survey_features, obs_seq, cold_tags):
+    cold_hmm, _ = hmm_tagging.fit_andon_hmm(obs_seq)
+
+    ghmm, initialisation = hmm_tagging.fit_andon_hmm(obs_seq, init_params=hmm_tagging.hmm_params(cold_hmm))
+
+    assert initialisation == hmm_tagging.PREVIOUS
+    # started at the optimum, EM converges right away
+    assert ghmm.monitor_.iter <= 2
+    tags = hmm_tagging.generate_tagged_data(survey_features, ghmm=ghmm)
+    assert hmm_tagging.tagging_agreement(tags, cold_tags) > 0.99
+
+
+def test_short_surveys_fall_back_to_a_cold_fit(obs_seq):
+    short = obs_seq[: hmm_tagging.MIN_PREFIT_OBSERVATIONS * hmm_tagging.DEFAULT_DECIMATION - 1]
+    assert hmm_tagging.decimated_prefit(short) is None
+
+    ghmm, initialisation = hmm_tagging.fit_andon_hmm(short, warm_start=True)
+    cold_hmm, _ = hmm_tagging.fit_andon_hmm(short)
+
+    assert initialisation == hmm_tagging.COLD
+    np.testing.assert_array_equal(ghmm.means_, cold_hmm.means_)
+
+
+@pytest.mark.parametrize("decimation", [0, 1])
+def test_no_prefit_without_decimation(obs_seq, decimation):
+    assert hmm_tagging.decimated_prefit(obs_seq, decimation) is None
+
+
+def test_calibration_reports_the_initialisation_used(survey):
+    options = calibration.calibration_options(
+        {"method": "grid", "grid_threshold_step": 0.5, "hmm_warm_start": True, "hmm_report_agreement": True}
+    )
+
+    report = calibration.run_calibration(survey, options)["hmm_tagging"]
+    assert report["initialisation"] == hmm_tagging.DECIMATED
+    assert report["agreement_with_cold_fit"] > 0.99
+
+    # too few decimated observations for a pre-fit: cold, and no second cold fit for the agreement
+    assert len(survey) // 200 < hmm_tagging.MIN_PREFIT_OBSERVATIONS
+    report = calibration.run_calibration(survey, {**options, "hmm_decimation": 200})["hmm_tagging"]
+    assert report["initialisation"] == hmm_tagging.COLD
+    assert "agreement_with_cold_fit" not in report
+
+
+def test_invalid_hmm_options_are_rejected(obs_seq):
+    ghmm, _ = hmm_tagging.fit_andon_hmm(obs_seq)
+    params = hmm_tagging.hmm_params(ghmm)
+    assert calibration.calibration_options({"hmm_params": params})["hmm_params"] == params
+
+    invalid = [
+        {"hmm_decimation": 0},
+        {"hmm_params": {**params, "startprob": [1.0]}},
+        {"hmm_params": {**params, "means": [0.1, 0.5]}},
+        {"hmm_params": {**params, "covars": [[0.1, 0.1], [0.2, 0.2]]}},
+        {"hmm_params": {**params, "transmat": [[0.5, 0.6], [0.5, 0.5]]}},
+        {"hmm_params": {**params, "covars": [[0.1], [-0.2]]}},
+        {"hmm_params": {key: value for key, value in params.items() if key != "means"}},
+    ]
+    for body in invalid:
+        with pytest.raises(calibration.CalibrationError):
+            calibration.calibration_options(body)
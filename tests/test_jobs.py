@@ -0,0 +1,189 @@
+import os
+import threading
+import time
+import uuid
+
+import pandas as pd
+import pytest
+
+import batch
+import calibration
+import jobs
+
+OPTIONS = {"return_timings": False}
+
+
+def wait_until_finished(store, job_id, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = store.get(job_id)
+        if job["status"] in jobs.FINISHED_STATES:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+@pytest.fixture
+def store(tmp_path):
+    return jobs.JobStore(job_dir=str(tmp_path), max_workers=1)
+
+
+@pytest.fixture
+def calibrate(monkeypatch):
+    """
+    Replaces the calibration run by the jobs, set calibrate.run to the function to run instead.
+    """
+
+    class Calibrate:
+        def run(self, progress):
+            return {"calibration_score": 1.0}
+
+    fake = Calibrate()
+
+    def run_cached_calibration(df, options, progress=None, timer=None):
+        return fake.run(progress), False
+
+    monkeypatch.setattr(calibration, "run_cached_calibration", run_cached_calibration)
+    return fake
+
+
+def test_job_succeeds_with_its_result(store, calibrate):
+    def run(progress):
+        progress("optimization", 1, 2)
+        return {"calibration_score": 0.9}
+
+    calibrate.run = run
+    job = store.submit(pd.DataFrame(), OPTIONS)
+    assert job["status"] == jobs.QUEUED
+
+    job = wait_until_finished(store, job["job_id"])
+
+    assert job["status"] == jobs.SUCCEEDED
+    assert job["result"] == {"calibration_score": 0.9}
+    assert job["stage"] == "optimization"
+    assert job["progress"] == {"completed": 1, "total": 2}
+
+
+@pytest.mark.parametrize("error, status_code", [(calibration.CalibrationError("single state"), 400), (RuntimeError("boom"), 500)])
+def test_failed_job_reports_error_and_status_code(store, calibrate, error, status_code):
+    def run(progress):
+        raise error
+
+    calibrate.run = run
+    job = wait_until_finished(store, store.submit(pd.DataFrame(), OPTIONS)["job_id"])
+
+    assert job["status"] == jobs.FAILED
+    assert job["error"] == str(error)
+    assert job["status_code"] == status_code
+
+
+def test_running_job_is_cancelled_at_its_next_progress_report(store, calibrate):
+    started = threading.Event()
+
+    def run(progress):
+        started.set()
+        for completed in range(1000):
+            progress("optimization", completed, 1000)
+            time.sleep(0.01)
+        return {"calibration_score": 1.0}
+
+    calibrate.run = run
+    job_id = store.submit(pd.DataFrame(), OPTIONS)["job_id"]
+    assert started.wait(5)
+
+    store.cancel(job_id)
+
+    assert wait_until_finished(store, job_id)["status"] == jobs.CANCELLED
+
+
+def test_queued_job_is_cancelled_before_it_starts(store, calibrate):
+    release = threading.Event()
+    calls = []
+
+    def run(progress):
+        calls.append(1)
+        release.wait(5)
+        return {"calibration_score": 1.0}
+
+    calibrate.run = run
+    first = store.submit(pd.DataFrame(), OPTIONS)
+    queued = store.submit(pd.DataFrame(), OPTIONS)
+
+    assert store.cancel(queued["job_id"])["status"] == jobs.CANCELLED
+    release.set()
+
+    assert wait_until_finished(store, first["job_id"])["status"] == jobs.SUCCEEDED
+    assert wait_until_finished(store, queued["job_id"])["status"] == jobs.CANCELLED
+    assert len(calls) == 1
+
+
+def test_unknown_and_invalid_job_ids(store):
+    assert store.get("0" * 32) is None
+    assert store.get("../etc/passwd") is None
+    assert store.cancel("0" * 32) is None
+
+
+def test_finished_jobs_expire_after_ttl(store, calibrate):
+    job_id = store.submit(pd.DataFrame(), OPTIONS)["job_id"]
+    wait_until_finished(store, job_id)
+
+    store.ttl = 0
+    time.sleep(0.01)
+    store.expire()
+
+    assert store.get(job_id) is None
+
+
+def test_job_of_a_lost_worker_process_is_reported_failed(store):
+    job = {"job_id": uuid.uuid4().hex, "status": jobs.RUNNING, "stage": "tagging", "progress": {"completed": 0, "total": 0}}
+    store._write(job)
+    path = store._path(job["job_id"])
+    os.utime(path, (time.time() - 2 * store.stale_after,) * 2)
+
+    job = store.get(job["job_id"])
+
+    assert job["status"] == jobs.FAILED
+    assert job["status_code"] == 500
+    assert store.get(job["job_id"])["status"] == jobs.FAILED
+
+
+def test_heartbeat_keeps_jobs_without_progress_reports_alive(store, calibrate):
+    store.stale_after = 0.2
+
+    def run(progress):
+        time.sleep(1)
+        return {"calibration_score": 1.0}
+
+    calibrate.run = run
+    first = store.submit(pd.DataFrame(), OPTIONS)
+    queued = store.submit(pd.DataFrame(), OPTIONS)
+    time.sleep(0.6)
+
+    assert store.get(first["job_id"])["status"] == jobs.RUNNING
+    assert store.get(queued["job_id"])["status"] == jobs.QUEUED
+    assert wait_until_finished(store, queued["job_id"])["status"] == jobs.SUCCEEDED
+
+
+def test_cancel_markers_of_removed_jobs_are_deleted(store, tmp_path):
+    orphan = tmp_path / f"{uuid.uuid4().hex}.cancel"
+    orphan.touch()
+
+    store.expire()
+
+    assert not orphan.exists()
+
+
+def test_batch_job_reports_the_calibrated_items_as_progress(store, monkeypatch):
+    def run(items, shared_options, progress=None):
+        for completed in range(1, len(items) + 1):
+            progress(completed, len(items))
+        return {"results": [], "succeeded": len(items), "failed": 0}
+
+    monkeypatch.setattr(batch.calibrator, "run", run)
+    job = wait_until_finished(store, store.submit_batch([{"name": "a"}, {"name": "b"}], OPTIONS)["job_id"])
+
+    assert job["status"] == jobs.SUCCEEDED
+    assert job["result"]["succeeded"] == 2
+    assert job["stage"] == "batch"
+    assert job["progress"] == {"completed": 2, "total": 2}
+    assert job["cache_hit"] is None
@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import utils
+
+
+def linear_acceleration_loop(data_array, alpha=0.8):
+    # original exponential smoothing loop, kept as reference
+    gravity = np.ones_like(data_array) * data_array.values[0]
+    for i in range(data_array.size)[1:]:
+        gravity[i] = alpha * gravity[i - 1] + (1 - alpha) * data_array.values[i]
+
+    gravity = pd.Series(gravity, index=data_array.index)
+
+    return data_array - gravity
+
+
+def gravity_free_magnitude_loop(df, alpha=0.8):
+    df_gravity_free = df[["x", "y", "z"]].copy()
+    for axis in ["x", "y", "z"]:
+        df_gravity_free[axis] = linear_acceleration_loop(df_gravity_free[axis].copy(), alpha=alpha)
+
+    return np.sqrt(df_gravity_free.pow(2).sum(axis=1))
+
+
+@pytest.mark.parametrize("alpha", [0.5, 0.8, 0.95])
+@pytest.mark.parametrize("axis", ["x", "y", "z"])
+def test_linear_acceleration_is_bit_identical_to_loop(raw_survey, alpha, axis):
+    expected = linear_acceleration_loop(raw_survey[axis], alpha=alpha)
+    result = utils.linear_acceleration(raw_survey[axis], alpha=alpha)
+
+    np.testing.assert_array_equal(result.values, expected.values)
+    assert result.index.equals(expected.index)
+
+
+@pytest.mark.parametrize("alpha", [0.5, 0.8, 0.95])
+def test_gravity_free_magnitude_is_bit_identical_to_loop(raw_survey, alpha):
+    expected = gravity_free_magnitude_loop(raw_survey, alpha=alpha)
+    result = utils.gravity_free_magnitude(raw_survey, alpha=alpha)
+
+    np.testing.assert_array_equal(result.values, expected.values)
+
+
+def test_linear_acceleration_removes_constant_gravity():
+    data = pd.Series(np.full(50, -0.98), index=pd.date_range("2021-05-07", periods=50, freq="200ms"))
+
+    np.testing.assert_array_equal(utils.linear_acceleration(data).values, np.zeros(50))
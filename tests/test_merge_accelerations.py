@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+
+import utils
+
+
+def accelerations(seconds, value=0.0):
+    index = pd.DatetimeIndex(pd.Timestamp("2021-05-07") + pd.to_timedelta(seconds, unit="s"), name="timestamp")
+    return pd.DataFrame({"x": value, "y": value, "z": np.arange(len(index), dtype=np.float64)}, index=index)
+
+
+def test_consecutive_exports_are_ordered_by_timestamp(survey):
+    first, second, third = survey.iloc[:4000], survey.iloc[4000:8000], survey.iloc[8000:]
+
+    merged = utils.merge_accelerations([third, first, second])
+
+    pd.testing.assert_frame_equal(merged, survey[["x", "y", "z"]], check_freq=False)
+
+
+def test_interleaved_exports_are_merged_into_one_ordered_survey():
+    even = accelerations(np.arange(0, 100, 2), value=1.0)
+    odd = accelerations(np.arange(1, 100, 2), value=2.0)
+
+    merged = utils.merge_accelerations([odd, even])
+
+    assert merged.index.is_monotonic_increasing
+    assert len(merged) == 100
+    np.testing.assert_array_equal(merged.x.values, np.tile([1.0, 2.0], 50))
+
+
+def test_the_first_sample_of_a_duplicate_timestamp_is_kept():
+    first = accelerations([0, 1, 2, 3], value=1.0)
+    overlapping = accelerations([2, 3, 4, 5], value=2.0)
+
+    merged = utils.merge_accelerations([overlapping, first])
+
+    assert list(merged.index.second) == [0, 1, 2, 3, 4, 5]
+    # the frame starting first wins, whatever the order the frames are given in
+    np.testing.assert_array_equal(merged.x.values, [1.0, 1.0, 1.0, 1.0, 2.0, 2.0])
+
+
+def test_duplicates_within_a_frame_keep_the_first_row():
+    df = accelerations([0, 1, 1, 2])
+
+    merged = utils.merge_accelerations([df])
+
+    np.testing.assert_array_equal(merged.z.values, [0.0, 1.0, 3.0])
+
+
+def test_frames_starting_together_keep_the_first_given():
+    a = accelerations([0, 1], value=1.0)
+    b = accelerations([0, 1], value=2.0)
+
+    assert (utils.merge_accelerations([a, b]).x == 1.0).all()
+    assert (utils.merge_accelerations([b, a]).x == 2.0).all()
+
+
+def test_empty_frames_are_skipped():
+    empty = accelerations([]).iloc[:0]
+    df = accelerations([0, 1, 2])
+
+    pd.testing.assert_frame_equal(utils.merge_accelerations([empty, df, empty]), df)
+
+    merged = utils.merge_accelerations([empty, empty])
+    assert merged.empty
+    assert list(merged.columns) == ["x", "y", "z"]
+    assert isinstance(merged.index, pd.DatetimeIndex)
@@ -0,0 +1,119 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import micro_filter
+import mhpdt_cross_validation as mhpdt_cv
+
+SECOND = 10 ** 9
+
+
+def up_filter_loop(df, andon_flag="andon", up_filter_size="15s"):
+    # original label slice implementation, kept as reference
+    df = df.copy()
+    if up_filter_size == "0s":
+        df[f"{andon_flag}_up_filtered"] = df[andon_flag]
+        return df
+
+    df[f"{andon_flag}_up_filtered"] = df[andon_flag]
+    df["andon_change"] = df[andon_flag].diff()
+
+    up_starts = df.loc[df["andon_change"] == 1].index
+    down_starts = df.loc[df["andon_change"] == -1.0].index
+
+    if not down_starts.empty:
+        down_starts = [ds for ds in down_starts if ds > up_starts[0]]
+    if len(up_starts) > len(down_starts):
+        up_starts = up_starts[: len(down_starts)]
+
+    for us, ds in zip(up_starts, down_starts):
+        if ds - us < pd.to_timedelta(up_filter_size):
+            df.loc[us:ds, f"{andon_flag}_up_filtered"] = 0
+
+    return df
+
+
+def down_filter_loop(df, andon_flag="andon", down_filter_size="15s"):
+    # original label slice implementation, kept as reference
+    df = df.copy()
+    if down_filter_size == "0s":
+        df[f"{andon_flag}_down_filtered"] = df[andon_flag]
+        return df
+
+    df[f"{andon_flag}_down_filtered"] = df[andon_flag]
+    df["andon_change"] = df[andon_flag].diff()
+
+    up_starts = df.loc[df["andon_change"] == 1.0].index
+    down_starts = df.loc[df["andon_change"] == -1.0].index
+
+    if not down_starts.empty:
+        up_starts = [us for us in up_starts if us > down_starts[0]]
+    if len(down_starts) > len(up_starts):
+        down_starts = down_starts[: len(up_starts)]
+
+    for ds, us in zip(down_starts, up_starts):
+        if us - ds < pd.to_timedelta(down_filter_size):
+            df.loc[ds:us, f"{andon_flag}_down_filtered"] = 1
+
+    return df
+
+
+def fill(states, filter_seconds, run_value=1, fill_value=0, interval_seconds=1):
+    states = np.asarray(states)
+    timestamps = np.arange(states.size, dtype=np.int64) * interval_seconds * SECOND
+    return micro_filter.fill_short_runs(states, timestamps, filter_seconds * SECOND, run_value=run_value, fill_value=fill_value)
+
+
+def test_short_up_run_is_filled_with_the_first_sample_of_the_next_run():
+    # the up-run at positions 2-3 lasts 2 s (until the next run starts)
+    np.testing.assert_array_equal(fill([0, 0, 1, 1, 0, 0], 3), [0, 0, 0, 0, 0, 0])
+    np.testing.assert_array_equal(fill([0, 0, 1, 1, 0, 1, 1, 1], 3), [0, 0, 0, 0, 0, 1, 1, 1])
+
+
+def test_up_runs_lasting_the_filter_size_are_kept():
+    states = [0, 0, 1, 1, 1, 0, 0]
+    np.testing.assert_array_equal(fill(states, 3), states)
+
+
+def test_runs_at_the_edges_are_kept():
+    # only runs entered and left within the series are filtered
+    states = [1, 0, 0, 0, 1]
+    np.testing.assert_array_equal(fill(states, 10), states)
+
+
+def test_short_down_run_is_filled_by_the_down_filter():
+    np.testing.assert_array_equal(fill([1, 1, 0, 1, 1], 2, run_value=0, fill_value=1), [1, 1, 1, 1, 1])
+    np.testing.assert_array_equal(fill([1, 1, 0, 0, 1], 2, run_value=0, fill_value=1), [1, 1, 0, 0, 1])
+
+
+def test_durations_follow_the_timestamps():
+    np.testing.assert_array_equal(fill([0, 1, 0, 0], 2, interval_seconds=2), [0, 1, 0, 0])
+    np.testing.assert_array_equal(fill([0, 1, 0, 0], 2, interval_seconds=1), [0, 0, 0, 0])
+
+
+def test_input_is_not_modified_and_short_series_pass_through():
+    states = np.array([0, 1, 0])
+    fill(states, 10)
+    np.testing.assert_array_equal(states, [0, 1, 0])
+    np.testing.assert_array_equal(fill([], 10), [])
+    np.testing.assert_array_equal(fill([0, 1], 10), [0, 1])
+
+
+@pytest.fixture(scope="module")
+def andon_states(survey_features):
+    df = mhpdt_cv.fast_MHPDT(survey_features, threshold=0.5)
+    df["andon"] = mhpdt_cv.andon_state_from_mhpdt(df, andon_threshold=pd.Timedelta(seconds=5))
+    return df[["andon"]]
+
+
+@pytest.mark.parametrize("filter_size", ["0s", "5s", "30s", "120s"])
+def test_filters_match_label_slice_implementation(andon_states, filter_size):
+    up_filtered = micro_filter.up_filter(andon_states, up_filter_size=filter_size)
+    np.testing.assert_array_equal(
+        up_filtered["andon_up_filtered"], up_filter_loop(andon_states, up_filter_size=filter_size)["andon_up_filtered"]
+    )
+
+    down_filtered = micro_filter.down_filter(andon_states, down_filter_size=filter_size)
+    np.testing.assert_array_equal(
+        down_filtered["andon_down_filtered"], down_filter_loop(andon_states, down_filter_size=filter_size)["andon_down_filtered"]
+    )
@@ -0,0 +1,66 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import utils
+from conftest import SURVEY_PATH
+
+
+@pytest.fixture(scope="module")
+def csv_text():
+    with open(SURVEY_PATH) as f:
+        return f.read()
+
+
+@pytest.fixture(scope="module")
+def expected(raw_survey):
+    return raw_survey[["x", "y", "z"]]
+
+
+@pytest.mark.parametrize("chunksize", [1, 7, 4096, 100000])
+def test_chunk_boundaries_do_not_change_the_frame(csv_text, expected, chunksize):
+    df = utils.read_accelerations_csv(io.StringIO(csv_text), chunksize=chunksize)
+
+    pd.testing.assert_frame_equal(df, expected, check_freq=False)
+
+
+@pytest.mark.parametrize("chunksize", [2, 3, 100000])
+def test_timestamps_without_fractional_seconds(chunksize):
+    csv = (
+        "timestamp,x,y,z\n"
+        "2021-05-07T10:29:59,0.1,0.2,-1.0\n"
+        "2021-05-07T10:29:59.500,0.1,0.2,-1.0\n"
+        "2021-05-07T10:30:00,0.1,0.2,-1.0\n"
+        "2021-05-07T10:30:01,0.1,0.2,-1.0\n"
+        "2021-05-07T10:30:01.25,0.1,0.2,-1.0\n"
+    )
+
+    df = utils.read_accelerations_csv(io.StringIO(csv), chunksize=chunksize)
+
+    expected = pd.DatetimeIndex(
+        ["2021-05-07T10:29:59", "2021-05-07T10:29:59.5", "2021-05-07T10:30:00", "2021-05-07T10:30:01", "2021-05-07T10:30:01.25"],
+        name="timestamp",
+    )
+    pd.testing.assert_index_equal(df.index, expected)
+
+
+def test_binary_buffers_are_read_like_text(csv_text, expected):
+    df = utils.read_accelerations_csv(io.BytesIO(csv_text.encode()), chunksize=1000)
+
+    pd.testing.assert_frame_equal(df, expected, check_freq=False)
+
+
+def test_header_only_csv_gives_an_empty_frame():
+    df = utils.read_accelerations_csv(io.StringIO("timestamp,x,y,z\n"))
+
+    assert df.empty
+    assert list(df.columns) == ["x", "y", "z"]
+    assert isinstance(df.index, pd.DatetimeIndex)
+
+
+def test_axis_dtype(csv_text):
+    df = utils.read_accelerations_csv(io.StringIO(csv_text), axis_dtype=np.float32)
+
+    assert (df.dtypes == np.float32).all()
@@ -0,0 +1,87 @@
+import os
+import time
+
+import pytest
+
+import calibration
+import result_cache
+
+
+@pytest.fixture
+def options():
+    return calibration.calibration_options({})
+
+
+def key(df, options):
+    return result_cache.calibration_key(df, options, mhp_window_size=calibration.MHP_WINDOW_SIZE)
+
+
+def test_key_depends_on_samples_and_result_options(survey, options):
+    reference = key(survey, options)
+
+    assert key(survey.copy(), options) == reference
+    assert key(survey.iloc[1:], options) != reference
+    changed = survey.copy()
+    changed.iloc[100, 0] += 0.001
+    assert key(changed, options) != reference
+    assert key(survey, {**options, "method": "grid"}) != reference
+    assert key(survey, {**options, "optimizer_workers": 2}) != reference
+    assert result_cache.calibration_key(survey, options, mhp_window_size="10s") != reference
+
+
+def test_key_ignores_options_not_changing_the_result(survey, options):
+    reference = key(survey, options)
+
+    assert key(survey, {**options, "use_cache": False, "return_timings": True}) == reference
+    grid = {**options, "method": "grid"}
+    assert key(survey, {**grid, "optimizer_workers": 4}) == key(survey, grid)
+
+
+def test_put_get_round_trip(tmp_path):
+    cache = result_cache.ResultCache(cache_dir=str(tmp_path))
+    result = {"model_type": "MHPDT", "calibration_score": 0.9, "hmm_params": {"means": [[0.1], [1.2]]}}
+
+    cache.put("key", result)
+
+    assert cache.get("key") == result
+    assert cache.get("other") is None
+
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = result_cache.ResultCache(cache_dir=str(tmp_path), ttl=0)
+    cache.put("key", {"calibration_score": 0.9})
+    time.sleep(0.01)
+
+    assert cache.get("key") is None
+    assert not os.path.exists(tmp_path / "key.json")
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = result_cache.ResultCache(cache_dir=str(tmp_path), max_bytes=10 ** 9)
+    for i, name in enumerate(["old", "used", "new"]):
+        cache.put(name, {"calibration_score": i})
+        os.utime(tmp_path / f"{name}.json", (time.time() - 100 + i, time.time() - 100 + i))
+    assert cache.get("old") is not None
+    cache.max_bytes = os.path.getsize(tmp_path / "old.json") + os.path.getsize(tmp_path / "new.json")
+    cache.evict()
+
+    assert cache.get("old") is not None
+    assert cache.get("used") is None
+    assert cache.get("new") is not None
+
+
+def test_run_cached_calibration_computes_once(survey, options, tmp_path, monkeypatch):
+    monkeypatch.setattr(result_cache, "cache", result_cache.ResultCache(cache_dir=str(tmp_path)))
+    calls = []
+
+    def run_calibration(df, options, progress=None, timer=None):
+        calls.append(1)
+        return {"calibration_score": 0.9}
+
+    monkeypatch.setattr(calibration, "run_calibration", run_calibration)
+
+    assert calibration.run_cached_calibration(survey, options) == ({"calibration_score": 0.9}, False)
+    assert calibration.run_cached_calibration(survey, options) == ({"calibration_score": 0.9}, True)
+    # use_cache false recomputes and refreshes the entry
+    assert calibration.run_cached_calibration(survey, {**options, "use_cache": False}) == ({"calibration_score": 0.9}, False)
+    assert len(calls) == 2